@@ -0,0 +1,62 @@
+"""Per-chunk search cost of the streaming matcher, compared with searching the whole buffer again (pexpect).
+
+Usage (with esp-test-utils installed, eg: ``pip install -e .``):
+    python benchmarks/bench_expect_stream.py [--chunk-size 1024] [--chunks 200]
+
+The cost of RegexMatcher should stay flat while the unmatched backlog grows.
+"""
+
+import argparse
+import re
+import time
+from typing import Callable, List
+
+from esptest.adapter.matcher import RegexMatcher
+
+BACKLOG_SIZES = [64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+PATTERN = re.compile(rb'wifi:connected with (\S+), aid = (\d+)')
+NOISE_LINE = b'I (12345) example: some log line which does not match the pattern, value=0x1234abcd\r\n'
+
+
+def _noise(size: int) -> bytes:
+    return (NOISE_LINE * (size // len(NOISE_LINE) + 1))[:size]
+
+
+def _full_rescan(backlog: bytes, chunk: bytes, chunks: int) -> float:
+    buffer = bytearray(backlog)
+    t0 = time.perf_counter()
+    for _ in range(chunks):
+        buffer += chunk
+        # pexpect Expecter.new_data() without searchwindowsize: copy the whole buffer and search it.
+        assert not PATTERN.search(bytes(buffer))
+    return (time.perf_counter() - t0) / chunks
+
+
+def _stream_matcher(backlog: bytes, chunk: bytes, chunks: int) -> float:
+    buffer = bytearray(backlog)
+    matcher = RegexMatcher(PATTERN)
+    assert not matcher.search(buffer)
+    t0 = time.perf_counter()
+    for _ in range(chunks):
+        buffer += chunk
+        assert not matcher.search(buffer)
+    return (time.perf_counter() - t0) / chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunk-size', type=int, default=1024, help='bytes of each new chunk')
+    parser.add_argument('--chunks', type=int, default=200, help='new chunks searched for each backlog size')
+    args = parser.parse_args()
+
+    chunk = _noise(args.chunk_size)
+    methods: List[Callable[[bytes, bytes, int], float]] = [_full_rescan, _stream_matcher]
+    print(f'{"backlog":>10} {"full rescan (us/chunk)":>24} {"stream matcher (us/chunk)":>27}')
+    for size in BACKLOG_SIZES:
+        backlog = _noise(size)
+        costs = [method(backlog, chunk, args.chunks) * 1e6 for method in methods]
+        print(f'{size // 1024:>8}KB {costs[0]:>24.1f} {costs[1]:>27.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""End-to-end benchmarks of the port / expect pipeline with a pseudo terminal (POSIX only).
+
+The DUT side writes to the pty master, SerialDut reads the slave through PortSpawn, same as tests/test_Dut.py.
+
+- throughput: sustained receive rate through SerialDut at several synthetic data rates, CPU seconds per MB
+- expect_latency: time from writing a marker line to the matched expect() returning
+- backlog: peak RSS and the cost of expect() while unmatched data keeps growing
+- debug_log: throughput at the maximum rate with debug logging of esptest enabled (written to os.devnull)
+
+Usage (with esp-test-utils installed, eg: ``pip install -e .``):
+    python benchmarks/bench_port_pipeline.py [--output report.json] [--baseline old_report.json]
+
+Compare two versions by running with ``--baseline`` pointing to the report of the old version.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import pty
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib import metadata
+from typing import Any, Dict, Generator, List, Tuple
+
+import psutil
+import serial
+
+from esptest.adapter.base_port import ExpectTimeout
+from esptest.devices.serial_dut import SerialDut
+
+NOISE_LINE = b'I (12345) example: some log line which does not match the pattern, value=0x1234abcd\r\n'
+END_MARKER = b'BENCH_END'
+# bytes per second, 0 means writing as fast as possible
+DEFAULT_RATES = [11520, 115200, 460800, 0]
+WRITE_CHUNK_SIZE = 256
+
+
+@contextmanager
+def _pty_dut(name: str) -> Generator[Tuple[SerialDut, int], None, None]:
+    master, slave = pty.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0.001)
+    dut = SerialDut(ser, name)
+    try:
+        yield dut, master
+    finally:
+        dut.close()
+        ser.close()
+        os.close(master)
+        try:
+            os.close(slave)
+        except OSError:
+            pass
+
+
+@contextmanager
+def _debug_logging() -> Generator[None, None, None]:
+    logger = logging.getLogger('esptest')
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        handler = logging.StreamHandler(devnull)
+        old_level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            yield
+        finally:
+            logger.setLevel(old_level)
+            logger.removeHandler(handler)
+
+
+def _write_at_rate(master: int, total: int, rate: int) -> None:
+    """Write noise lines to the pty master at the given bytes per second"""
+    data = (NOISE_LINE * (total // len(NOISE_LINE) + 1))[:total]
+    t0 = time.perf_counter()
+    for offset in range(0, total, WRITE_CHUNK_SIZE):
+        os.write(master, data[offset : offset + WRITE_CHUNK_SIZE])
+        if rate:
+            delay = t0 + (offset + WRITE_CHUNK_SIZE) / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    os.write(master, b'\r\n' + END_MARKER + b'\r\n')
+
+
+def bench_throughput(rate: int, duration: float) -> Dict[str, Any]:
+    total = int(rate * duration) if rate else 8 * 1024 * 1024
+    with _pty_dut('throughput') as (dut, master):
+        writer = threading.Thread(target=_write_at_rate, args=(master, total, rate), daemon=True)
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        writer.start()
+        dut.expect(END_MARKER, timeout=duration * 10 + 60)
+        elapsed = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+        writer.join()
+        metrics = dut.metrics_snapshot()
+    mb = metrics['rx_bytes'] / 1024 / 1024
+    return {
+        'target_rate': rate,
+        'bytes': metrics['rx_bytes'],
+        'seconds': elapsed,
+        'rate': metrics['rx_bytes'] / elapsed,
+        'cpu_seconds': cpu,
+        'cpu_seconds_per_mb': cpu / mb if mb else 0,
+        'reads': metrics['rx_reads'],
+        'dropped_bytes': metrics['dropped_bytes'],
+        'read_loop_max': metrics['read_loop']['max'],
+    }
+
+
+def bench_expect_latency(iterations: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    with _pty_dut('latency') as (dut, master):
+        for i in range(iterations):
+            marker = f'MARK{i:06d}'
+            t0 = time.perf_counter()
+            os.write(master, f'{marker}\r\n'.encode())
+            dut.expect(marker, timeout=5)
+            latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'mean': statistics.mean(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p90': latencies[int(len(latencies) * 0.9)],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'max': latencies[-1],
+    }
+
+
+def bench_backlog(sizes_mb: List[int]) -> List[Dict[str, Any]]:
+    """Grow the unmatched data, measure peak RSS and the cost of one failed expect() over the whole backlog"""
+    process = psutil.Process()
+    results = []
+    with _pty_dut('backlog') as (dut, master):
+        written = 0
+        for size_mb in sizes_mb:
+            peak_rss = process.memory_info().rss
+            _write_at_rate(master, size_mb * 1024 * 1024 - written, 0)
+            written = size_mb * 1024 * 1024
+            # wait until all data is received, the end marker is also counted
+            while dut.metrics_snapshot()['rx_bytes'] < written:
+                peak_rss = max(peak_rss, process.memory_info().rss)
+                time.sleep(0.01)
+            t0 = time.perf_counter()
+            try:
+                # timeout=0: search the backlog once, data is kept in the buffer
+                dut.expect(b'NEVER MATCHED PATTERN', timeout=0)
+            except ExpectTimeout:
+                pass
+            expect_seconds = time.perf_counter() - t0
+            peak_rss = max(peak_rss, process.memory_info().rss)
+            results.append({'backlog_mb': size_mb, 'peak_rss': peak_rss, 'expect_seconds': expect_seconds})
+    return results
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        version = metadata.version('esp-test-utils')
+    except metadata.PackageNotFoundError:
+        version = 'unknown'
+    return {
+        'esptest_version': version,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def _compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f'\nCompared with esptest {baseline["environment"]["esptest_version"]}:')
+    old_rates = {r['target_rate']: r for r in baseline['throughput']}
+    for result in report['throughput']:
+        old = old_rates.get(result['target_rate'])
+        if old and old['cpu_seconds_per_mb']:
+            ratio = result['cpu_seconds_per_mb'] / old['cpu_seconds_per_mb']
+            print(f'  throughput {result["target_rate"] or "max":>8}: cpu/MB x{ratio:.2f}')
+    if baseline.get('debug_log') and baseline['debug_log']['cpu_seconds_per_mb']:
+        ratio = report['debug_log']['cpu_seconds_per_mb'] / baseline['debug_log']['cpu_seconds_per_mb']
+        print(f'  debug log enabled: cpu/MB x{ratio:.2f}')
+    for key in ('p50', 'p99'):
+        ratio = report['expect_latency'][key] / baseline['expect_latency'][key]
+        print(f'  expect latency {key}: x{ratio:.2f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', type=int, nargs='+', default=DEFAULT_RATES, help='bytes/s, 0 means no limit')
+    parser.add_argument('--duration', type=float, default=2, help='seconds of each throughput test')
+    parser.add_argument('--iterations', type=int, default=200, help='expect latency iterations')
+    parser.add_argument('--backlog-mb', type=int, nargs='+', default=[1, 4, 16], help='backlog sizes in MB')
+    parser.add_argument('--output', default='bench_port_pipeline.json', help='JSON report path')
+    parser.add_argument('--baseline', help='JSON report of the old version to compare with')
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        'environment': _environment(),
+        'throughput': [],
+        'expect_latency': {},
+        'backlog': [],
+        'debug_log': {},
+    }
+    for rate in args.rates:
+        result = bench_throughput(rate, args.duration)
+        report['throughput'].append(result)
+        print(
+            f'throughput {rate or "max":>8} B/s: {result["rate"] / 1024:10.1f} KB/s, '
+            f'{result["cpu_seconds_per_mb"]:.3f} cpu s/MB, {result["reads"]} reads'
+        )
+    report['expect_latency'] = bench_expect_latency(args.iterations)
+    latency = report['expect_latency']
+    print(f'expect latency: p50 {latency["p50"] * 1000:.2f}ms, p99 {latency["p99"] * 1000:.2f}ms')
+    report['backlog'] = bench_backlog(args.backlog_mb)
+    for result in report['backlog']:
+        print(
+            f'backlog {result["backlog_mb"]:>4}MB: peak rss {result["peak_rss"] / 1024 / 1024:.1f}MB, '
+            f'expect {result["expect_seconds"] * 1000:.2f}ms'
+        )
+    with _debug_logging():
+        report['debug_log'] = bench_throughput(0, args.duration)
+    print(f'debug log enabled: {report["debug_log"]["cpu_seconds_per_mb"]:.3f} cpu s/MB')
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report saved to {args.output}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            _compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
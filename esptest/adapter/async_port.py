@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import os
+import re
+from typing import AsyncIterator, Generic, Optional, Sequence, Tuple, TypeVar, Union, overload
+
+from ..common import to_bytes, to_str
+from .base_port import LOGGER, ExpectTimeout, RawPort
+from .matcher import (
+    ExactMatcher,
+    MatchResult,
+    MultiMatcher,
+    RegexMatcher,
+    StreamMatcher,
+    to_bytes_pattern,
+    to_str_match,
+)
+from .port_buffer import RingBuffer
+from .port_log import LogRotation, PortLogWriter
+
+try:
+    from typing import Self
+except ImportError:
+    # ignore type hints: Self
+    pass
+
+T = TypeVar('T', bound=RawPort)
+
+
+class AsyncBasePort(Generic[T]):
+    """asyncio version of BasePort, many ports could be driven by one event loop without threads.
+
+    - Ports support ``fileno()`` and ``read_available()`` (eg: SerialPort on POSIX) are read by event loop readers.
+    - Other ports are polled with ``read_bytes()`` in the default executor of the event loop.
+    - Writes run in the default executor one by one, a slow port does not block the event loop.
+
+    Basic example:
+
+    ::
+
+        async def test_boot(ser: serial.Serial) -> None:
+            async with AsyncDutPort(ser, 'dut1') as dut:
+                await dut.write_line('restart')
+                await dut.expect('app_main', timeout=10)
+                async for line in dut:
+                    ...
+
+    """
+
+    PEXPECT_DEFAULT_TIMEOUT: float = 30
+    DEFAULT_READ_INTERVAL = 0.005
+    # Regex matches across data chunks should not be longer than this size
+    SEARCH_WINDOW: int = RegexMatcher.DEFAULT_WINDOW
+    # Receive buffer size and what to do if it is full: 'drop_oldest' or 'spill', the event loop could not block
+    MAX_BUFFER_SIZE: int = RingBuffer.DEFAULT_MAX_SIZE
+    BUFFER_OVERFLOW_POLICY: str = RingBuffer.DROP_OLDEST
+    # Rotate and compress the log file, rotated files are compressed in a background thread
+    LOG_ROTATION: Optional[LogRotation] = None
+
+    def __init__(
+        self,
+        port: T,
+        name: str = '',
+        log_file: str = '',
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        assert isinstance(port, RawPort)
+        self._port = port
+        self._name = name or getattr(port, 'name', '')
+        self._log_file = log_file
+        self.logger = logger or LOGGER
+        self.timeout = self.PEXPECT_DEFAULT_TIMEOUT
+        self.search_window = self.SEARCH_WINDOW
+
+        assert self.BUFFER_OVERFLOW_POLICY != RingBuffer.BLOCK, 'the event loop could not block on a full buffer'
+        self._rx_buffer = RingBuffer(self.MAX_BUFFER_SIZE, overflow_policy=self.BUFFER_OVERFLOW_POLICY)
+        # data left by the last expect, not matched yet
+        self._unmatched = bytearray()
+        self._data_event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader_fd: Optional[int] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._read_error: Optional[Exception] = None
+        self._log_writer: Optional[PortLogWriter] = None
+        # one pending timer to write the incomplete line, rescheduled when it fires if new data came
+        self._line_timer: Optional[asyncio.TimerHandle] = None
+        self._last_data_time = 0.0
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def port(self) -> T:
+        return self._port
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def log_file(self) -> str:
+        if not self._log_file:
+            return ''
+        return os.path.abspath(self._log_file)
+
+    @property
+    def read_timeout(self) -> float:
+        _timeout = getattr(self.port, 'read_timeout', None)
+        if isinstance(_timeout, float) and _timeout > 0:
+            return _timeout
+        return self.DEFAULT_READ_INTERVAL
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Bytes dropped because the receive buffer was full"""
+        return self._rx_buffer.dropped_bytes
+
+    def _support_fd_reader(self) -> bool:
+        if os.name != 'posix':
+            return False
+        return callable(getattr(self.port, 'fileno', None)) and callable(getattr(self.port, 'read_available', None))
+
+    def start(self) -> None:
+        """Start reading from the port, must be called in the event loop."""
+        if self._loop:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._data_event = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        if self.log_file:
+            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        # log file is written in the event loop, not in another thread
+        self._log_writer = PortLogWriter(
+            self.log_file, self.name, self.logger, threaded=False, rotation=self.LOG_ROTATION
+        )
+        if self._support_fd_reader():
+            self._reader_fd = self.port.fileno()  # type: ignore
+            self._loop.add_reader(self._reader_fd, self._on_readable)
+        else:
+            self._poll_task = self._loop.create_task(self._poll_port())
+
+    async def close(self) -> None:
+        if not self._loop:
+            return
+        if self._reader_fd is not None:
+            self._loop.remove_reader(self._reader_fd)
+            self._reader_fd = None
+        if self._poll_task:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        if self._line_timer:
+            self._line_timer.cancel()
+            self._line_timer = None
+        if self._log_writer:
+            self._log_writer.close()
+        self._loop = None
+
+    async def __aenter__(self) -> 'Self':
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, trace) -> None:  # type: ignore
+        await self.close()
+
+    def _handle_new_data(self, new_data: bytes) -> None:
+        assert self._data_event and self._log_writer and self._loop
+        self._rx_buffer.write(new_data)
+        self._data_event.set()
+        self._log_writer.write(new_data)
+        # write the incomplete line if there's no more data
+        self._last_data_time = self._loop.time()
+        if not self._line_timer:
+            self._line_timer = self._loop.call_later(self._log_writer.line_timeout, self._on_line_timeout)
+
+    def _on_line_timeout(self) -> None:
+        assert self._loop and self._log_writer
+        time_left = self._last_data_time + self._log_writer.line_timeout - self._loop.time()
+        if time_left > 0:
+            self._line_timer = self._loop.call_later(time_left, self._on_line_timeout)
+            return
+        self._line_timer = None
+        self._log_writer.write(b'')
+
+    def _handle_read_error(self, e: Exception) -> None:
+        assert self._data_event
+        self._read_error = e
+        self._data_event.set()
+        self.logger.exception(f'{self.name} reading stopped {type(e)}: {str(e)}')
+
+    def _on_readable(self) -> None:
+        assert self._loop
+        try:
+            # coalescing waits for more data, the event loop merges the chunks arrived before the next search
+            if getattr(self.port, 'coalesce_time', 0):
+                new_data = self.port.read_available(coalesce=False)  # type: ignore
+            else:
+                new_data = self.port.read_available()  # type: ignore
+        except Exception as e:  # pylint: disable=W0718
+            assert self._reader_fd is not None
+            self._loop.remove_reader(self._reader_fd)
+            self._reader_fd = None
+            self._handle_read_error(e)
+            return
+        if new_data:
+            self._handle_new_data(new_data)
+
+    async def _poll_port(self) -> None:
+        assert self._loop
+        while True:
+            try:
+                new_data = await self._loop.run_in_executor(None, self.port.read_bytes, self.read_timeout)
+            except Exception as e:  # pylint: disable=W0718
+                self._handle_read_error(e)
+                return
+            if new_data:
+                self._handle_new_data(new_data)
+
+    async def _expect_stream(self, matcher: StreamMatcher, timeout: Optional[float]) -> Tuple[MatchResult, bytes]:
+        """Returns the match result and all consumed data, including the data before the match"""
+        self.start()
+        assert self._loop and self._data_event
+        if timeout is None:
+            timeout = self.timeout
+        end_time = self._loop.time() + timeout
+        matcher.reset()
+        # searched data is never modified in place, re.Match objects refer to it.
+        buffer = self._unmatched + self._rx_buffer.drain()
+        while True:
+            result = matcher.search(buffer)
+            if result:
+                self._unmatched = buffer[result.end :]
+                return result, bytes(buffer[: result.end])
+            if self._read_error:
+                self._unmatched = buffer
+                raise ExpectTimeout(f'{self.name} reading stopped: {self._read_error}') from self._read_error
+            time_left = end_time - self._loop.time()
+            if time_left <= 0:
+                self._unmatched = buffer
+                raise ExpectTimeout(f'Timeout exceeded after {timeout}s, {matcher}')
+            self._data_event.clear()
+            try:
+                await asyncio.wait_for(self._data_event.wait(), time_left)
+            except asyncio.TimeoutError:
+                pass
+            buffer += self._rx_buffer.drain()
+
+    async def write(self, data: Union[str, bytes]) -> None:
+        """Write data to the port in the default executor, concurrent writes are written in the calling order."""
+        self.start()
+        assert self._loop and self._write_lock
+        async with self._write_lock:
+            await self._loop.run_in_executor(None, self.port.write_bytes, to_bytes(data))
+
+    async def write_line(self, data: Union[str, bytes], end: str = '\n') -> None:
+        await self.write(to_bytes(data, end))
+
+    @overload
+    async def expect(self, pattern: str, timeout: Optional[float] = None) -> None: ...
+    @overload
+    async def expect(self, pattern: bytes, timeout: Optional[float] = None) -> None: ...
+    @overload
+    async def expect(self, pattern: 're.Pattern[str]', timeout: Optional[float] = None) -> 're.Match[str]': ...
+    @overload
+    async def expect(self, pattern: 're.Pattern[bytes]', timeout: Optional[float] = None) -> 're.Match[bytes]': ...
+
+    async def expect(self, pattern, timeout=None):  # type: ignore
+        """Same as BasePort.expect(), the default timeout is ``self.timeout``"""
+        if isinstance(pattern, (str, bytes)):
+            await self._expect_stream(ExactMatcher(pattern), timeout)
+            return None
+        assert isinstance(pattern, re.Pattern)
+        result, _ = await self._expect_stream(RegexMatcher(to_bytes_pattern(pattern), self.search_window), timeout)
+        return to_str_match(pattern, result.match)
+
+    async def expect_any(
+        self, patterns: Sequence[Union[str, bytes, re.Pattern]], timeout: Optional[float] = None
+    ) -> Tuple[int, Union[str, bytes, re.Match]]:
+        """Same as BasePort.expect_any()"""
+        matcher = MultiMatcher(
+            [p if isinstance(p, (str, bytes)) else to_bytes_pattern(p) for p in patterns], self.search_window
+        )
+        result, _ = await self._expect_stream(matcher, timeout)
+        pattern = patterns[result.pattern_index]
+        if isinstance(pattern, (str, bytes)):
+            return result.pattern_index, pattern
+        return result.pattern_index, to_str_match(pattern, result.match)
+
+    async def readline(self, timeout: Optional[float] = None) -> str:
+        """Read one line, the line ending is removed"""
+        _, consumed = await self._expect_stream(ExactMatcher(b'\n'), timeout)
+        return to_str(consumed).rstrip('\r\n')
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iter_lines()
+
+    async def _iter_lines(self) -> AsyncIterator[str]:
+        """Iterate incoming lines until the port is closed or stopped reading"""
+        while self._loop:
+            try:
+                yield await self.readline(timeout=self.timeout)
+            except ExpectTimeout:
+                if self._read_error:
+                    return
+
+    def read_all_bytes(self, flush: bool = False) -> bytes:
+        """Return all data received but not matched yet"""
+        if flush:
+            data = bytes(self._unmatched) + self._rx_buffer.drain()
+            self._unmatched = bytearray()
+            return data
+        return bytes(self._unmatched) + self._rx_buffer.peek()
@@ -2,16 +2,35 @@ import abc
 import functools
 import logging
 import os
-import queue
 import re
+import selectors
 import threading
 import time
-from typing import AnyStr, Callable, Generic, Optional, Tuple, Type, TypeVar, Union, overload
+from concurrent.futures import Future
+from typing import Any, AnyStr, Callable, Generic, Optional, Sequence, Tuple, Type, TypeVar, Union, overload
 
 import pexpect.spawnbase
 
-from ..common import generate_timestamp, to_bytes, to_str
+from ..common import to_bytes, to_str
 from ..logger import get_logger
+from .matcher import (
+    ExactMatcher,
+    MatchResult,
+    MultiMatcher,
+    RegexMatcher,
+    StreamMatcher,
+    to_bytes_pattern,
+    to_str_match,
+)
+from .port_buffer import RingBuffer
+from .port_capture import DIRECTION_WRITE, CaptureWriter
+from .port_dispatch import DataDispatcher, PortDispatchMixin, SpawnDispatchMixin
+from .port_history import HistorySince, LineHistory, PortHistoryMixin, SpawnHistoryMixin
+from .port_hub import PortReaderHub
+from .port_log import LogRotation, PortLogWriter
+from .port_metrics import PortMetrics, PortMetricsMixin
+from .port_watch import PortWatchMixin, SpawnWatchMixin, Watcher
+from .port_writer import PortWriter, WritePacing
 
 try:
     from typing import Self
@@ -27,6 +46,19 @@ class ExpectTimeout(TimeoutError):
     """raise same ExpectTimeout rather than different Exception from different framework"""
 
 
+class ExpectCancelled(ExpectTimeout):
+    """The cancel event of the expect was set before the pattern matched"""
+
+
+class WatcherTriggered(ExpectTimeout):
+    """A watcher with fail_expect matched, the pending expect fails without waiting for the timeout"""
+
+    def __init__(self, message: str, watcher: Watcher, match: Any) -> None:
+        super().__init__(message)
+        self.watcher = watcher
+        self.match = match
+
+
 class RawPort(metaclass=abc.ABCMeta):
     """Define a minimum Dut class, the dut objects should at least support these methods
 
@@ -34,6 +66,10 @@ class RawPort(metaclass=abc.ABCMeta):
     - attribute name with type str
     - method: write_bytes() with parameters: data[bytes]
     - method: read_bytes() with parameters: timeout[float]
+
+    optional methods for event-driven reading (POSIX only), see ``PortSpawn``:
+    - method: fileno(), file descriptor which could be waited by selectors
+    - method: read_available(), non-blocking read all bytes available
     """
 
     @classmethod
@@ -56,7 +92,7 @@ class RawPort(metaclass=abc.ABCMeta):
 T = TypeVar('T', bound=RawPort)
 
 
-class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
+class PortSpawn(SpawnDispatchMixin, SpawnWatchMixin, SpawnHistoryMixin, pexpect.spawnbase.SpawnBase, Generic[T]):
     """Create a new class for pexpect with port read()/write() method.
 
     There's some reason that we can not use pyserial with pexpect.fdpexpect directly:
@@ -76,6 +112,14 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
         log_file: Optional[str] = None,
         timeout: float = 30,
         logger: logging.Logger = LOGGER,
+        max_buffer_size: int = RingBuffer.DEFAULT_MAX_SIZE,
+        event_driven: bool = False,
+        overflow_policy: str = RingBuffer.DROP_OLDEST,
+        reader_hub: Optional[PortReaderHub] = None,
+        history_size: int = 0,
+        log_rotation: Optional[LogRotation] = None,
+        capture_file: Optional[str] = None,
+        write_pacing: Optional[WritePacing] = None,
     ) -> None:
         """PortSpawn for pexpect
 
@@ -84,7 +128,23 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
             log_file (str, optional): log file path for saving serial output logs. Defaults to None.
             timeout (int, optional): pexpect default timeout. Defaults to 30.
             logger (logging.Logger): Specific port logger for logging.
+            max_buffer_size (int, optional): maximum bytes buffered before read by expect. Defaults to 16MB.
+            event_driven (bool, optional): wait on the port fileno with selectors rather than polling with read
+                timeout, if supported by the port. Defaults to False.
+            overflow_policy (str, optional): how to handle a full receive buffer, 'drop_oldest', 'block' (stop
+                reading the port until expect consumes data) or 'spill' (to a temporary file).
+                Defaults to 'drop_oldest'.
+            reader_hub (PortReaderHub, optional): read the port in the shared hub threads rather than
+                starting a new thread for this port. Defaults to None.
+            history_size (int, optional): keep this size of received data with a line index even after consumed by
+                expect, eg: LineHistory.DEFAULT_MAX_SIZE. Defaults to 0 (disabled).
+            log_rotation (LogRotation, optional): rotate and compress the log file by size or time. Defaults to None.
+            capture_file (str, optional): save all received / sent chunks with timestamps to this binary file,
+                could be read by CaptureReader. Defaults to None.
+            write_pacing (WritePacing, optional): write data in chunks with pacing or echo-based flow control, in
+                the writer thread. Defaults to None.
         """
+        # pylint: disable=too-many-arguments
         super().__init__(timeout=timeout)
         assert isinstance(port, RawPort)
         self.name = name
@@ -93,19 +153,96 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
             assert isinstance(self.port.name, str)
             self.name = self.port.name
         self.logger = logger
-        # Save serial logs to file
-        self.log_file = log_file
-
-        self._data_cache = b''
-        self._line_cache = b''
-        self._last_write_log_time = time.time()
-        # Create a new thread to read data from serial port
-        self._read_queue: queue.Queue = queue.Queue()
+        # Save serial logs to file in another thread (started only with a log file), incomplete line is cached.
+        # Minimum serial timeout is 1ms, 5 * read timeout should be enough for most lines.
+        self._log_writer = PortLogWriter(
+            log_file, self.name, logger, line_timeout=self.read_timeout * 5, rotation=log_rotation
+        )
+
+        # Received data not yet read by pexpect, handled by the overflow policy if full
+        self._rx_buffer = RingBuffer(max_buffer_size, overflow_policy=overflow_policy)
+        # Deliver received data to subscribers in their own threads
+        self._dispatcher = DataDispatcher(self.name)
+        self._capture = CaptureWriter(capture_file, self.name) if capture_file else None
+        # Write in a dedicated thread, created on the first write_async() if there's no pacing
+        self._writer: Optional[PortWriter] = None
+        self._writer_lock = threading.Lock()
+        if write_pacing:
+            self._writer = PortWriter(self._write_now, write_pacing, self.name)
+        self.history = LineHistory(history_size) if history_size > 0 else None
+        self.metrics = PortMetrics(
+            gauges={
+                'buffer_size': lambda: len(self._rx_buffer),
+                'buffer_capacity': lambda: self._rx_buffer.capacity,
+                'dropped_bytes': lambda: self._rx_buffer.dropped_bytes,
+                'spilled_bytes': lambda: self._rx_buffer.spilled_bytes,
+                'log_queue_depth': lambda: self._log_writer.queue_depth,
+                'callback_lag': lambda: max((sub.lag for sub in self._dispatcher.subscriptions), default=0),
+                'callback_dropped_chunks': lambda: sum(sub.dropped_chunks for sub in self._dispatcher.subscriptions),
+                'write_pending': lambda: self._writer.pending if self._writer else 0,
+            }
+        )
         self._read_thread_stop_event = threading.Event()
-        self._read_thread = threading.Thread(target=self._read_incoming, name=f'Spawn_{self.name}')
+        # Used to wake up the event-driven read thread from selector when stopping
+        self._wakeup_fds: Optional[Tuple[int, int]] = None
+        self._read_thread: Optional[threading.Thread] = None
+        self.reader_hub = reader_hub
+        self.event_driven = event_driven
+        # Called after reading stopped because of an exception (eg: port disconnected), in the reading thread
+        self.on_read_error: Optional[Callable[[Exception], None]] = None
+        self._start_reading()
+
+    def _start_reading(self) -> None:
+        if self.reader_hub is not None:
+            # The hub decides how to read the port
+            self.event_driven = False
+            self.reader_hub.register(self.port, self._handle_new_data, self._handle_read_exception)
+            return
+        # Create a new thread to read data from serial port
+        self.event_driven = self.event_driven and self._support_event_driven()
+        read_target = self._read_incoming
+        if self.event_driven:
+            self._wakeup_fds = os.pipe()
+            read_target = self._read_incoming_events
+        self._read_thread = threading.Thread(target=read_target, name=f'Spawn_{self.name}')
         self._read_thread.daemon = True
         self._read_thread.start()
-        self.receive_callback: Optional[Callable[[str, AnyStr], None]] = None
+
+    def _stop_reading(self) -> None:
+        self._read_thread_stop_event.set()
+        if self._wakeup_fds:
+            os.write(self._wakeup_fds[1], b'\0')
+        if self.reader_hub is not None:
+            self.reader_hub.unregister(self.port)
+        if self._read_thread and self._read_thread is not threading.current_thread():
+            self._read_thread.join()
+        self._read_thread = None
+        if self._wakeup_fds:
+            os.close(self._wakeup_fds[0])
+            os.close(self._wakeup_fds[1])
+            self._wakeup_fds = None
+
+    def replace_port(self, port: T) -> None:
+        """Read from the new port instance, eg: the serial port opened again after USB re-enumeration.
+
+        Receive buffer, history, log file, subscribers and watchers are kept, expect() could be called during this.
+        """
+        assert isinstance(port, RawPort)
+        self._stop_reading()
+        self._port = port
+        self.resume_reading()
+        self.logger.debug(f'Port {self.name} replaced by {port}')
+
+    def pause_reading(self) -> None:
+        """Stop reading the port and release the reading thread, eg: let esptool use the port"""
+        self._stop_reading()
+
+    def resume_reading(self) -> None:
+        if not self._read_thread_stop_event.is_set():
+            # still reading
+            return
+        self._read_thread_stop_event.clear()
+        self._start_reading()
 
     @property
     def port(self) -> T:
@@ -122,36 +259,89 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
 
     @property
     def data_cache(self) -> str:
-        return self._data_cache.decode('utf-8', errors='replace')
+        return self._rx_buffer.peek().decode('utf-8', errors='replace')
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Bytes dropped because nobody read the data in time and the receive buffer was full"""
+        return self._rx_buffer.dropped_bytes
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Bytes moved to the spill file because the receive buffer was full"""
+        return self._rx_buffer.spilled_bytes
+
+    @property
+    def capture_file(self) -> Optional[str]:
+        return self._capture.capture_file if self._capture else None
+
+    @property
+    def log_file(self) -> Optional[str]:
+        return self._log_writer.log_file
+
+    @log_file.setter
+    def log_file(self, new_log_file: Optional[str]) -> None:
+        self._log_writer.log_file = new_log_file
+
+    @property
+    def data_logger(self) -> logging.Logger:
+        """Logger of the received data if there's no log file, see PortLogWriter"""
+        return self._log_writer.data_logger
 
     def _write_port_log(self, data: bytes) -> None:
-        """Write serial outputs to log file"""
-        data_to_write = b''
-        if data:
-            self._line_cache += data
-            if self._line_cache.endswith(b'\n'):
-                data_to_write = self._line_cache
-                self._line_cache = b''
-            elif b'\n' in self._line_cache:
-                _index = self._line_cache.rfind(b'\n') + 1
-                data_to_write = self._line_cache[:_index]
-                self._line_cache = self._line_cache[_index:]
-        if not data_to_write and self._line_cache and time.time() - self._last_write_log_time > self.read_timeout * 5:
-            # No new data for a long time, flush line cache
-            # Default timeout is serial.timeout * 5, depends on read timeout of serial instance
-            # Minimum serial timeout is 1ms, 5 ms should be enough for most lines.
-            data_to_write = self._line_cache
-            self._line_cache = b''
-
-        if data_to_write:
-            self._last_write_log_time = time.time()
-            if self.log_file:
-                with open(self.log_file, 'ab+') as f:
-                    _time_info = f'\n[{generate_timestamp()}]\n'.encode()
-                    f.write(_time_info)
-                    f.write(data_to_write)
-            else:
-                self.logger.debug(f'[{self.name}]: {to_str(data_to_write)}')
+        """Write serial outputs to log file, the file is written by the log writer thread"""
+        self._log_writer.write(data)
+
+    def _support_event_driven(self) -> bool:
+        if os.name != 'posix':
+            self.logger.warning('Event-driven reading is only supported on POSIX, fall back to polling.')
+            return False
+        if not callable(getattr(self.port, 'fileno', None)) or not callable(getattr(self.port, 'read_available', None)):
+            self.logger.warning(f'Port {self.name} does not support event-driven reading, fall back to polling.')
+            return False
+        return True
+
+    def _handle_read_exception(self, e: Exception) -> None:
+        if self.logfile is not None or self.logfile_read is not None:
+            self._log(to_bytes(f'PortRead {type(e)}: {str(e)}'), 'read')  # type: ignore
+        self._write_port_log(to_bytes(f'SerialException: {str(e)}'))
+        self.logger.exception(f'{self.name} reading thread stopped {type(e)}: {str(e)}')
+        on_read_error = self.on_read_error
+        if callable(on_read_error) and not self._read_thread_stop_event.is_set():
+            on_read_error(e)  # pylint: disable=not-callable
+
+    def _handle_new_data(self, new_data: bytes, read_start: Optional[float] = None) -> None:
+        """Save new data and record the read loop time, from the start of the read if given.
+
+        Errors of the data pipeline are logged, they never stop reading the port.
+        """
+        try:
+            self._process_new_data(new_data, read_start)
+        except Exception as e:  # pylint: disable=W0718
+            self.logger.exception(f'{self.name} failed to handle received data {type(e)}: {str(e)}')
+
+    def _process_new_data(self, new_data: bytes, read_start: Optional[float] = None) -> None:
+        start = read_start or time.perf_counter()
+        if self._capture:
+            self._capture.write(new_data)
+        # before writing to the buffer, the woken up expect could see the failure
+        self._feed_watchers(new_data)
+        history = self.history  # could be attached / detached during measure_boot()
+        if history:
+            history.append(new_data)
+        self._rx_buffer.write(new_data)
+        if self._writer is not None:
+            self._writer.feed_echo(new_data)
+        self._dispatcher.dispatch(new_data)
+        self._write_port_log(new_data)
+        self.metrics.record_rx(len(new_data))
+        self.metrics.record_read_loop(time.perf_counter() - start)
+
+    def _raise_watch_failure(self) -> None:
+        assert self._watch_failure
+        watcher, match = self._watch_failure
+        self._watch_failure = None
+        raise WatcherTriggered(f'{self.name} watcher matched: {watcher.pattern!r}', watcher, match)
 
     def _read_incoming(self) -> None:
         """Running in a thread to read serial output and save to data cache."""
@@ -164,27 +354,63 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
                 self.logger.debug(f'Stop port {self.name} read thread.')
                 return
             new_data = b''
+            read_start = time.perf_counter()
             try:
                 # some port instances do not support changing read timeout, therefore use default timeout of the
                 new_data = self.port.read_bytes(timeout=self.read_timeout)
             except Exception as e:  # pylint: disable=W0718
-                self._log(to_bytes(f'PortRead {type(e)}: {str(e)}'), 'read')
-                self._write_port_log(to_bytes(f'SerialException: {str(e)}'))
-                self.logger.exception(f'{self.name} reading thread stopped {type(e)}: {str(e)}')
+                self._handle_read_exception(e)
                 return
             if new_data:
-                self._read_queue.put(new_data)
-                if self.receive_callback and callable(self.receive_callback):
-                    # https://stackoverflow.com/questions/69732212/pylint-self-xxx-is-not-callable
-                    self.receive_callback(self.name, new_data)  # pylint: disable=E1102
-            # the last line may be cached, to make the file more readable after adding timestamp
-            # always check need write to file or not whether there's new data
-            self._write_port_log(new_data)
+                self._handle_new_data(new_data, read_start)
+
+    def _read_incoming_events(self) -> None:
+        """Running in a thread, sleep until the port is readable, then read all available data."""
+        self.logger.debug(f'Start serial {self.name} event-driven read thread.')
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.port.fileno(), selectors.EVENT_READ)  # type: ignore
+            assert self._wakeup_fds
+            selector.register(self._wakeup_fds[0], selectors.EVENT_READ)
+            while not self._read_thread_stop_event.is_set():
+                events = selector.select()
+                if any(key.fd == self._wakeup_fds[0] for key, _ in events):
+                    continue
+                read_start = time.perf_counter()
+                try:
+                    new_data = self.port.read_available()  # type: ignore
+                except Exception as e:  # pylint: disable=W0718
+                    self._handle_read_exception(e)
+                    return
+                if new_data:
+                    self._handle_new_data(new_data, read_start)
+        self.logger.debug(f'Stop port {self.name} read thread.')
+
+    def _write_now(self, data: bytes) -> None:
+        if self._capture:
+            self._capture.write(data, DIRECTION_WRITE)
+        self.port.write_bytes(data)
 
     def write(self, data: AnyStr) -> None:
-        self.port.write_bytes(to_bytes(data))
+        """Write and wait until done, through the writer thread if it is created, to keep the order of writes"""
+        if self._writer is not None:
+            self._writer.write(to_bytes(data)).result()
+            return
+        self._write_now(to_bytes(data))
+
+    def write_async(self, data: AnyStr) -> 'Future[int]':
+        """Write in the writer thread, return immediately.
 
-    def read_nonblocking(self, size: int = 1, timeout: Optional[Union[int, float]] = None) -> bytes:
+        Returns:
+            Future[int]: done with the written size after all chunks are written
+        """
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = PortWriter(self._write_now, None, self.name)
+        return self._writer.write(to_bytes(data))
+
+    def read_nonblocking(
+        self, size: int = 1, timeout: Optional[Union[int, float]] = None, cancel: Optional[threading.Event] = None
+    ) -> bytes:
         """This method was used during expect(), reads data from serial output data cache.
 
         If the data cache is not empty, it will return immediately. Otherwise, waiting for new data.
@@ -192,6 +418,7 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
         Args:
             size (int, optional): maximum size of returning data. Defaults to 1.
             timeout (Union[int, float] | None, optional): maximum block time waiting for new data.
+            cancel (threading.Event, optional): stop waiting if set, checked after ``wakeup()``.
 
         Returns:
             bytes: new serial output data.
@@ -200,46 +427,135 @@ class PortSpawn(pexpect.spawnbase.SpawnBase, Generic[T]):
             timeout = self.timeout
         assert timeout is not None
         t0 = time.time()
-        # Read out all cache from queue first
-        while True:
-            try:
-                _new_data = self._read_queue.get(timeout=0)
-                self._data_cache += _new_data
-            except queue.Empty:
-                break
-        self.logger.debug(self._data_cache)
         # Waiting for more data until timeout if there's no data cache.
         # Any new data should be returned immediately.
-        time_left = t0 + timeout - time.time()
-        while not self._data_cache and time_left > 0:
-            try:
-                _new_data = self._read_queue.get(timeout=time_left)
-                self._data_cache += _new_data
-            except queue.Empty:
+        time_left = max(timeout, 0)
+        while not self._rx_buffer.wait(time_left):
+            if cancel is not None and cancel.is_set():
                 break
             time_left = t0 + timeout - time.time()
+            if time_left <= 0:
+                break
         # Returned data should not more than given size.
-        if self._data_cache:
-            ret_data = self._data_cache[:size]
-            self._data_cache = self._data_cache[size:]
-        else:
-            ret_data = b''
-        # _log here to be same with pexpect SpawnBase
-        self._log(ret_data, 'read')  # type: ignore
+        ret_data = self._rx_buffer.read(size)
+        # same with pexpect SpawnBase, only if the pexpect log files are set
+        if self.logfile is not None or self.logfile_read is not None:
+            self._log(ret_data, 'read')  # type: ignore
         return ret_data
 
+    def drain(self) -> bytes:
+        """Consume and return all data not matched yet, without running the expect machinery.
+
+        The pexpect buffer (data left by the last expect) is returned before the new data in the receive buffer.
+        """
+        new_data = self._rx_buffer.drain()
+        if not self._buffer.tell():
+            return new_data
+        unmatched: bytes = self._buffer.getvalue()
+        self._set_unmatched_data(bytearray())
+        return unmatched + new_data
+
+    def peek(self) -> bytes:
+        """Return all data not matched yet without consuming it"""
+        new_data = self._rx_buffer.peek()
+        if not self._buffer.tell():
+            return new_data
+        unmatched: bytes = self._buffer.getvalue()
+        return unmatched + new_data
+
+    def _set_unmatched_data(self, data: bytearray) -> None:
+        """Set pexpect buffers, they are always the same since searchwindowsize is not used"""
+        self._buffer = self.buffer_type()  # type: ignore
+        self._buffer.write(data)
+        self._before = self.buffer_type()  # type: ignore
+        self._before.write(data)
+
+    def wakeup(self) -> None:
+        """Wake up the pending expect to check its cancel event"""
+        self._rx_buffer.wakeup()
+
+    def expect_stream(
+        self, matcher: StreamMatcher, timeout: Optional[float] = -1, cancel: Optional[threading.Event] = None
+    ) -> MatchResult:
+        """Native expect loop, new data is only searched once by the stream matcher.
+
+        pexpect searches the whole buffer again for each new chunk with regex patterns, the time cost grows with the
+        size of unmatched data. This method keeps the attributes buffer / before / after / match / match_index
+        same as pexpect, so that it could be mixed with pexpect expect() methods.
+
+        Args:
+            matcher (StreamMatcher): pattern matcher
+            timeout (float, optional): -1 means using default timeout, None means no timeout. Defaults to -1.
+            cancel (threading.Event, optional): stop waiting once it is set, call ``wakeup()`` after setting it.
+
+        Raises:
+            pexpect.TIMEOUT: pattern is not matched within timeout
+            ExpectCancelled: the cancel event is set before the pattern matched
+
+        Returns:
+            MatchResult: matched result
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        start_time = time.time()
+        end_time = start_time + timeout if timeout is not None else None
+        matcher.reset()
+        # searched data is never modified in place, re.Match objects refer to it.
+        buffer = bytearray(self.buffer)
+        buffer += self.read_nonblocking(-1, timeout=0)
+        while True:
+            result = matcher.search(buffer)
+            if result:
+                self._set_unmatched_data(buffer[result.end :])
+                self.before = bytes(buffer[: result.start])
+                self.after = bytes(buffer[result.start : result.end])
+                self.match = result.match
+                self.match_index = result.pattern_index
+                self.metrics.record_expect(repr(matcher), time.time() - start_time)
+                return result
+            if self._watch_failure:
+                # the data matched by the watcher may also match the pattern
+                new_data = self.read_nonblocking(-1, timeout=0)
+                if not new_data:
+                    self._set_unmatched_data(buffer)
+                    self._raise_watch_failure()
+                buffer += new_data
+                continue
+            if cancel is not None and cancel.is_set():
+                break
+            time_left = end_time - time.time() if end_time is not None else None
+            if time_left is not None and time_left <= 0:
+                break
+            buffer += self.read_nonblocking(-1, timeout=time_left, cancel=cancel)
+        self._set_unmatched_data(buffer)
+        self.before = bytes(buffer)
+        self.after = pexpect.TIMEOUT
+        self.match = None
+        self.match_index = None
+        if cancel is not None and cancel.is_set():
+            self.metrics.record_expect(repr(matcher), time.time() - start_time, matched=False, cancelled=True)
+            raise ExpectCancelled(f'Expect cancelled after {time.time() - start_time:.3f}s, {matcher}')
+        self.metrics.record_expect(repr(matcher), time.time() - start_time, matched=False)
+        raise pexpect.TIMEOUT(f'Timeout exceeded after {timeout}s, {matcher}')
+
     def stop(self) -> None:
         """Stop and clean up"""
         self.logger.debug(f'Stopping SerialSpawn {self.name}')
+        if self._writer is not None:
+            # finish pending writes while the echo could still be received
+            self._writer.close()
         self._read_thread_stop_event.set()
-        self._read_thread.join()
-        self._read_queue.empty()
-        self.receive_callback = None
-        self._data_cache = b''
-        self._line_cache = b''
+        # wake up the read thread if it is blocked by a full receive buffer
+        self._rx_buffer.close()
+        self._stop_reading()
+        self._log_writer.close()
+        if self._capture:
+            self._capture.close()
+        self._dispatcher.close()
+        self._callback_subscription = None
 
 
-class BasePort(Generic[T]):
+class BasePort(PortDispatchMixin, PortWatchMixin, PortHistoryMixin, PortMetricsMixin, Generic[T]):
     """A class to simply port methods for all devices / shell / sockets to similar usage
 
     - Create receive thread and pexpect spawn process for data read/expect
@@ -254,6 +570,24 @@ class BasePort(Generic[T]):
     INIT_START_PEXPECT_PROC: bool = True
     DISABLE_PEXPECT_PROC: bool = False
     PEXPECT_DEFAULT_TIMEOUT: float = 30
+    # Regex matches across data chunks should not be longer than this size
+    SEARCH_WINDOW: int = RegexMatcher.DEFAULT_WINDOW
+    # Wait on port fileno rather than polling, if supported by the port (POSIX only)
+    EVENT_DRIVEN_READ: bool = False
+    # Receive buffer size and what to do if it is full: 'drop_oldest', 'block' or 'spill'
+    MAX_BUFFER_SIZE: int = RingBuffer.DEFAULT_MAX_SIZE
+    BUFFER_OVERFLOW_POLICY: str = RingBuffer.DROP_OLDEST
+    # Read the port in the shared hub threads rather than a dedicated thread for each port
+    READER_HUB: Optional[PortReaderHub] = None
+    # Received data kept for mark() / expect_since() / search_history(), disabled by default,
+    # eg: LineHistory.DEFAULT_MAX_SIZE (4MB)
+    HISTORY_SIZE: int = 0
+    # Rotate and compress the log file, eg: LogRotation(max_bytes=100 * 1024 * 1024, backup_count=10)
+    LOG_ROTATION: Optional[LogRotation] = None
+    # Save all data chunks with timestamps to binary file '<log_file>.espcap', read it with CaptureReader
+    CAPTURE_DATA: bool = False
+    # Write long data in chunks, eg: WritePacing(chunk_size=64, interval=0.01) or WritePacing(echo_timeout=1)
+    WRITE_PACING: Optional[WritePacing] = None
 
     def __init__(
         self,
@@ -270,6 +604,7 @@ class BasePort(Generic[T]):
         self.expect_timeout_exceptions = self.EXPECT_TIMEOUT_EXCEPTIONS
         self.logger = logger or LOGGER
         self.timeout = self.PEXPECT_DEFAULT_TIMEOUT
+        self.search_window = self.SEARCH_WINDOW
 
         self._pexpect_proc: Optional[PortSpawn] = None
         if self.INIT_START_PEXPECT_PROC:
@@ -309,9 +644,25 @@ class BasePort(Generic[T]):
         """Set Current dut log file."""
         if new_log_file == self._log_file:
             return
-        if self._pexpect_proc:
-            self._pexpect_proc.serial_log_file = new_log_file
         self._log_file = new_log_file
+        if self._pexpect_proc:
+            self._init_log_file()
+            self._pexpect_proc.log_file = self.log_file
+
+    @property
+    def capture_file(self) -> str:
+        """Binary capture file path, empty if CAPTURE_DATA is disabled or there's no log file"""
+        if not self.CAPTURE_DATA or not self.log_file:
+            return ''
+        return self.log_file + '.espcap'
+
+    def set_data_log_level(self, level: Union[int, str]) -> None:
+        """Verbosity of this port only, the received data is logged with debug level if there's no log file.
+
+        Eg: ``dut.set_data_log_level(logging.DEBUG)`` shows the outputs of this DUT without debug logs of others.
+        """
+        if self._pexpect_proc:
+            self._pexpect_proc.data_logger.setLevel(level)
 
     @property
     def spawn(self) -> Optional[PortSpawn]:
@@ -324,7 +675,21 @@ class BasePort(Generic[T]):
         if self._pexpect_proc:
             return
         self._init_log_file()
-        self._pexpect_proc = PortSpawn(self.port, self.name, self.log_file, self.PEXPECT_DEFAULT_TIMEOUT, self.logger)
+        self._pexpect_proc = PortSpawn(
+            self.port,
+            self.name,
+            self.log_file,
+            self.PEXPECT_DEFAULT_TIMEOUT,
+            self.logger,
+            max_buffer_size=self.MAX_BUFFER_SIZE,
+            event_driven=self.EVENT_DRIVEN_READ,
+            overflow_policy=self.BUFFER_OVERFLOW_POLICY,
+            reader_hub=self.READER_HUB,
+            history_size=self.HISTORY_SIZE,
+            log_rotation=self.LOG_ROTATION,
+            capture_file=self.capture_file,
+            write_pacing=self.WRITE_PACING,
+        )
 
     @staticmethod
     def _handle_expect_timeout(func: Callable) -> Callable:
@@ -334,6 +699,8 @@ class BasePort(Generic[T]):
         def wrap(self, *args, **kwargs):  # type: ignore
             try:
                 result = func(self, *args, **kwargs)
+            except (WatcherTriggered, ExpectCancelled):
+                raise
             except self.expect_timeout_exceptions as e:
                 raise ExpectTimeout(str(e)) from e
             return result
@@ -348,25 +715,44 @@ class BasePort(Generic[T]):
     def write_line(self, data: AnyStr, end: str = '\n') -> None:
         return self.write(to_bytes(data, end))
 
+    def write_async(self, data: AnyStr) -> 'Future[int]':
+        """Write in the port writer thread without blocking, eg: broadcast to multiple DUTs at the same time.
+
+        Writes are done in order, with WRITE_PACING if set.
+
+        Returns:
+            Future[int]: done with the written size, or the exception if writing failed
+        """
+        if self._pexpect_proc:
+            return self._pexpect_proc.write_async(data)
+        raise NotImplementedError()
+
+    def write_line_async(self, data: AnyStr, end: str = '\n') -> 'Future[int]':
+        return self.write_async(to_bytes(data, end))
+
     @_handle_expect_timeout
     def expect_exact(self, pattern: Union[str, bytes], timeout: float) -> None:
         """this is similar to expect(), but only uses plain string/bytes matching"""
         if self.spawn:
-            pexpect_pattern = to_bytes(pattern)
-            self.spawn.expect_exact(pexpect_pattern, timeout=timeout)
+            self.spawn.expect_stream(ExactMatcher(pattern), timeout=timeout)
+            return
         raise NotImplementedError()
 
     @overload
-    def expect(self, pattern: str, timeout: float = 30) -> None: ...
+    def expect(self, pattern: str, timeout: float = 30, cancel: Optional[threading.Event] = None) -> None: ...
     @overload
-    def expect(self, pattern: bytes, timeout: float = 30) -> None: ...
+    def expect(self, pattern: bytes, timeout: float = 30, cancel: Optional[threading.Event] = None) -> None: ...
     @overload
-    def expect(self, pattern: re.Pattern[str], timeout: float = 30) -> re.Match[str]: ...
+    def expect(
+        self, pattern: re.Pattern[str], timeout: float = 30, cancel: Optional[threading.Event] = None
+    ) -> re.Match[str]: ...
     @overload
-    def expect(self, pattern: re.Pattern[bytes], timeout: float = 30) -> re.Match[bytes]: ...
+    def expect(
+        self, pattern: re.Pattern[bytes], timeout: float = 30, cancel: Optional[threading.Event] = None
+    ) -> re.Match[bytes]: ...
 
     @_handle_expect_timeout
-    def expect(self, pattern, timeout=PEXPECT_DEFAULT_TIMEOUT):  # type: ignore
+    def expect(self, pattern, timeout=PEXPECT_DEFAULT_TIMEOUT, cancel=None):  # type: ignore
         """This seeks through the stream until a pattern is matched.
 
         This expect() method is different with the one in pexpect.
@@ -378,28 +764,76 @@ class BasePort(Generic[T]):
         Args:
             pattern (Union[str, bytes, re.Pattern]): pattern to match
             timeout (int, optional): seconds of waiting for new data if match failed. Defaults to 30s.
+            cancel (threading.Event, optional): raise ExpectCancelled once it is set and ``spawn.wakeup()`` is called.
 
         Returns:
             Optional[re.Match]: match result if the input pattern is re.Pattern
         """
         if self._pexpect_proc:
+            self._pexpect_proc.expect_stream(self._to_matcher(pattern), timeout=timeout, cancel=cancel)
             if isinstance(pattern, (bytes, str)):
-                self._pexpect_proc.expect_exact(pattern, timeout=timeout)
                 return None
+            return to_str_match(pattern, self._pexpect_proc.match)
+        raise NotImplementedError()
+
+    def _to_matcher(self, pattern: Union[str, bytes, re.Pattern]) -> StreamMatcher:
+        if isinstance(pattern, (bytes, str)):
+            return ExactMatcher(pattern)
+        assert isinstance(pattern, re.Pattern)
+        return RegexMatcher(to_bytes_pattern(pattern), self.search_window)
 
-            assert isinstance(pattern, re.Pattern)
-            if isinstance(pattern.pattern, str):
-                # re-compile regex pattern using bytes, with same flags
-                re_flags = pattern.flags & (re.DOTALL | re.MULTILINE | re.IGNORECASE)
-                pexpect_pattern = re.compile(to_bytes(pattern.pattern), re_flags)
-            else:
-                pexpect_pattern = pattern
-            self._pexpect_proc.expect(pexpect_pattern, timeout=timeout)
-            match = self._pexpect_proc.match
-            if isinstance(pattern.pattern, str) and isinstance(match, re.Match):
-                # convert the match result into string
-                match = pattern.match(to_str(match.group(0)))
-            return match  # type: ignore
+    @_handle_expect_timeout
+    def expect_since(
+        self, mark: HistorySince, pattern: Union[str, bytes, re.Pattern], timeout: float = PEXPECT_DEFAULT_TIMEOUT
+    ) -> Optional[re.Match]:
+        """Expect the pattern in the output received after the mark, including data already consumed by expect.
+
+        The history is searched first, then wait for new data. The expect buffer is not changed.
+
+        Args:
+            mark (HistoryMark | float | int): mark() result, monotonic timestamp or byte offset
+            pattern (Union[str, bytes, re.Pattern]): pattern to match
+            timeout (float, optional): seconds of waiting for new data if not found in history. Defaults to 30s.
+
+        Returns:
+            Optional[re.Match]: match result if the input pattern is re.Pattern
+        """
+        if not self.spawn or not self.spawn.history:
+            raise NotImplementedError()
+        result = self.spawn.expect_history(self._to_matcher(pattern), since=mark, timeout=timeout)
+        if isinstance(pattern, (bytes, str)):
+            return None
+        match: re.Match = to_str_match(pattern, result.match)
+        return match
+
+    @_handle_expect_timeout
+    def expect_any(
+        self, patterns: Sequence[Union[str, bytes, re.Pattern]], timeout: float = PEXPECT_DEFAULT_TIMEOUT
+    ) -> Tuple[int, Union[str, bytes, re.Match]]:
+        """Expect any of the patterns, the data is searched only once for all patterns.
+
+        All patterns are joined to one regex, str/bytes patterns are matched as plain text.
+        If more than one pattern could be matched, the leftmost match is returned, the pattern listed first wins
+        at the same position.
+
+        Args:
+            patterns (Sequence[Union[str, bytes, re.Pattern]]): patterns to match
+            timeout (float, optional): seconds of waiting for new data if match failed. Defaults to 30s.
+
+        Returns:
+            Tuple[int, Union[str, bytes, re.Match]]: index of the matched pattern and the match result,
+                the match result is the pattern itself for str/bytes patterns, re.Match for regex patterns.
+        """
+        if self._pexpect_proc:
+            matcher = MultiMatcher(
+                [p if isinstance(p, (str, bytes)) else to_bytes_pattern(p) for p in patterns],
+                self.search_window,
+            )
+            result = self._pexpect_proc.expect_stream(matcher, timeout=timeout)
+            pattern = patterns[result.pattern_index]
+            if isinstance(pattern, (str, bytes)):
+                return result.pattern_index, pattern
+            return result.pattern_index, to_str_match(pattern, result.match)
         raise NotImplementedError()
 
     @property
@@ -418,20 +852,14 @@ class BasePort(Generic[T]):
         Returns:
             bytes: all data read from dut
         """
-        buffer = b''
+        if not self._pexpect_proc:
+            raise NotImplementedError()
         if flush:
-            match = self.expect(re.compile(b'.*', re.DOTALL), timeout=0)
-            assert match
-            buffer = match.group(0)
-        else:
-            # flush spawn buffer
-            assert self._pexpect_proc
-            self._pexpect_proc.expect_exact(pexpect.TIMEOUT, timeout=0)
-            buffer = to_bytes(self._pexpect_proc.buffer)
-        assert isinstance(buffer, bytes)
-        return buffer
+            return self._pexpect_proc.drain()
+        return self._pexpect_proc.peek()
 
     def close(self) -> None:
+        self.stop_metrics_report()
         if self._pexpect_proc:
             self._pexpect_proc.stop()
 
@@ -1,2 +1,6 @@
+from .async_dut import AsyncDutPort  # noqa: F401
+from .boot_profile import DEFAULT_BOOT_MILESTONES, BootMilestone, BootProfile, BootReport  # noqa: F401
 from .dut_base import DutPort  # noqa: F401
+from .dut_group import DutExpectResult, DutGroup, DutGroupError, GroupExpectResult  # noqa: F401
+from .flasher import EspTool, FlashArgs, FlashError, FlashManager, FlashResult  # noqa: F401
 from .wrapper import dut_wrapper  # noqa: F401
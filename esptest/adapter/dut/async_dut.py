@@ -0,0 +1,21 @@
+from typing import Any, Union
+
+from serial import Serial
+
+from ..async_port import AsyncBasePort
+from .dut_base import DutMacMixin
+from .serial_dut import SerialPort
+
+
+class AsyncDutPort(DutMacMixin, AsyncBasePort):
+    """Add dut related methods to AsyncBasePort"""
+
+    def __init__(self, dut: Any, name: str, log_file: str = '') -> None:
+        if isinstance(dut, Serial):
+            # SerialPort is read by event loop reader on POSIX
+            dut.__class__ = SerialPort
+        super().__init__(dut, name, log_file)
+
+    async def write_line(self, data: Union[str, bytes], end: str = '\r\n') -> None:
+        """Use \\r\\n as default ending"""
+        return await super().write_line(data, end)
@@ -0,0 +1,76 @@
+import re
+import statistics
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+
+class BootMilestone(NamedTuple):
+    name: str
+    pattern: Union[str, bytes, re.Pattern]
+
+
+# ESP-IDF boot logs, the milestones not printed (eg: ROM output disabled) are reported as missing
+DEFAULT_BOOT_MILESTONES = (
+    BootMilestone('rom', re.compile(r'rst:0x[0-9a-f]+|ESP-ROM:')),
+    BootMilestone('bootloader', '2nd stage bootloader'),
+    BootMilestone('app_main', re.compile(r'main_task: Calling app_main\(\)|cpu_start: Starting scheduler')),
+    # the prompt starts a line, the line ending before it is not part of the match
+    BootMilestone('prompt', re.compile(r'(?<=\n)[\w-]*> ')),
+)
+
+
+@dataclass
+class BootProfile:
+    """Times of one boot, in seconds after the reset is released"""
+
+    # milestone name: arrival time of the line, None if not found
+    milestones: Dict[str, Optional[float]]
+
+    @property
+    def total(self) -> Optional[float]:
+        """Time of the last milestone found"""
+        found = [t for t in self.milestones.values() if t is not None]
+        return found[-1] if found else None
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        """Latency between the milestones found, eg: {'reset->rom': 0.03, 'rom->bootloader': 0.05}"""
+        ret = {}
+        last_name, last_time = 'reset', 0.0
+        for name, milestone_time in self.milestones.items():
+            if milestone_time is None:
+                continue
+            ret[f'{last_name}->{name}'] = milestone_time - last_time
+            last_name, last_time = name, milestone_time
+        return ret
+
+
+@dataclass
+class BootReport:
+    """Boot profiles of repeated runs"""
+
+    profiles: List[BootProfile] = field(default_factory=list)
+
+    @staticmethod
+    def _stats(values: Sequence[float]) -> Dict[str, float]:
+        return {
+            'count': len(values),
+            'min': min(values),
+            'mean': statistics.mean(values),
+            'median': statistics.median(values),
+            'max': max(values),
+            'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+        }
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Statistics of each milestone, stage and the total time, over the runs they were found"""
+        values: Dict[str, List[float]] = {}
+        for profile in self.profiles:
+            for name, milestone_time in profile.milestones.items():
+                if milestone_time is not None:
+                    values.setdefault(name, []).append(milestone_time)
+            for name, stage_time in profile.stages.items():
+                values.setdefault(name, []).append(stage_time)
+            if profile.total is not None:
+                values.setdefault('total', []).append(profile.total)
+        return {name: self._stats(v) for name, v in values.items()}
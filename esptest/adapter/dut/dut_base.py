@@ -1,7 +1,13 @@
-from typing import Any, AnyStr, Dict, Union
+import time
+from typing import Any, AnyStr, Dict, Optional, Sequence, Tuple, Union
 
+import pexpect
+
+from ...common import to_bytes
 from ...network.mac import mac_offset
 from ..base_port import BasePort
+from ..port_history import LineHistory
+from .boot_profile import DEFAULT_BOOT_MILESTONES, BootMilestone, BootProfile, BootReport
 
 
 class DutMacMixin:
@@ -62,6 +68,9 @@ class DutMacMixin:
 class DutPort(DutMacMixin, BasePort):
     """Add dut related methods to Port"""
 
+    # History kept only during measure_boot() if HISTORY_SIZE is 0
+    BOOT_HISTORY_SIZE: int = 256 * 1024
+
     def __init__(self, dut: Any, name: str, log_file: str = '') -> None:
         super().__init__(dut, name, log_file)
 
@@ -99,6 +108,95 @@ class DutPort(DutMacMixin, BasePort):
     def hard_reset(self) -> None:
         raise NotImplementedError()
 
+    def _search_milestones(
+        self,
+        milestones: Sequence[BootMilestone],
+        since: int,
+        found: Dict[str, Tuple[int, Optional[float]]],
+        scanned: Dict[str, int],
+    ) -> None:
+        """Search the milestones not found yet in order, a missing one does not stop searching the next ones.
+
+        ``found`` is updated with milestone name: (end offset of the match, receive time of the line where the
+        milestone completes), the time is taken immediately before the history is trimmed.
+        ``scanned`` is the history offset each missing milestone has been searched to, only the data after it
+        (with a window for the matches across chunks) is searched again.
+        """
+        assert self.spawn and self.spawn.history
+        history = self.spawn.history
+        offset = since
+        for milestone in milestones:
+            if milestone.name in found:
+                offset = found[milestone.name][0]
+                continue
+            pattern = milestone.pattern
+            window = len(to_bytes(pattern)) if isinstance(pattern, (str, bytes)) else self.search_window
+            start = max(offset, scanned.get(milestone.name, offset) - window, history.start_offset)
+            scanned[milestone.name] = history.end_offset
+            try:
+                result = self.spawn.expect_history(self._to_matcher(pattern), start, timeout=0)
+            except pexpect.TIMEOUT:
+                continue
+            found[milestone.name] = (result.end, history.time_of(result.end - 1))
+            # the milestones are in order, search the next one after this
+            offset = result.end
+
+    def _profile_boot(self, milestones: Sequence[BootMilestone], timeout: float) -> BootProfile:
+        assert self.spawn and self.spawn.history
+        history = self.spawn.history
+        since = self.mark().offset
+        self.hard_reset()
+        reset_time = time.monotonic()
+        deadline = reset_time + timeout
+        found: Dict[str, Tuple[int, Optional[float]]] = {}
+        scanned: Dict[str, int] = {}
+        while True:
+            end = history.end_offset
+            self._search_milestones(milestones, since, found, scanned)
+            time_left = deadline - time.monotonic()
+            if len(found) == len(milestones) or time_left <= 0:
+                break
+            history.wait(end, time_left)
+        times: Dict[str, Optional[float]] = {}
+        for milestone in milestones:
+            arrival = found[milestone.name][1] if milestone.name in found else None
+            if arrival is None:
+                self.logger.warning(f'Boot milestone {milestone.name} not found in {timeout}s')
+            times[milestone.name] = max(arrival - reset_time, 0) if arrival is not None else None
+        return BootProfile(times)
+
+    def measure_boot(
+        self, milestones: Optional[Sequence[BootMilestone]] = None, runs: int = 1, timeout: float = 10
+    ) -> BootReport:
+        """Hard reset the DUT and time the boot log milestones from the session history.
+
+        The times are receive times of the lines where the milestones complete, relative to the reset released.
+        The missing milestones are None, the later ones are still searched until the timeout.
+        The expect buffer is not changed, flush it if the boot log should not be matched by expect later.
+        If the history is disabled (``HISTORY_SIZE``), one of ``BOOT_HISTORY_SIZE`` is kept during the measurement.
+
+        Args:
+            milestones (Sequence[BootMilestone], optional): in boot order. Defaults to DEFAULT_BOOT_MILESTONES.
+            runs (int, optional): boot times to measure. Defaults to 1.
+            timeout (float, optional): seconds to wait for the milestones of each boot. Defaults to 10.
+
+        Returns:
+            BootReport: profile of each run, ``summary()`` for the statistics
+        """
+        assert self.spawn, 'Port is not started'
+        milestones = milestones or DEFAULT_BOOT_MILESTONES
+        report = BootReport()
+        temporary_history = self.spawn.history is None
+        if temporary_history:
+            self.spawn.history = LineHistory(self.BOOT_HISTORY_SIZE)
+        try:
+            for _ in range(runs):
+                report.profiles.append(self._profile_boot(milestones, timeout))
+        finally:
+            if temporary_history:
+                self.spawn.history = None
+        return report
+
     # EspTool Specific
     def flash(self, bin_path: str = '') -> None:
         raise NotImplementedError()
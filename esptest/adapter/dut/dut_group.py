@@ -0,0 +1,169 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, AnyStr, Iterator, List, Optional, Sequence, Union
+
+from ...logger import get_logger
+from ..base_port import ExpectCancelled, ExpectTimeout
+from .dut_base import DutPort
+from .wrapper import dut_wrapper
+
+logger = get_logger('dut_group')
+
+Pattern = Union[str, bytes, re.Pattern]
+
+
+class DutGroupError(ExpectTimeout):
+    """Not enough DUTs matched the pattern before the deadline"""
+
+    def __init__(self, message: str, results: 'GroupExpectResult') -> None:
+        super().__init__(message)
+        self.results = results
+
+
+@dataclass
+class DutExpectResult:
+    name: str
+    success: bool = False
+    # expect() result, re.Match for regex patterns
+    match: Any = None
+    error: Optional[BaseException] = None
+    # stopped waiting because the group result was already decided
+    cancelled: bool = False
+    duration: float = 0
+
+
+class GroupExpectResult(List[DutExpectResult]):
+    """Results in the order of the DUTs in the group"""
+
+    @property
+    def succeeded(self) -> List[str]:
+        return [r.name for r in self if r.success]
+
+    @property
+    def failed(self) -> List[str]:
+        return [r.name for r in self if not r.success]
+
+    def __getitem__(self, key: Any) -> Any:
+        if isinstance(key, str):
+            for result in self:
+                if result.name == key:
+                    return result
+            raise KeyError(key)
+        return super().__getitem__(key)
+
+
+class DutGroup:
+    """Write to and expect on many DUTs concurrently, one slow DUT does not delay the others.
+
+    Example:
+        group = DutGroup([dut1, dut2, dut3])
+        group.write_line('restart')
+        group.expect('app_main', timeout=10)
+        results = group.expect(re.compile(r'IP: (\\S+)'), timeout=30, min_success=2, raise_on_error=False)
+    """
+
+    def __init__(self, duts: Sequence[Any]) -> None:
+        """Create the group, the DUTs which are not DutPort are wrapped by ``dut_wrapper``"""
+        self.duts: List[DutPort] = [dut if isinstance(dut, DutPort) else dut_wrapper(dut) for dut in duts]
+
+    def __len__(self) -> int:
+        return len(self.duts)
+
+    def __iter__(self) -> Iterator[DutPort]:
+        return iter(self.duts)
+
+    def __getitem__(self, key: Union[int, str]) -> DutPort:
+        if isinstance(key, str):
+            for dut in self.duts:
+                if dut.name == key:
+                    return dut
+            raise KeyError(key)
+        return self.duts[key]
+
+    def write(self, data: AnyStr, timeout: Optional[float] = None) -> None:
+        """Write the same data to all DUTs at the same time, wait until all are written"""
+        futures = [dut.write_async(data) for dut in self.duts]
+        for future in futures:
+            future.result(timeout)
+
+    def write_line(self, data: AnyStr, end: str = '\r\n', timeout: Optional[float] = None) -> None:
+        futures = [dut.write_line_async(data, end) for dut in self.duts]
+        for future in futures:
+            future.result(timeout)
+
+    @staticmethod
+    def _expect_one(dut: DutPort, pattern: Pattern, deadline: float, cancel: threading.Event) -> DutExpectResult:
+        result = DutExpectResult(dut.name)
+        t0 = time.monotonic()
+        try:
+            result.match = dut.expect(pattern, timeout=max(deadline - t0, 0), cancel=cancel)
+            result.success = True
+        except ExpectCancelled:
+            result.cancelled = True
+        except Exception as e:  # pylint: disable=W0718
+            result.error = e
+        result.duration = time.monotonic() - t0
+        return result
+
+    def _cancel(self, cancel: threading.Event) -> None:
+        cancel.set()
+        for dut in self.duts:
+            if dut.spawn:
+                dut.spawn.wakeup()
+
+    def expect(
+        self,
+        pattern: Union[Pattern, Sequence[Pattern]],
+        timeout: float = 30,
+        min_success: Optional[int] = None,
+        raise_on_error: bool = True,
+    ) -> GroupExpectResult:
+        """Expect on all DUTs in parallel with a single deadline
+
+        Args:
+            pattern (Union[Pattern, Sequence[Pattern]]): pattern for all DUTs, or a list with one for each DUT.
+            timeout (float, optional): seconds from now to the deadline of all DUTs. Defaults to 30.
+            min_success (int, optional): succeed once this many DUTs matched, the others stop waiting and keep
+                the unmatched data. Defaults to all DUTs.
+            raise_on_error (bool, optional): raise DutGroupError if less than min_success DUTs matched.
+
+        Returns:
+            GroupExpectResult: results in the order of the DUTs
+        """
+        patterns: List[Pattern] = (
+            list(pattern) if isinstance(pattern, (list, tuple)) else [pattern] * len(self.duts)  # type: ignore
+        )
+        assert len(patterns) == len(self.duts)
+        min_success = len(self.duts) if min_success is None else min_success
+        assert 0 <= min_success <= len(self.duts)
+        results = GroupExpectResult()
+        if not self.duts:
+            return results
+        deadline = time.monotonic() + timeout
+        cancel = threading.Event()
+        with ThreadPoolExecutor(len(self.duts), thread_name_prefix='DutGroup') as executor:
+            futures = [
+                executor.submit(self._expect_one, dut, p, deadline, cancel) for dut, p in zip(self.duts, patterns)
+            ]
+            pending = set(futures)
+            success, failure = 0, 0
+            while pending and not cancel.is_set():
+                done, pending = wait(pending, return_when='FIRST_COMPLETED')
+                for future in done:
+                    if future.result().success:
+                        success += 1
+                    else:
+                        failure += 1
+                # decided: enough succeeded, or too many failed
+                if success >= min_success or failure > len(self.duts) - min_success:
+                    self._cancel(cancel)
+            results.extend(future.result() for future in futures)
+        if len(results.succeeded) < min_success:
+            message = f'{len(results.succeeded)}/{len(self.duts)} DUTs matched {pattern!r}, failed: {results.failed}'
+            logger.warning(message)
+            if raise_on_error:
+                raise DutGroupError(message, results)
+        return results
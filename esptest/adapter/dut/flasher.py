@@ -0,0 +1,251 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from ...logger import get_logger
+
+logger = get_logger('flasher')
+
+FLASHER_ARGS_FILE = 'flasher_args.json'
+
+
+class FlashError(Exception):
+    """esptool failed"""
+
+
+@dataclass
+class FlashResult:
+    name: str
+    device: str = ''
+    success: bool = False
+    # baud rate of the last try
+    baud: int = 0
+    duration: float = 0
+    output: str = ''
+
+    def raise_for_error(self) -> None:
+        if not self.success:
+            raise FlashError(f'{self.name} failed to flash {self.device}: {self.output[-1000:]}')
+
+
+@dataclass
+class FlashArgs:
+    """Arguments from the ``flasher_args.json`` of an ESP-IDF build directory"""
+
+    # (offset, file path)
+    files: List[Tuple[int, str]]
+    chip: str = 'auto'
+    # eg: --flash_mode dio --flash_size 2MB
+    write_flash_args: List[str] = field(default_factory=list)
+    # eg: --before default_reset --after hard_reset
+    esptool_args: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_build_dir(cls, build_dir: str) -> 'FlashArgs':
+        with open(os.path.join(build_dir, FLASHER_ARGS_FILE), encoding='utf-8') as f:
+            data = json.load(f)
+        files = sorted((int(offset, 0), os.path.join(build_dir, path)) for offset, path in data['flash_files'].items())
+        extra = data.get('extra_esptool_args', {})
+        esptool_args = []
+        for option in ('before', 'after'):
+            if extra.get(option):
+                esptool_args += [f'--{option}', extra[option]]
+        if extra.get('stub') is False:
+            esptool_args.append('--no-stub')
+        return cls(files, extra.get('chip', 'auto'), list(data.get('write_flash_args', [])), esptool_args)
+
+    @classmethod
+    def from_path(cls, path: str, chip: str = 'auto') -> 'FlashArgs':
+        """Build directory with ``flasher_args.json``, or a merged binary (``esptool merge_bin``) flashed at 0x0"""
+        if os.path.isfile(path):
+            return cls([(0, path)], chip)
+        return cls.from_build_dir(path)
+
+
+class EspTool:
+    """Run esptool in subprocesses, try from the highest baud rate and remember the stable one for each port.
+
+    A subprocess is used rather than the esptool library: esptool keeps global states, it's not safe to flash
+    multiple ports in threads of one process. Lower baud rates are only tried if esptool failed to connect or the
+    serial data was corrupted, other errors (eg: wrong file, chip mismatch, timeout) are returned at once.
+    """
+
+    DEFAULT_BAUDS = (2000000, 921600, 460800, 115200)
+    DEFAULT_TIMEOUT = 600
+    # esptool errors which may be fixed by a lower baud rate
+    BAUD_ERRORS = re.compile(
+        r'Failed to connect|Invalid head of packet|Timed out waiting for packet|No serial data received'
+        r'|Serial data stream stopped|Possible serial noise|Packet content transfer stopped',
+        re.IGNORECASE,
+    )
+
+    def __init__(
+        self,
+        command: Optional[Sequence[str]] = None,
+        bauds: Sequence[int] = DEFAULT_BAUDS,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        """Create the esptool runner
+
+        Args:
+            command (Sequence[str], optional): esptool command. Defaults to ``python -m esptool``.
+            bauds (Sequence[int], optional): baud rates to try in order. Defaults to 2M, 921600, 460800, 115200.
+            timeout (float, optional): timeout of each esptool run in seconds. Defaults to 600.
+        """
+        self.command = list(command) if command else [sys.executable, '-m', 'esptool']
+        self.bauds = list(bauds)
+        self.timeout = timeout
+        # device: index of the highest stable baud rate
+        self._stable_bauds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def stable_baud(self, device: str) -> int:
+        with self._lock:
+            return self.bauds[self._stable_bauds.get(device, 0)]
+
+    def _run(self, args: Sequence[str]) -> Tuple[bool, str]:
+        try:
+            proc = subprocess.run(
+                self.command + list(args),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=self.timeout,
+                check=False,
+            )
+        except subprocess.TimeoutExpired as e:
+            output = e.stdout.decode(errors='replace') if e.stdout else ''
+            return False, output + f'\nTimeout after {self.timeout}s'
+        return proc.returncode == 0, proc.stdout.decode(errors='replace')
+
+    def run(
+        self, name: str, device: str, chip: str, args: Sequence[str], esptool_args: Sequence[str] = ()
+    ) -> FlashResult:
+        """Run the esptool command, retry with lower baud rates if failed by the connection"""
+        result = FlashResult(name, device)
+        t0 = time.perf_counter()
+        with self._lock:
+            start = self._stable_bauds.get(device, 0)
+        for index in range(start, len(self.bauds)):
+            result.baud = self.bauds[index]
+            command = ['--chip', chip, '--port', device, '--baud', str(result.baud), *esptool_args, *args]
+            logger.debug(f'{name} esptool {" ".join(command)}')
+            result.success, result.output = self._run(command)
+            if result.success:
+                with self._lock:
+                    self._stable_bauds[device] = index
+                break
+            logger.warning(f'{name} esptool failed at baud {result.baud}: {result.output[-200:]}')
+            if not self.BAUD_ERRORS.search(result.output):
+                # not related to the baud rate, keep the stable one
+                break
+        result.duration = time.perf_counter() - t0
+        return result
+
+    def write_flash(self, name: str, device: str, flash_args: FlashArgs) -> FlashResult:
+        """Write files with compressed upload"""
+        args = ['write_flash', '-z', *flash_args.write_flash_args]
+        for offset, path in flash_args.files:
+            args += [hex(offset), path]
+        return self.run(name, device, flash_args.chip, args, flash_args.esptool_args)
+
+    def read_flash(
+        self, name: str, device: str, flash_range: Tuple[int, int], output: str, chip: str = 'auto'
+    ) -> FlashResult:
+        """Read the flash (offset, size) to the output file"""
+        offset, size = flash_range
+        return self.run(name, device, chip, ['read_flash', hex(offset), hex(size), output])
+
+
+DEFAULT_ESPTOOL = EspTool()
+
+
+def flash_dut(dut: Any, flash_args: FlashArgs, esptool: Optional[EspTool] = None) -> FlashResult:
+    """Flash the DUT, the serial port is released from the DUT during flashing.
+
+    Args:
+        dut (SerialDutMixin): DUT supports ``release_port()``
+        flash_args (FlashArgs): files and esptool arguments
+        esptool (EspTool, optional): Defaults to DEFAULT_ESPTOOL.
+    """
+    esptool = esptool or DEFAULT_ESPTOOL
+    try:
+        with dut.release_port() as device:
+            result = esptool.write_flash(dut.name, device, flash_args)
+    except Exception as e:  # pylint: disable=W0718
+        return FlashResult(dut.name, success=False, output=f'{type(e).__name__}: {str(e)}')
+    if result.success:
+        logger.info(f'{dut.name} flashed {device} at baud {result.baud} in {result.duration:.1f}s')
+    return result
+
+
+class FlashManager:
+    """Flash many DUTs concurrently with a bounded worker pool
+
+    Example:
+        results = FlashManager(max_workers=16).flash(duts, 'build')
+        results = FlashManager().flash(duts, {'dut1': 'build_a', 'dut2': 'merged.bin'})
+    """
+
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, esptool: Optional[EspTool] = None) -> None:
+        self.max_workers = max_workers
+        self.esptool = esptool or DEFAULT_ESPTOOL
+
+    def _flash_one(self, dut: Any, path: str) -> FlashResult:
+        if not path:
+            try:
+                path = dut.bin_path
+            except NotImplementedError:
+                return FlashResult(dut.name, output=f'No firmware path for {dut.name}, and it has no bin_path')
+        try:
+            flash_args = FlashArgs.from_path(path)
+        except (OSError, ValueError, KeyError) as e:
+            return FlashResult(dut.name, output=f'Invalid firmware path {path}: {type(e).__name__}: {str(e)}')
+        return flash_dut(dut, flash_args, self.esptool)
+
+    def flash(
+        self,
+        duts: Sequence[Any],
+        bin_path: Union[str, Sequence[str], Mapping[str, str]] = '',
+        raise_on_error: bool = True,
+    ) -> List[FlashResult]:
+        """Flash the firmware to the DUTs
+
+        A firmware path is an ESP-IDF build directory with ``flasher_args.json``, or a merged binary flashed at 0x0.
+
+        Args:
+            duts (Sequence[SerialDutMixin]): DUTs to flash.
+            bin_path (Union[str, Sequence[str], Mapping[str, str]], optional): firmware path for all DUTs, one for
+                each DUT, or a mapping of DUT name to firmware path. Defaults to ``dut.bin_path``, a DUT without
+                a firmware path fails.
+            raise_on_error (bool, optional): raise FlashError if any DUT failed. Defaults to True.
+
+        Returns:
+            List[FlashResult]: results in the order of duts
+        """
+        if isinstance(bin_path, str):
+            bin_paths = [bin_path] * len(duts)
+        elif isinstance(bin_path, Mapping):
+            bin_paths = [bin_path.get(dut.name, '') for dut in duts]
+        else:
+            bin_paths = list(bin_path)
+        assert len(bin_paths) == len(duts)
+        if not duts:
+            return []
+        with ThreadPoolExecutor(min(self.max_workers, len(duts)), thread_name_prefix='Flash') as executor:
+            futures = [executor.submit(self._flash_one, dut, path) for dut, path in zip(duts, bin_paths)]
+            results = [future.result() for future in futures]
+        failed = [r.name for r in results if not r.success]
+        if failed:
+            logger.error(f'Failed to flash {failed}')
+            if raise_on_error:
+                raise FlashError(f'Failed to flash {failed}')
+        return results
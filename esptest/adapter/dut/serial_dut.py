@@ -1,13 +1,21 @@
+import contextlib
+import os
+import selectors
+import threading
 import time
-from typing import TYPE_CHECKING, Any, AnyStr, Dict, Optional, TypeAlias
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AnyStr, Dict, Generator, Optional, Tuple, TypeAlias, Union
 
 import serial
 from serial import Serial
 
 from ...common import to_bytes
 from ...logger import get_logger
+from ..port_metrics import LatencyHistogram
+from .flasher import DEFAULT_ESPTOOL, EspTool, FlashArgs, FlashError, flash_dut
 
 if TYPE_CHECKING:
+    from ...devices.port_inventory import SerialPortInventory
     from .dut_base import DutPort
 
     MixinBase: TypeAlias = 'DutPort'
@@ -17,21 +25,141 @@ else:
 logger = get_logger('dut')
 
 
+@dataclass
+class SerialReadStats:
+    """Counters of SerialPort reading iterations"""
+
+    reads: int = 0
+    read_bytes: int = 0
+    max_chunk_size: int = 0
+    # reads returned max_read_size bytes, the input buffer may have more data
+    capped_reads: int = 0
+    # extra reads merged into one chunk during the coalescing window
+    coalesced_reads: int = 0
+
+    @property
+    def average_chunk_size(self) -> float:
+        return self.read_bytes / self.reads if self.reads else 0
+
+
 class SerialPort(Serial):
-    """Add RawPort methods to serial.Serial"""
+    """Add RawPort methods to serial.Serial
+
+    Attributes could be changed for each port instance:
+        - max_read_size: maximum bytes returned by one read, a burst bigger than ``MIN_READ_SIZE`` is read at once.
+        - coalesce_time: after the first bytes, keep reading for this time and merge small bursts into one chunk.
+    """
+
+    MIN_READ_SIZE = 1024
+    max_read_size: int = 64 * 1024
+    coalesce_time: float = 0
+    # serial.Serial instances are converted to this class without calling __init__(), created on first use
+    _read_stats: Optional[SerialReadStats] = None
+    # selector of wait_readable() and the fd registered to it
+    _selector: Optional[selectors.BaseSelector] = None
+    _selector_fd: Optional[int] = None
 
     @property
     def read_timeout(self) -> float:
         # For PortSpawn
         return super().timeout  # type: ignore
 
+    @property
+    def read_stats(self) -> SerialReadStats:
+        if self._read_stats is None:
+            self._read_stats = SerialReadStats()
+        return self._read_stats
+
+    def reset_read_stats(self) -> None:
+        self._read_stats = SerialReadStats()
+
+    def _read_sized(self, min_size: int = MIN_READ_SIZE) -> bytes:
+        """read the bytes in waiting (at least min_size, may block for serial timeout), no more than max_read_size"""
+        return super().read(min(max(self.in_waiting, min_size), self.max_read_size))  # type: ignore
+
+    def _coalesce(self, data: bytes) -> bytes:
+        if not self.coalesce_time or not data:
+            return data
+        chunks = [data]
+        size = len(data)
+        end_time = time.perf_counter() + self.coalesce_time
+        while size < self.max_read_size:
+            time_left = end_time - time.perf_counter()
+            if time_left <= 0 or not self.wait_readable(time_left):
+                break
+            new_data = super().read(min(self.in_waiting or 1, self.max_read_size - size))
+            if not new_data:
+                break
+            chunks.append(new_data)
+            size += len(new_data)
+            self.read_stats.coalesced_reads += 1
+        return b''.join(chunks)
+
+    def _update_read_stats(self, data: bytes) -> None:
+        stats = self.read_stats
+        stats.reads += 1
+        stats.read_bytes += len(data)
+        stats.max_chunk_size = max(stats.max_chunk_size, len(data))
+        if len(data) >= self.max_read_size:
+            stats.capped_reads += 1
+
     def read_bytes(self, timeout: float = 0.001) -> bytes:
         # For PortSpawn
         assert self.timeout
         assert self.timeout >= 0.001
         if timeout > self.timeout:
-            time.sleep(timeout - self.timeout)
-        return super().read(1024)  # type: ignore
+            self.wait_readable(timeout - self.timeout)
+        data = self._coalesce(self._read_sized())
+        self._update_read_stats(data)
+        return data
+
+    def wait_readable(self, timeout: Optional[float] = None) -> bool:
+        """Block until there's data to read, wake up immediately when new data comes.
+
+        Fall back to sleep for the timeout if the serial fileno is not supported (windows).
+
+        Returns:
+            bool: True if the serial port is readable
+        """
+        if os.name != 'posix':
+            if not self.in_waiting and timeout:
+                time.sleep(timeout)
+            return bool(self.in_waiting)
+        return bool(self._readable_selector().select(timeout))
+
+    def _readable_selector(self) -> selectors.BaseSelector:
+        """Selector of the open port, registered once, closed with the port"""
+        fd = self.fileno()
+        if self._selector is not None and self._selector_fd != fd:
+            # reopened without close()
+            self.close_selector()
+        if self._selector is None:
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(fd, selectors.EVENT_READ)
+            self._selector_fd = fd
+        return self._selector
+
+    def close_selector(self) -> None:
+        """Close the selector of wait_readable(), the port could be still open"""
+        selector, self._selector, self._selector_fd = self._selector, None, None
+        if selector is not None:
+            selector.close()
+
+    def close(self) -> None:
+        self.close_selector()
+        super().close()
+
+    def read_available(self, coalesce: bool = True) -> bytes:
+        """Non-blocking read, return all bytes in the input buffer. For event-driven PortSpawn.
+
+        With ``coalesce_time``, it keeps reading for that time unless ``coalesce`` is False (eg: in an event loop).
+        """
+        # read(1) if the port is readable but nothing in waiting, pyserial raises SerialException if disconnected.
+        data = self._read_sized(min_size=1)
+        if coalesce:
+            data = self._coalesce(data)
+        self._update_read_stats(data)
+        return data
 
     def write_bytes(self, data: AnyStr) -> None:
         # For PortSpawn
@@ -39,13 +167,36 @@ class SerialPort(Serial):
 
 
 class SerialDutMixin(MixinBase):
-    """Add RawPort methods to serial.Serial"""
+    """Add RawPort methods to serial.Serial
+
+    The serial port could be reconnected without creating the DUT again, see ``reconnect()``.
+    """
+
+    # Reconnect automatically if reading the serial port fails, eg: USB re-enumeration after hard reset
+    AUTO_RECONNECT: bool = False
+    RECONNECT_TIMEOUT: float = 10
+    # Retry interval starts from the min interval, doubled after each failure until the max interval
+    RECONNECT_MIN_INTERVAL: float = 0.05
+    RECONNECT_MAX_INTERVAL: float = 1.0
+    # esptool runner of the flash methods, the default one is shared and remembers the stable baud of each port
+    ESPTOOL: Optional[EspTool] = None
+    # USB identity of the port is looked up in this inventory, the shared inventory of the process by default
+    PORT_INVENTORY: Optional['SerialPortInventory'] = None
+    # EN is held low by RTS for this time in hard_reset(), same as esptool
+    HARD_RESET_TIME: float = 0.1
 
     def __init__(self, dut: Any, name: str, log_file: str = '') -> None:
         if isinstance(dut, Serial):
             dut.__class__ = SerialPort
-        super().__init__(dut, name, log_file)
+        # set before starting the pexpect proc
         self._serial_config: Dict[str, Any] = {}
+        # USB location / serial number of the port, to find it again if the device path changes, looked up when
+        # reconnecting
+        self.usb_location: Optional[str] = None
+        self.usb_serial_number: Optional[str] = None
+        self.reconnect_latency = LatencyHistogram()
+        self._reconnect_lock = threading.Lock()
+        super().__init__(dut, name, log_file)
 
     @property
     def port(self) -> Optional[SerialPort]:  # type: ignore
@@ -55,6 +206,7 @@ class SerialDutMixin(MixinBase):
         if not self.port:
             return
         assert self.port.timeout is not None, 'Serial port timeout must be specified!'
+        old_device = self._serial_config.get('port')
         self._serial_config = {
             'port': self.port.port,
             'baudrate': self.port.baudrate,
@@ -67,9 +219,127 @@ class SerialDutMixin(MixinBase):
             'write_timeout': self.port.write_timeout,
             'dsrdtr': self.port.dsrdtr,
         }
+        if self.port.port != old_device:
+            self.usb_location = self.usb_serial_number = None
         if not self.port.is_open:
             self.port.open()
         super().start_pexpect_proc()
+        if self.spawn:
+            self.spawn.metrics.gauges['reconnect_latency'] = self.reconnect_latency.to_dict
+            if self.AUTO_RECONNECT:
+                # the device is resolved by the identity after a read error, look it up while the device exists.
+                # the inventory is only rescanned if it's stale
+                self._load_usb_identity()
+                self.spawn.on_read_error = self._on_read_error
+
+    def _port_inventory(self) -> 'SerialPortInventory':
+        # imported here, esptest.devices imports this module
+        from ...devices.port_inventory import get_inventory  # pylint: disable=import-outside-toplevel
+
+        return self.PORT_INVENTORY or get_inventory()
+
+    def _load_usb_identity(self) -> None:
+        """Look up the USB location / serial number of the opened device, in the last inventory scan first.
+
+        Called only when the device must be resolved, the inventory is rescanned by its ttl rather than for each DUT.
+        """
+        if self.usb_location is not None or self.usb_serial_number is not None:
+            return
+        device = self._serial_config.get('port')
+        if not isinstance(device, str) or not device:
+            return
+        if os.path.isabs(device):
+            # eg: /dev/serial/by-id/* links
+            device = os.path.realpath(device)
+        inventory = self._port_inventory()
+        info = inventory.find(device, refresh=False) or inventory.find(device)
+        if info:
+            self.usb_location = info.location
+            self.usb_serial_number = info.serial_number
+
+    def _resolve_device(self) -> str:
+        """Find the device path by USB location, then serial number, fall back to the last device path"""
+        device = self._serial_config['port']
+        assert isinstance(device, str)
+        self._load_usb_identity()
+        if self.usb_location is None and self.usb_serial_number is None:
+            return device
+        inventory = self._port_inventory()
+        # the device may be re-created within the ttl, udev events invalidate the inventory
+        inventory.refresh(force=not inventory.use_udev)
+        info = inventory.by_location(self.usb_location) if self.usb_location else None
+        if not info and self.usb_serial_number:
+            info = next(iter(inventory.by_serial_number(self.usb_serial_number)), None)
+        if info:
+            assert isinstance(info.device, str)
+            return info.device
+        return device
+
+    def _open_serial(self, timeout: float) -> Serial:
+        """Open the serial port with the saved config, retry with bounded backoff until timeout"""
+        end_time = time.perf_counter() + timeout
+        interval = self.RECONNECT_MIN_INTERVAL
+        while True:
+            device = self._resolve_device()
+            try:
+                return serial.Serial(**{**self._serial_config, 'port': device})
+            except (serial.SerialException, OSError) as e:
+                time_left = end_time - time.perf_counter()
+                if time_left <= 0:
+                    raise serial.SerialException(f'{self.name} failed to open {device} in {timeout}s: {str(e)}') from e
+                logger.debug(f'{self.name} failed to open {device}, retry in {interval}s: {str(e)}')
+                # the last retry at the end of timeout
+                time.sleep(min(interval, time_left))
+            interval = min(interval * 2, self.RECONNECT_MAX_INTERVAL)
+
+    def reconnect(self, timeout: Optional[float] = None) -> float:
+        """Open the serial port again and continue reading with the same PortSpawn.
+
+        The device path is found again by USB location or serial number, it may change after a hard reset or USB
+        re-enumeration. Received data not yet consumed, history, log file, subscribers and watchers are kept.
+
+        Args:
+            timeout (float, optional): maximum time to retry. Defaults to RECONNECT_TIMEOUT.
+
+        Raises:
+            serial.SerialException: can not open the port within timeout
+
+        Returns:
+            float: reconnect latency in seconds
+        """
+        assert self.spawn and self._serial_config, 'Serial port is not started'
+        if timeout is None:
+            timeout = self.RECONNECT_TIMEOUT
+        t0 = time.perf_counter()
+        with self._reconnect_lock:
+            new_serial = self._open_serial(timeout)
+            new_serial.__class__ = SerialPort
+            old_serial = self._port
+            self._serial_config['port'] = new_serial.port
+            self._port = new_serial
+            self.spawn.replace_port(new_serial)
+            if old_serial is not None:
+                try:
+                    old_serial.close()
+                except Exception as e:  # pylint: disable=W0718
+                    logger.debug(f'{self.name} failed to close the old serial port: {str(e)}')
+        latency = time.perf_counter() - t0
+        self.reconnect_latency.observe(latency)
+        logger.info(f'{self.name} reconnected to {new_serial.port} in {latency:.3f}s')
+        return latency
+
+    def _on_read_error(self, e: Exception) -> None:
+        # called in the reading thread, which is joined when replacing the port
+        if self._reconnect_lock.locked():
+            return
+        logger.warning(f'{self.name} reading failed, reconnecting: {str(e)}')
+        threading.Thread(target=self._auto_reconnect, name=f'Reconnect_{self.name}', daemon=True).start()
+
+    def _auto_reconnect(self) -> None:
+        try:
+            self.reconnect()
+        except Exception as e:  # pylint: disable=W0718
+            logger.error(f'{self.name} auto reconnect failed: {str(e)}')
 
     @property
     def serial(self) -> Optional[SerialPort]:
@@ -88,14 +358,99 @@ class SerialDutMixin(MixinBase):
         if serial_instance:
             self._port = serial_instance
             self._port.__class__ = SerialPort
+            # the stopped PortSpawn could not read the new port, start a new one
+            self._pexpect_proc = None
             self.start_pexpect_proc()
 
     def close(self) -> None:
         """Close serial port and clean up resources."""
         super().close()
         if self._port:
+            # the port may not be opened by this object, only release the resources of SerialPort
+            self._port.close_selector()  # type: ignore
             self._port = None
 
+    @contextlib.contextmanager
+    def release_port(self) -> Generator[str, None, None]:
+        """Stop reading and close the serial port for other tools (eg: esptool), reconnect after.
+
+        Data received before is kept, reading continues with the same PortSpawn.
+
+        Yields:
+            str: serial device path
+        """
+        assert self.spawn and self.serial, 'Serial port is not started'
+        device = self.serial.port
+        assert isinstance(device, str)
+        self.spawn.pause_reading()
+        self.serial.close()
+        try:
+            yield device
+        finally:
+            self.reconnect()
+
+    def hard_reset(self) -> None:
+        """Reset the chip by the EN pin with RTS, DTR is released to boot from flash"""
+        assert self.serial
+        self.serial.dtr = False
+        self.serial.rts = True
+        time.sleep(self.HARD_RESET_TIME)
+        self.serial.rts = False
+
+    def _esptool_chip(self) -> str:
+        try:
+            return self.target
+        except NotImplementedError:
+            return 'auto'
+
+    def _partition_range(self, part: Union[int, str]) -> Tuple[int, int]:
+        """offset and size of the partition, ``partition_table`` is like {'nvs': {'offset': 0x9000, 'size': 0x6000}}"""
+        if isinstance(part, int):
+            return part, 0
+        info = self.partition_table[part]
+        return int(info['offset']), int(info['size'])
+
+    def flash(self, bin_path: str = '') -> None:
+        """Flash the ESP-IDF build directory with ``flasher_args.json`` by esptool, ``bin_path`` by default"""
+        flash_dut(self, FlashArgs.from_build_dir(bin_path or self.bin_path), self.ESPTOOL).raise_for_error()
+
+    def flash_partition(self, part: Union[int, str], bin_path: str = '') -> None:
+        """Write the binary file, or the file of this partition in the build directory, to the partition
+
+        Args:
+            part (Union[int, str]): partition name in ``partition_table`` or offset
+            bin_path (str, optional): binary file or build directory. Defaults to ``bin_path``.
+        """
+        offset, _ = self._partition_range(part)
+        if bin_path and os.path.isfile(bin_path):
+            flash_args = FlashArgs([(offset, bin_path)], self._esptool_chip())
+        else:
+            flash_args = FlashArgs.from_build_dir(bin_path or self.bin_path)
+            flash_args.files = [f for f in flash_args.files if f[0] == offset]
+            if not flash_args.files:
+                raise FlashError(f'{self.name} no file for partition {part} in {bin_path or self.bin_path}')
+        flash_dut(self, flash_args, self.ESPTOOL).raise_for_error()
+
+    def flash_nvs(self, bin_path: str = '') -> None:
+        self.flash_partition('nvs', bin_path)
+
+    def dump_flash(self, part: Union[int, str], bin_path: str, size: int = 0) -> None:
+        """Read the partition (or from the offset) to the file, size defaults to the partition size"""
+        offset, part_size = self._partition_range(part)
+        size = size or part_size
+        assert size > 0, 'size is required when dumping from an offset'
+        esptool = self.ESPTOOL or DEFAULT_ESPTOOL
+        with self.release_port() as device:
+            result = esptool.read_flash(self.name, device, (offset, size), bin_path, self._esptool_chip())
+        result.raise_for_error()
+
     def reopen(self) -> None:
-        """Open the same serial port again and enable serial read thread."""
-        self.serial = serial.Serial(**self._serial_config)
+        """Open the same serial port again and enable serial read thread.
+
+        The device path is found again by USB location or serial number if known, use ``reconnect()`` to keep the
+        buffers.
+        """
+        config = dict(self._serial_config)
+        if isinstance(config.get('port'), str):
+            config['port'] = self._resolve_device()
+        self.serial = serial.Serial(**config)
@@ -0,0 +1,217 @@
+import abc
+import re
+from typing import Any, List, NamedTuple, Optional, Sequence, Union
+
+from ..common import to_bytes, to_str
+from ..logger import get_logger
+
+BytesLike = Union[bytes, bytearray]
+# regex flags could be set for part of the pattern, eg: '(?x:...)'
+_INLINE_FLAGS = (
+    ('a', re.ASCII),
+    ('i', re.IGNORECASE),
+    ('L', re.LOCALE),
+    ('m', re.MULTILINE),
+    ('s', re.DOTALL),
+    ('x', re.VERBOSE),
+)
+_SCOPED_FLAGS_MASK = sum(v for _, v in _INLINE_FLAGS)
+
+logger = get_logger('matcher')
+
+
+def to_bytes_pattern(pattern: re.Pattern) -> 're.Pattern[bytes]':
+    """Port data are matched as bytes, convert str regex to bytes regex"""
+    if isinstance(pattern.pattern, str):
+        # re-compile regex pattern using bytes, with same flags
+        re_flags = pattern.flags & (re.DOTALL | re.MULTILINE | re.IGNORECASE)
+        return re.compile(to_bytes(pattern.pattern), re_flags)
+    return pattern
+
+
+def to_str_match(pattern: re.Pattern, match: Any) -> Any:
+    """Convert the match result of bytes regex back to str, if the original pattern is str regex"""
+    if isinstance(pattern.pattern, str) and isinstance(match, re.Match):
+        # convert the match result into string
+        return pattern.match(to_str(match.group(0)))
+    return match
+
+
+class MatchResult(NamedTuple):
+    """Result of a stream matcher
+
+    - pattern_index: index of the matched pattern, always 0 for single pattern matchers
+    - start / end: position of the matched data in the searched buffer
+    - match: re.Match for regex patterns, matched bytes for exact patterns
+    """
+
+    pattern_index: int
+    start: int
+    end: int
+    match: Union['re.Match[bytes]', bytes]
+
+
+class StreamMatcher(metaclass=abc.ABCMeta):
+    """Search patterns in a growing buffer without rescanning the data already searched.
+
+    The caller appends new data to the end of the buffer and calls ``search()`` again.
+    The matcher remembers how far the buffer has been searched and only scans the new data,
+    plus a small window before it, for the matches across chunk boundaries.
+    Call ``reset()`` before searching a different buffer.
+    """
+
+    def __init__(self) -> None:
+        self._scanned = 0
+
+    def reset(self) -> None:
+        self._scanned = 0
+
+    @abc.abstractmethod
+    def search(self, buffer: BytesLike) -> Optional[MatchResult]:
+        """Search the pattern from the new data of the buffer"""
+
+
+class ExactMatcher(StreamMatcher):
+    """Plain bytes matching"""
+
+    def __init__(self, pattern: Union[str, bytes]) -> None:
+        super().__init__()
+        self.pattern = to_bytes(pattern)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.pattern!r})'
+
+    def search(self, buffer: BytesLike) -> Optional[MatchResult]:
+        # the beginning of the pattern may be at the end of the last searched data
+        start = buffer.find(self.pattern, max(0, self._scanned - len(self.pattern) + 1))
+        if start < 0:
+            self._scanned = len(buffer)
+            return None
+        end = start + len(self.pattern)
+        return MatchResult(0, start, end, self.pattern)
+
+
+class RegexMatcher(StreamMatcher):
+    """Regex matching on bytes
+
+    Regular expression could not be matched incrementally, the last ``window`` bytes of the data searched before
+    are searched again with the new data. A match longer than the window across two chunks could not be found.
+    """
+
+    DEFAULT_WINDOW = 8192
+
+    def __init__(self, pattern: 're.Pattern[bytes]', window: int = DEFAULT_WINDOW) -> None:
+        super().__init__()
+        assert isinstance(pattern.pattern, bytes), 'only bytes regex is supported'
+        self.pattern = pattern
+        self.window = window
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.pattern!r})'
+
+    def search(self, buffer: BytesLike) -> Optional[MatchResult]:
+        # search(buffer, pos) rather than search(buffer[pos:]), keep "^" and look-behind working
+        match = self.pattern.search(buffer, max(0, self._scanned - self.window))
+        if not match:
+            self._scanned = len(buffer)
+            return None
+        return MatchResult(0, match.start(), match.end(), match)
+
+
+class MultiMatcher(StreamMatcher):
+    """Match any of the given patterns in a single pass
+
+    All patterns are joined into one regex alternation, str / bytes patterns are escaped.
+    The leftmost match in the stream wins, the pattern listed first wins if more than one match at the same
+    position. ``MatchResult.pattern_index`` tells which pattern was matched.
+    """
+
+    # numbered back references refer to other groups after joining
+    _BACK_REFERENCE = re.compile(rb'\\[1-9]')
+
+    def __init__(
+        self,
+        patterns: Sequence[Union[str, bytes, 're.Pattern[bytes]']],
+        window: int = RegexMatcher.DEFAULT_WINDOW,
+    ) -> None:
+        super().__init__()
+        assert patterns, 'at least one pattern is required'
+        self.patterns: List[Union[bytes, 're.Pattern[bytes]']] = []
+        for pattern in patterns:
+            if isinstance(pattern, (str, bytes)):
+                assert pattern, 'empty pattern is not supported'
+                self.patterns.append(to_bytes(pattern))
+            else:
+                assert isinstance(pattern.pattern, bytes), 'only bytes regex is supported'
+                self.patterns.append(pattern)
+        # exact patterns across chunks must be searched again
+        self.window = max([window] + [len(p) for p in self.patterns if isinstance(p, bytes)])
+        self._combined_regex = self._combine_regex()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.patterns!r})'
+
+    def _combine_regex(self) -> Optional['re.Pattern[bytes]']:
+        # no capturing group for each pattern, it disables the optimizations of the regex engine
+        parts = []
+        for pattern in self.patterns:
+            if isinstance(pattern, bytes):
+                parts.append(re.escape(pattern))
+                continue
+            if self._BACK_REFERENCE.search(pattern.pattern):
+                return None
+            # keep flags of each pattern with scoped inline flags, other flags change the meaning once joined
+            if pattern.flags & ~_SCOPED_FLAGS_MASK:
+                return None
+            flags = ''.join(f for f, v in _INLINE_FLAGS if pattern.flags & v)
+            prefix = f'(?{flags}:'.encode() if flags else b'(?:'
+            # a verbose pattern could end with a comment
+            suffix = b'\n)' if pattern.flags & re.VERBOSE else b')'
+            parts.append(prefix + pattern.pattern + suffix)
+        try:
+            return re.compile(b'|'.join(parts))
+        except re.error:
+            # eg: duplicated group names, search the patterns one by one
+            return None
+
+    def _match_at(self, buffer: BytesLike, start: int) -> Optional[MatchResult]:
+        """The first pattern matched at the position, same as the regex alternation"""
+        for index, pattern in enumerate(self.patterns):
+            if isinstance(pattern, bytes):
+                if buffer.startswith(pattern, start):
+                    return MatchResult(index, start, start + len(pattern), pattern)
+                continue
+            # the pattern gives the same match at the same position, with its own groups
+            match = pattern.match(buffer, start)
+            if match:
+                return MatchResult(index, match.start(), match.end(), match)
+        return None
+
+    def _search_one_by_one(self, buffer: BytesLike, pos: int) -> Optional[MatchResult]:
+        results = []
+        for index, pattern in enumerate(self.patterns):
+            if isinstance(pattern, bytes):
+                start = buffer.find(pattern, pos)
+                if start >= 0:
+                    results.append(MatchResult(index, start, start + len(pattern), pattern))
+            else:
+                match = pattern.search(buffer, pos)
+                if match:
+                    results.append(MatchResult(index, match.start(), match.end(), match))
+        return min(results, key=lambda r: (r.start, r.pattern_index)) if results else None
+
+    def search(self, buffer: BytesLike) -> Optional[MatchResult]:
+        pos = max(0, self._scanned - self.window)
+        if self._combined_regex:
+            combined_match = self._combined_regex.search(buffer, pos)
+            result = self._match_at(buffer, combined_match.start()) if combined_match else None
+            if combined_match and not result:
+                # the joined regex differs from the patterns, should not happen, search them one by one from now on
+                logger.warning(f'{self!r} joined regex matched {combined_match.group()!r}, no pattern matched')
+                self._combined_regex = None
+                result = self._search_one_by_one(buffer, pos)
+        else:
+            result = self._search_one_by_one(buffer, pos)
+        if not result:
+            self._scanned = len(buffer)
+        return result
@@ -0,0 +1,287 @@
+import tempfile
+import threading
+from typing import IO, Optional, Union
+
+from ..logger import get_logger
+
+logger = get_logger('port_buffer')
+
+
+class RingBuffer:
+    """A bounded, thread-safe bytes ring buffer.
+
+    Data is stored in a pre-allocated ``bytearray`` and copied in / out through ``memoryview``,
+    appending and consuming data do not copy the data already in the buffer.
+    The buffer grows on demand until ``max_size``, then the overflow policy applies:
+
+    - ``drop_oldest``: drop the oldest data.
+    - ``block``: block the writer until the reader consumes some data.
+    - ``spill``: move the oldest data to a temporary file, it will be read before the data in memory.
+
+    One thread (the port reading thread) writes data, other threads (pexpect) wait for and read data.
+    """
+
+    DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+    DEFAULT_INIT_SIZE = 4096
+
+    DROP_OLDEST = 'drop_oldest'
+    BLOCK = 'block'
+    SPILL = 'spill'
+    OVERFLOW_POLICIES = (DROP_OLDEST, BLOCK, SPILL)
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_MAX_SIZE,
+        init_size: int = DEFAULT_INIT_SIZE,
+        overflow_policy: str = DROP_OLDEST,
+        spill_dir: Optional[str] = None,
+    ) -> None:
+        """Create a ring buffer
+
+        Args:
+            max_size (int, optional): maximum bytes could be buffered in memory. Defaults to 16MB.
+            init_size (int, optional): initial allocated size, will grow until max_size. Defaults to 4KB.
+            overflow_policy (str, optional): what to do if the buffer is full. Defaults to 'drop_oldest'.
+            spill_dir (str, optional): directory of the spill file. Defaults to system temp directory.
+        """
+        assert max_size > 0 and init_size > 0
+        assert overflow_policy in self.OVERFLOW_POLICIES, f'overflow_policy should be one of {self.OVERFLOW_POLICIES}'
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.spill_dir = spill_dir
+        self._buf = bytearray(min(init_size, max_size))
+        self._head = 0
+        self._size = 0
+        self._dropped_bytes = 0
+        self._spilled_bytes = 0
+        self._spill_file: Optional[IO[bytes]] = None
+        self._spill_read_pos = 0
+        self._spill_write_pos = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._woken = False
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self) -> int:
+        return self._size + self._spill_size
+
+    @property
+    def _spill_size(self) -> int:
+        return self._spill_write_pos - self._spill_read_pos
+
+    @property
+    def capacity(self) -> int:
+        """Current allocated size"""
+        return len(self._buf)
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Total bytes dropped because the buffer was full"""
+        return self._dropped_bytes
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Total bytes moved to the spill file because the buffer was full"""
+        return self._spilled_bytes
+
+    def _grow(self, required: int) -> None:
+        new_capacity = len(self._buf)
+        while new_capacity < required:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_size)
+        new_buf = bytearray(new_capacity)
+        self._copy_out(memoryview(new_buf), self._size)
+        self._buf = new_buf
+        self._head = 0
+
+    def _copy_out(self, dest: memoryview, size: int) -> None:
+        """copy ``size`` bytes from head to dest, without consuming them"""
+        capacity = len(self._buf)
+        first = min(size, capacity - self._head)
+        with memoryview(self._buf) as view:
+            dest[:first] = view[self._head : self._head + first]
+            if size > first:
+                dest[first:size] = view[: size - first]
+
+    def _consume(self, size: int) -> None:
+        self._size -= size
+        if self._size:
+            self._head = (self._head + size) % len(self._buf)
+        else:
+            self._head = 0
+        self._not_full.notify_all()
+
+    def _append(self, view: memoryview) -> None:
+        """append data to the ring, the caller makes sure there's enough space"""
+        required = self._size + len(view)
+        assert required <= self.max_size
+        if required > len(self._buf):
+            self._grow(required)
+        capacity = len(self._buf)
+        tail = (self._head + self._size) % capacity
+        first = min(len(view), capacity - tail)
+        self._buf[tail : tail + first] = view[:first]
+        if len(view) > first:
+            self._buf[: len(view) - first] = view[first:]
+        self._size += len(view)
+        self._not_empty.notify_all()
+
+    def _spill(self, data: Union[bytes, memoryview]) -> None:
+        if not self._spill_file:
+            self._spill_file = tempfile.TemporaryFile(prefix='esptest_spill_', dir=self.spill_dir)
+        self._spill_file.seek(self._spill_write_pos)
+        self._spill_file.write(data)
+        self._spill_write_pos += len(data)
+        self._spilled_bytes += len(data)
+
+    def _evict(self, view: memoryview) -> int:
+        """make space for the new data, returns the bytes dropped"""
+        overflow = self._size + len(view) - self.max_size
+        if overflow <= 0:
+            return 0
+        from_ring = min(self._size, overflow)
+        from_view = overflow - from_ring
+        if self.overflow_policy == self.SPILL:
+            if from_ring:
+                self._spill(self._get(from_ring))
+            if from_view:
+                self._spill(view[:from_view])
+        if from_ring:
+            self._consume(from_ring)
+        if self.overflow_policy == self.SPILL:
+            return 0
+        logger.debug(f'Ring buffer full, dropped {overflow} bytes')
+        return overflow
+
+    def _write_blocking(self, view: memoryview) -> int:
+        offset = 0
+        while offset < len(view):
+            if self._closed:
+                # do not block a stopped buffer, drop the rest data
+                return len(view) - offset
+            free = self.max_size - self._size
+            if not free:
+                self._not_full.wait()
+                continue
+            size = min(free, len(view) - offset)
+            self._append(view[offset : offset + size])
+            offset += size
+        return 0
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        """Append data to the end of the buffer, handle overflow with the overflow policy.
+
+        Returns:
+            int: bytes dropped during this write
+        """
+        if not data:
+            return 0
+        with memoryview(data) as view:
+            with self._not_empty:
+                if self.overflow_policy == self.BLOCK:
+                    dropped = self._write_blocking(view)
+                else:
+                    dropped = self._evict(view)
+                    self._append(view[-self.max_size :])
+                self._dropped_bytes += dropped
+                return dropped
+
+    def _get(self, size: int) -> bytes:
+        """return ``size`` bytes from head, only copies the data once"""
+        capacity = len(self._buf)
+        first = min(size, capacity - self._head)
+        with memoryview(self._buf) as view:
+            if size == first:
+                return bytes(view[self._head : self._head + size])
+            return b''.join((view[self._head :], view[: size - first]))
+
+    def _read_spill(self, size: int, consume: bool = True) -> bytes:
+        assert self._spill_file
+        self._spill_file.seek(self._spill_read_pos)
+        data = self._spill_file.read(min(size, self._spill_size))
+        if consume:
+            self._spill_read_pos += len(data)
+            if not self._spill_size:
+                # all spilled data consumed, reuse the file from beginning
+                self._spill_file.truncate(0)
+                self._spill_read_pos = self._spill_write_pos = 0
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        """Consume and return at most ``size`` bytes from the buffer, return all data if size < 0.
+
+        Spilled data is returned before the data in memory, they are not joined in one read.
+        """
+        with self._lock:
+            if self._spill_size:
+                return self._read_spill(size if size >= 0 else self._spill_size)
+            if size < 0 or size > self._size:
+                size = self._size
+            if not size:
+                return b''
+            data = self._get(size)
+            self._consume(size)
+            return data
+
+    def drain(self) -> bytes:
+        """Consume and return all data, including the spilled data, the data in memory is only copied once"""
+        with self._lock:
+            data = self._read_spill(self._spill_size) if self._spill_size else b''
+            if self._size:
+                ring_data = self._get(self._size)
+                self._consume(self._size)
+                data = data + ring_data if data else ring_data
+            return data
+
+    def peek(self, size: int = -1) -> bytes:
+        """Return at most ``size`` bytes from the buffer without consuming them."""
+        with self._lock:
+            if size < 0 or size > self._size + self._spill_size:
+                size = self._size + self._spill_size
+            data = b''
+            if self._spill_size:
+                data = self._read_spill(size, consume=False)
+            ring_size = min(size - len(data), self._size)
+            if ring_size:
+                data += self._get(ring_size)
+            return data
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the buffer is not empty or timeout.
+
+        Returns:
+            bool: True if there's data in the buffer
+        """
+        with self._not_empty:
+            if len(self) == 0 and not self._woken:
+                self._not_empty.wait(timeout)
+            self._woken = False
+            return len(self) > 0
+
+    def wakeup(self) -> None:
+        """Return the pending (or the next) ``wait()`` without data, eg: to check a cancel event"""
+        with self._lock:
+            self._woken = True
+            self._not_empty.notify_all()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._head = 0
+            self._size = 0
+            if self._spill_file:
+                self._spill_file.truncate(0)
+                self._spill_read_pos = self._spill_write_pos = 0
+            self._not_full.notify_all()
+
+    def close(self) -> None:
+        """Wake up and never block the writer again, release the spill file"""
+        with self._lock:
+            self._closed = True
+            self._head = 0
+            self._size = 0
+            if self._spill_file:
+                self._spill_file.close()
+                self._spill_file = None
+                self._spill_read_pos = self._spill_write_pos = 0
+            self._not_full.notify_all()
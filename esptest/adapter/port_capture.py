@@ -0,0 +1,268 @@
+import array
+import bisect
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from ..logger import get_logger
+
+logger = get_logger('port_capture')
+
+# magic, version, reserved, wall clock start (ns), monotonic start (ns)
+FILE_HEADER = struct.Struct('<8sHHQQ')
+CAPTURE_MAGIC = b'ESPCAP\x00\x01'
+CAPTURE_VERSION = 1
+# monotonic timestamp (ns), direction, payload length
+RECORD_HEADER = struct.Struct('<QBI')
+# monotonic timestamp (ns), record offset in the capture file
+INDEX_ENTRY = struct.Struct('<QQ')
+INDEX_SUFFIX = '.idx'
+
+DIRECTION_READ = 0
+DIRECTION_WRITE = 1
+
+
+class CaptureRecord(NamedTuple):
+    timestamp_ns: int
+    direction: int
+    data: bytes
+
+
+class CaptureWriter:
+    """Write port data chunks to a binary capture file in a dedicated thread.
+
+    File format (little endian)::
+
+        header: magic(8s) version(H) reserved(H) wall_start_ns(Q) monotonic_start_ns(Q)
+        record: monotonic_ns(Q) direction(B) length(I) payload(length bytes)
+
+    The index file ``<capture_file>.idx`` has one entry ``monotonic_ns(Q) record_offset(Q)`` for each record.
+    Timestamps are taken by the caller thread when the data is received or sent.
+
+    An existing capture file is appended, eg: when the port is started again. A partially written last record is
+    discarded first. The header of the first session is kept, the monotonic timestamps are comparable within one
+    boot of the host.
+    """
+
+    def __init__(self, capture_file: str, name: str = '') -> None:
+        self.capture_file = capture_file
+        self.name = name
+        dirname = os.path.dirname(capture_file)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        resume = self._complete_records(capture_file)
+        # pylint: disable=consider-using-with
+        if resume:
+            end_offset, index = resume
+            os.truncate(capture_file, end_offset)
+            self._file = open(capture_file, 'ab')
+            # rewritten, it may be missing or have entries of the discarded record
+            self._index_file = open(capture_file + INDEX_SUFFIX, 'wb')
+            self._index_file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in index))
+            self._index_file.flush()
+            self._offset = end_offset
+            logger.debug(f'Append {name} capture file {capture_file} after {len(index)} records')
+        else:
+            self._file = open(capture_file, 'wb')
+            self._index_file = open(capture_file + INDEX_SUFFIX, 'wb')
+            self._file.write(FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0, time.time_ns(), time.monotonic_ns()))
+            self._file.flush()
+            self._offset = FILE_HEADER.size
+        self._queue: queue.SimpleQueue[Optional[Tuple[int, int, bytes]]] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=f'Capture_{name}')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @staticmethod
+    def _complete_records(capture_file: str) -> Optional[Tuple[int, List[Tuple[int, int]]]]:
+        """End offset and index entries of the complete records of an existing capture file"""
+        if not os.path.isfile(capture_file):
+            return None
+        try:
+            with CaptureReader(capture_file) as reader:
+                return reader.end_offset, list(reader.index_entries())
+        except (OSError, ValueError):
+            logger.warning(f'Overwrite invalid capture file {capture_file}')
+            return None
+
+    def write(self, data: bytes, direction: int = DIRECTION_READ) -> None:
+        """Called by the port reading / writing thread, never blocks"""
+        if data:
+            self._queue.put((time.monotonic_ns(), direction, bytes(data)))
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            item = self._queue.get()
+            while item is not None:
+                timestamp_ns, direction, data = item
+                self._file.write(RECORD_HEADER.pack(timestamp_ns, direction, len(data)))
+                self._file.write(data)
+                self._index_file.write(INDEX_ENTRY.pack(timestamp_ns, self._offset))
+                self._offset += RECORD_HEADER.size + len(data)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    # flush when there's no pending data, the reader could see all records
+                    self._file.flush()
+                    self._index_file.flush()
+                    item = self._queue.get()
+        except OSError as e:
+            logger.error(f'Failed to write {self.name} capture file {self.capture_file}: {str(e)}')
+        finally:
+            self._file.close()
+            self._index_file.close()
+
+
+class CaptureReader:
+    """Read a capture file with mmap, seek records by monotonic timestamp and iterate lines.
+
+    The index file is used if it exists, otherwise the index is built by walking the record headers.
+    A partially written last record (eg: after a crash) is ignored.
+    """
+
+    def __init__(self, capture_file: str) -> None:
+        self.capture_file = capture_file
+        self._file = open(capture_file, 'rb')  # pylint: disable=consider-using-with
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file can not be mapped
+            self._file.close()
+            raise ValueError(f'Invalid capture file {capture_file}') from None
+        if len(self._mmap) < FILE_HEADER.size:
+            self.close()
+            raise ValueError(f'Invalid capture file {capture_file}')
+        magic, version, _, wall_start_ns, monotonic_start_ns = FILE_HEADER.unpack_from(self._mmap)
+        self.version: int = version
+        self.wall_start_ns: int = wall_start_ns
+        self.monotonic_start_ns: int = monotonic_start_ns
+        if magic != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError(f'Invalid capture file {capture_file}')
+        self._timestamps = array.array('Q')
+        self._offsets = array.array('Q')
+        self._load_index()
+
+    def _load_index(self) -> None:
+        index_file = self.capture_file + INDEX_SUFFIX
+        if os.path.isfile(index_file):
+            with open(index_file, 'rb') as f:
+                entries = array.array('Q')
+                data = f.read()
+                entries.frombytes(data[: len(data) // INDEX_ENTRY.size * INDEX_ENTRY.size])
+            if sys.byteorder != 'little':
+                entries.byteswap()
+            self._timestamps = entries[0::2]
+            self._offsets = entries[1::2]
+            # drop entries of records not completely written
+            while self._offsets and not self._complete(self._offsets[-1]):
+                self._timestamps.pop()
+                self._offsets.pop()
+            return
+        offset = FILE_HEADER.size
+        while self._complete(offset):
+            timestamp_ns, _, length = RECORD_HEADER.unpack_from(self._mmap, offset)
+            self._timestamps.append(timestamp_ns)
+            self._offsets.append(offset)
+            offset += RECORD_HEADER.size + length
+
+    def _complete(self, offset: int) -> bool:
+        if offset + RECORD_HEADER.size > len(self._mmap):
+            return False
+        length: int = RECORD_HEADER.unpack_from(self._mmap, offset)[2]
+        return offset + RECORD_HEADER.size + length <= len(self._mmap)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def index_entries(self) -> Iterator[Tuple[int, int]]:
+        """(monotonic timestamp, record offset) of each record"""
+        return zip(self._timestamps, self._offsets)
+
+    @property
+    def end_offset(self) -> int:
+        """Offset after the last complete record"""
+        if not self._offsets:
+            return FILE_HEADER.size
+        offset = self._offsets[-1]
+        length: int = RECORD_HEADER.unpack_from(self._mmap, offset)[2]
+        return offset + RECORD_HEADER.size + length
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        return self.records()
+
+    def __enter__(self) -> 'CaptureReader':
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace) -> None:  # type: ignore
+        self.close()
+
+    def close(self) -> None:
+        if not self._mmap.closed:
+            self._mmap.close()
+        self._file.close()
+
+    def record(self, index: int) -> CaptureRecord:
+        offset = self._offsets[index]
+        timestamp_ns, direction, length = RECORD_HEADER.unpack_from(self._mmap, offset)
+        start = offset + RECORD_HEADER.size
+        return CaptureRecord(timestamp_ns, direction, self._mmap[start : start + length])
+
+    def seek_time(self, timestamp_ns: int) -> int:
+        """Index of the first record received at or after the monotonic timestamp"""
+        return bisect.bisect_left(self._timestamps, timestamp_ns)
+
+    def to_wall_time(self, timestamp_ns: int) -> float:
+        """Convert the record monotonic timestamp to wall clock time in seconds"""
+        return (self.wall_start_ns + timestamp_ns - self.monotonic_start_ns) / 1e9
+
+    def records(
+        self, start_ns: Optional[int] = None, end_ns: Optional[int] = None, direction: Optional[int] = None
+    ) -> Iterator[CaptureRecord]:
+        """Iterate records in the time range [start_ns, end_ns), of the direction if given"""
+        start = self.seek_time(start_ns) if start_ns is not None else 0
+        end = self.seek_time(end_ns) if end_ns is not None else len(self)
+        for i in range(start, end):
+            rec = self.record(i)
+            if direction is None or rec.direction == direction:
+                yield rec
+
+    def iter_lines(
+        self, start_ns: Optional[int] = None, end_ns: Optional[int] = None, direction: int = DIRECTION_READ
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Iterate lines of the received (or sent) data
+
+        Yields:
+            Tuple[int, bytes]: monotonic timestamp of the record where the line starts, line including line ending
+        """
+        pending: List[bytes] = []
+        pending_time = 0
+        for rec in self.records(start_ns, end_ns, direction):
+            data = rec.data
+            pos = 0
+            while True:
+                end = data.find(b'\n', pos)
+                if end == -1:
+                    break
+                if pending:
+                    yield pending_time, b''.join(pending) + data[pos : end + 1]
+                    pending = []
+                else:
+                    yield rec.timestamp_ns, data[pos : end + 1]
+                pos = end + 1
+            if pos < len(data):
+                if not pending:
+                    pending_time = rec.timestamp_ns
+                pending.append(data[pos:])
+        if pending:
+            yield pending_time, b''.join(pending)
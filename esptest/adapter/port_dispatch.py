@@ -0,0 +1,203 @@
+import collections
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Deque, Optional, Tuple
+
+from ..logger import get_logger
+
+if TYPE_CHECKING:
+    from .base_port import PortSpawn
+
+logger = get_logger('port_dispatch')
+
+# (port name, data)
+ReceiveCallback = Callable[[str, bytes], None]
+
+
+class Subscription:
+    """A subscriber of the port data, the callback is called in its own worker thread.
+
+    Chunks are delivered in the received order. If the callback can not keep up and ``max_queue`` chunks are
+    pending, new chunks are dropped and counted, the port reading thread is never blocked.
+    """
+
+    DEFAULT_MAX_QUEUE = 1024
+    # a callback blocked longer than this is left running in the daemon thread
+    DEFAULT_CLOSE_TIMEOUT = 1.0
+
+    def __init__(self, callback: ReceiveCallback, port_name: str = '', max_queue: int = DEFAULT_MAX_QUEUE) -> None:
+        assert max_queue > 0
+        self.callback = callback
+        self.port_name = port_name
+        self.max_queue = max_queue
+        self.delivered_chunks = 0
+        self.dropped_chunks = 0
+        self.dropped_bytes = 0
+        self.errors = 0
+        # maximum pending chunks ever seen
+        self.max_lag = 0
+        self._queue: Deque[bytes] = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f'Callback_{port_name}')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def lag(self) -> int:
+        """Chunks waiting to be delivered"""
+        return len(self._queue)
+
+    @property
+    def active(self) -> bool:
+        return not self._closed
+
+    def put(self, data: bytes) -> bool:
+        """Queue the data for the callback, never blocks
+
+        Returns:
+            bool: False if the data is dropped
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._queue) >= self.max_queue:
+                self.dropped_chunks += 1
+                self.dropped_bytes += len(data)
+                return False
+            self._queue.append(data)
+            self.max_lag = max(self.max_lag, len(self._queue))
+            self._cond.notify()
+            return True
+
+    def stop(self, drain: bool = False) -> None:
+        """Stop the worker thread after the current chunk, or after the pending chunks are delivered if drain"""
+        with self._cond:
+            self._closed = True
+            if not drain and self._queue:
+                self.dropped_chunks += len(self._queue)
+                self.dropped_bytes += sum(len(data) for data in self._queue)
+                self._queue.clear()
+            self._cond.notify()
+
+    def join(self, timeout: Optional[float] = DEFAULT_CLOSE_TIMEOUT) -> bool:
+        """Wait for the worker thread to exit, a warning is logged if it's still running after the timeout
+
+        Returns:
+            bool: True if the worker thread exited
+        """
+        if self._thread is threading.current_thread():
+            return False
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f'{self.port_name} receive callback {self.callback} did not exit in {timeout}s')
+            return False
+        return True
+
+    def close(self, timeout: Optional[float] = DEFAULT_CLOSE_TIMEOUT, drain: bool = False) -> bool:
+        """Stop the worker thread, pending chunks are dropped unless drain, wait for it until timeout"""
+        self.stop(drain)
+        return self.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                data = self._queue.popleft()
+            try:
+                self.callback(self.port_name, data)
+            except Exception as e:  # pylint: disable=W0718
+                self.errors += 1
+                logger.warning(f'{self.port_name} receive callback {self.callback} failed: {str(e)}')
+            self.delivered_chunks += 1
+
+
+class DataDispatcher:
+    """Deliver received data of one port to multiple subscribers off the reading thread"""
+
+    def __init__(self, port_name: str = '') -> None:
+        self.port_name = port_name
+        # replaced rather than modified, the reading thread iterates it without lock
+        self._subscriptions: Tuple[Subscription, ...] = ()
+        self._lock = threading.Lock()
+
+    @property
+    def subscriptions(self) -> Tuple[Subscription, ...]:
+        return self._subscriptions
+
+    def subscribe(self, callback: ReceiveCallback, max_queue: int = Subscription.DEFAULT_MAX_QUEUE) -> Subscription:
+        subscription = Subscription(callback, self.port_name, max_queue)
+        with self._lock:
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Remove the subscriber, pending data is still delivered until the close timeout"""
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        subscription.close(drain=True)
+
+    def dispatch(self, data: bytes) -> None:
+        for subscription in self._subscriptions:
+            subscription.put(data)
+
+    def close(self, timeout: float = Subscription.DEFAULT_CLOSE_TIMEOUT, drain: bool = False) -> None:
+        """Stop all subscribers, pending data is dropped unless drain, wait for them with one deadline"""
+        with self._lock:
+            subscriptions, self._subscriptions = self._subscriptions, ()
+        for subscription in subscriptions:
+            subscription.stop(drain)
+        deadline = time.monotonic() + timeout
+        for subscription in subscriptions:
+            subscription.join(max(deadline - time.monotonic(), 0))
+
+
+class SpawnDispatchMixin:
+    """Subscribers of PortSpawn"""
+
+    _dispatcher: DataDispatcher
+    # the subscription of receive_callback
+    _callback_subscription: Optional[Subscription] = None
+
+    def subscribe(self, callback: ReceiveCallback, max_queue: int = Subscription.DEFAULT_MAX_QUEUE) -> Subscription:
+        """Call ``callback(name, data)`` with received data in a dedicated thread, in the received order.
+
+        The reading thread is never blocked by the callback, data is dropped and counted by the subscription if more
+        than max_queue chunks are pending.
+        """
+        return self._dispatcher.subscribe(callback, max_queue)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._dispatcher.unsubscribe(subscription)
+
+    @property
+    def receive_callback(self) -> Optional[ReceiveCallback]:
+        """Single callback slot, kept for compatibility. Use subscribe() to add more callbacks."""
+        return self._callback_subscription.callback if self._callback_subscription else None
+
+    @receive_callback.setter
+    def receive_callback(self, callback: Optional[ReceiveCallback]) -> None:
+        if self._callback_subscription:
+            self.unsubscribe(self._callback_subscription)
+            self._callback_subscription = None
+        if callback:
+            self._callback_subscription = self.subscribe(callback)
+
+
+class PortDispatchMixin:
+    """subscribe() / unsubscribe() of BasePort"""
+
+    _pexpect_proc: Optional['PortSpawn']
+
+    def subscribe(self, callback: ReceiveCallback, max_queue: int = Subscription.DEFAULT_MAX_QUEUE) -> Subscription:
+        """Call ``callback(name, data)`` with received data in a dedicated thread, see PortSpawn.subscribe()"""
+        if not self._pexpect_proc:
+            raise NotImplementedError()
+        return self._pexpect_proc.subscribe(callback, max_queue)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if self._pexpect_proc:
+            self._pexpect_proc.unsubscribe(subscription)
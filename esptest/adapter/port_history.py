@@ -0,0 +1,275 @@
+import bisect
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple, Union
+
+import pexpect
+
+from ..common import to_str
+from ..logger import get_logger
+from .matcher import MatchResult, StreamMatcher, to_str_match
+
+if TYPE_CHECKING:
+    from .base_port import PortSpawn
+
+logger = get_logger('port_history')
+
+
+class HistoryMark(NamedTuple):
+    """A position in the port session: byte offset from the beginning and monotonic receive time"""
+
+    offset: int
+    timestamp: float
+
+
+# HistoryMark, or monotonic timestamp, or absolute byte offset
+HistorySince = Union[HistoryMark, float, int, None]
+
+
+class LineHistory:
+    """Keep received data of the port session in memory, with a line index.
+
+    Each line has the byte offset from the beginning of the session and the monotonic time its first byte was
+    received. Data is kept even if it has been consumed by pexpect, the oldest lines are discarded if the size
+    exceeds ``max_size``.
+    """
+
+    DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        assert max_size > 0
+        self.max_size = max_size
+        self._data = bytearray()
+        # offset of self._data[0] from the beginning of the session
+        self._base_offset = 0
+        self._line_offsets: List[int] = []
+        self._line_times: List[float] = []
+        # a new line starts with the next received byte
+        self._line_pending = True
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """Bytes kept in memory"""
+        return len(self._data)
+
+    @property
+    def start_offset(self) -> int:
+        """Offset of the oldest data still in memory"""
+        return self._base_offset
+
+    @property
+    def end_offset(self) -> int:
+        """Total bytes received in the session"""
+        return self._base_offset + len(self._data)
+
+    def append(self, data: bytes, timestamp: Optional[float] = None) -> None:
+        if not data:
+            return
+        timestamp = timestamp or time.monotonic()
+        with self._cond:
+            offset = self.end_offset
+            if self._line_pending:
+                self._line_offsets.append(offset)
+                self._line_times.append(timestamp)
+            pos = data.find(b'\n')
+            while pos != -1 and pos + 1 < len(data):
+                self._line_offsets.append(offset + pos + 1)
+                self._line_times.append(timestamp)
+                pos = data.find(b'\n', pos + 1)
+            self._line_pending = data.endswith(b'\n')
+            self._data += data
+            if len(self._data) > self.max_size:
+                self._trim()
+            self._cond.notify_all()
+
+    def _trim(self) -> None:
+        """Discard whole lines from the beginning, to 3/4 max_size to avoid trimming for each append"""
+        target = self.end_offset - self.max_size * 3 // 4
+        index = bisect.bisect_left(self._line_offsets, target)
+        if index >= len(self._line_offsets):
+            # one very long line, discard part of it
+            new_base = target
+            index = len(self._line_offsets) - 1
+            self._line_offsets[index] = new_base
+        else:
+            new_base = self._line_offsets[index]
+        del self._line_offsets[:index]
+        del self._line_times[:index]
+        del self._data[: new_base - self._base_offset]
+        self._base_offset = new_base
+
+    def mark(self) -> HistoryMark:
+        """Current position, data received after this is returned by ``read(since=mark)``"""
+        with self._cond:
+            return HistoryMark(self.end_offset, time.monotonic())
+
+    def _since_offset(self, since: HistorySince) -> int:
+        if since is None:
+            offset = self._base_offset
+        elif isinstance(since, HistoryMark):
+            offset = since.offset
+        elif isinstance(since, float):
+            # first line received at or after the timestamp
+            index = bisect.bisect_left(self._line_times, since)
+            offset = self._line_offsets[index] if index < len(self._line_offsets) else self.end_offset
+        else:
+            offset = since
+        if offset < self._base_offset:
+            logger.warning(f'History before offset {self._base_offset} was discarded, search from there.')
+            offset = self._base_offset
+        return offset
+
+    def read(self, since: HistorySince = None, end: Optional[int] = None) -> Tuple[int, bytes]:
+        """Get the received data from ``since`` to the absolute offset ``end``
+
+        Returns:
+            Tuple[int, bytes]: start offset of the data and the data
+        """
+        with self._cond:
+            start = self._since_offset(since)
+            end = self.end_offset if end is None else min(end, self.end_offset)
+            return start, bytes(self._data[start - self._base_offset : end - self._base_offset])
+
+    def lines(self, since: HistorySince = None) -> List[Tuple[float, bytes]]:
+        """Lines received since the position, the first line may be partial if since is an offset
+
+        Returns:
+            List[Tuple[float, bytes]]: monotonic receive time and line data including line ending
+        """
+        with self._cond:
+            start = self._since_offset(since)
+            index = max(bisect.bisect_right(self._line_offsets, start) - 1, 0)
+            offsets = self._line_offsets[index:] + [self.end_offset]
+            ret = []
+            for i, line_time in enumerate(self._line_times[index:]):
+                line_start = max(offsets[i], start) - self._base_offset
+                line_end = offsets[i + 1] - self._base_offset
+                if line_start < line_end:
+                    ret.append((line_time, bytes(self._data[line_start:line_end])))
+            return ret
+
+    def time_of(self, offset: int) -> Optional[float]:
+        """Receive time of the line containing the offset, None if it was discarded"""
+        with self._cond:
+            if offset < self._base_offset or not self._line_offsets:
+                return None
+            return self._line_times[max(bisect.bisect_right(self._line_offsets, offset) - 1, 0)]
+
+    def wait(self, offset: int, timeout: Optional[float] = None) -> bool:
+        """Block until there's data after the offset or timeout
+
+        Returns:
+            bool: True if there's new data after the offset
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self.end_offset > offset, timeout)
+
+    def clear(self) -> None:
+        with self._cond:
+            self._base_offset = self.end_offset
+            self._data = bytearray()
+            self._line_offsets.clear()
+            self._line_times.clear()
+            self._line_pending = True
+
+
+class SpawnHistoryMixin:
+    """expect_history() of PortSpawn"""
+
+    # All received data with timestamps, for searching data already consumed by expect
+    history: Optional[LineHistory]
+    timeout: Optional[float]
+
+    def expect_history(
+        self, matcher: StreamMatcher, since: HistorySince = None, timeout: Optional[float] = -1
+    ) -> MatchResult:
+        """Search the session history from the position, then wait for new data until timeout.
+
+        The data is not consumed, pexpect buffer / before / after / match are not changed.
+
+        Args:
+            matcher (StreamMatcher): pattern matcher
+            since (HistoryMark | float | int, optional): mark, monotonic timestamp or byte offset, from the oldest
+                data in the history by default.
+            timeout (float, optional): -1 means using default timeout, None means no timeout. Defaults to -1.
+
+        Raises:
+            pexpect.TIMEOUT: pattern is not matched within timeout
+
+        Returns:
+            MatchResult: matched result, start / end are absolute offsets in the session, the positions of
+                ``match`` are relative to the first searched byte
+        """
+        history = self.history
+        assert history, 'History is disabled for this port'
+        if timeout == -1:
+            timeout = self.timeout
+        end_time = time.time() + timeout if timeout is not None else None
+        matcher.reset()
+        start, data = history.read(since)
+        buffer = bytearray(data)
+        end = start + len(buffer)
+        while True:
+            result = matcher.search(buffer)
+            if result:
+                return result._replace(start=start + result.start, end=start + result.end)
+            time_left = end_time - time.time() if end_time is not None else None
+            if time_left is not None and time_left <= 0:
+                break
+            if history.wait(end, time_left):
+                data_start, data = history.read(end)
+                if data_start > end:
+                    # trimmed before read, search again from the oldest data kept
+                    matcher.reset()
+                    start, buffer = data_start, bytearray(data)
+                else:
+                    buffer += data
+                end = data_start + len(data)
+        raise pexpect.TIMEOUT(f'Timeout exceeded after {timeout}s, {matcher} not found in history')
+
+
+class PortHistoryMixin:
+    """mark() / search_history() / history_lines() of BasePort, expect_since() is one of the expect methods"""
+
+    _pexpect_proc: Optional['PortSpawn']
+
+    def _to_matcher(self, pattern: Union[str, bytes, re.Pattern]) -> StreamMatcher:
+        raise NotImplementedError()
+
+    def mark(self) -> HistoryMark:
+        """Mark current position of the port output, for expect_since() / search_history() later"""
+        assert self._pexpect_proc and self._pexpect_proc.history, 'History is disabled, set HISTORY_SIZE to enable it'
+        return self._pexpect_proc.history.mark()
+
+    def search_history(
+        self, pattern: Union[str, bytes, re.Pattern], since: HistorySince = None
+    ) -> Optional[Union[str, bytes, re.Match]]:
+        """Search the pattern in the output received since the position, do not wait for new data.
+
+        Args:
+            pattern (Union[str, bytes, re.Pattern]): pattern to match
+            since (HistoryMark | float | int, optional): mark() result, monotonic timestamp or byte offset.
+                Defaults to the oldest data in the history.
+
+        Returns:
+            Optional[Union[str, bytes, re.Match]]: None if not found, the pattern itself for str/bytes patterns,
+                re.Match for regex patterns.
+        """
+        if not self._pexpect_proc or not self._pexpect_proc.history:
+            raise NotImplementedError()
+        try:
+            result = self._pexpect_proc.expect_history(self._to_matcher(pattern), since=since, timeout=0)
+        except pexpect.TIMEOUT:
+            return None
+        if isinstance(pattern, (bytes, str)):
+            return pattern
+        match: re.Match = to_str_match(pattern, result.match)
+        return match
+
+    def history_lines(self, since: HistorySince = None) -> List[Tuple[float, str]]:
+        """Received lines with monotonic receive time, since the position"""
+        if not self._pexpect_proc or not self._pexpect_proc.history:
+            return []
+        return [(t, to_str(line)) for t, line in self._pexpect_proc.history.lines(since)]
@@ -0,0 +1,234 @@
+import functools
+import os
+import queue
+import selectors
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..logger import get_logger
+
+logger = get_logger('port_hub')
+
+
+@dataclass
+class _HubPort:
+    port: Any
+    on_data: Callable[[bytes], None]
+    on_error: Callable[[Exception], None]
+    # None: polled with read_bytes()
+    fd: Optional[int] = None
+
+
+class _HubWorker:
+    """One reading thread of the hub, services many ports"""
+
+    # check if the worker is still alive while waiting for a command
+    COMMAND_CHECK_INTERVAL = 0.1
+
+    def __init__(self, name: str, poll_timeout: float) -> None:
+        self.name = name
+        self.poll_timeout = poll_timeout
+        self._ports: Dict[int, _HubPort] = {}
+        # (port id, _HubPort to add or None to remove, event set when done)
+        self._commands: queue.SimpleQueue[Optional[Tuple[int, Optional[_HubPort], threading.Event]]] = (
+            queue.SimpleQueue()
+        )
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wakeup_fds: Optional[Tuple[int, int]] = None
+        self._wakeup_event = threading.Event()
+        if os.name == 'posix':
+            self._selector = selectors.DefaultSelector()
+            self._wakeup_fds = os.pipe()
+            os.set_blocking(self._wakeup_fds[1], False)
+            self._selector.register(self._wakeup_fds[0], selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return len(self._ports) + self._commands.qsize()
+
+    def _wakeup(self) -> None:
+        self._wakeup_event.set()
+        if self._wakeup_fds:
+            try:
+                os.write(self._wakeup_fds[1], b'\0')
+            except BlockingIOError:
+                # the worker has not read the pipe yet, it will wake up anyway
+                pass
+
+    def _send(self, command: Optional[Tuple[int, Optional[_HubPort], threading.Event]]) -> None:
+        self._commands.put(command)
+        self._wakeup()
+
+    def add(self, hub_port: _HubPort) -> None:
+        self._send((id(hub_port.port), hub_port, threading.Event()))
+
+    def remove(self, port: Any) -> None:
+        """Remove the port, returns after the port will never be read by this worker"""
+        if threading.current_thread() is self._thread:
+            self._remove(id(port))
+            return
+        done = threading.Event()
+        self._send((id(port), None, done))
+        while not done.wait(self.COMMAND_CHECK_INTERVAL):
+            if not self._thread.is_alive():
+                # the worker stopped, the port is never read again
+                self._remove(id(port))
+                return
+
+    def stop(self) -> None:
+        if self._thread.is_alive():
+            self._send(None)
+            self._thread.join()
+
+    def _remove(self, port_id: int) -> None:
+        hub_port = self._ports.pop(port_id, None)
+        if hub_port and hub_port.fd is not None and self._selector:
+            self._selector.unregister(hub_port.fd)
+
+    def _handle_commands(self) -> bool:
+        """Returns False if the worker should stop"""
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return True
+            if command is None:
+                return False
+            port_id, hub_port, done = command
+            if hub_port:
+                self._ports[port_id] = hub_port
+                if hub_port.fd is not None and self._selector:
+                    self._selector.register(hub_port.fd, selectors.EVENT_READ, hub_port)
+            else:
+                self._remove(port_id)
+            done.set()
+
+    def _read(self, hub_port: _HubPort, read_func: Callable[[], bytes]) -> None:
+        try:
+            new_data = read_func()
+        except Exception as e:  # pylint: disable=W0718
+            self._remove(id(hub_port.port))
+            self._callback(hub_port, hub_port.on_error, e)
+            return
+        if new_data:
+            self._callback(hub_port, hub_port.on_data, new_data)
+
+    def _callback(self, hub_port: _HubPort, callback: Callable[[Any], None], arg: Any) -> None:
+        """One port's callback error should not stop reading the other ports of the worker"""
+        try:
+            callback(arg)
+        except Exception as e:  # pylint: disable=W0718
+            logger.exception(f'{self.name} callback of {hub_port.port!r} failed {type(e)}: {str(e)}')
+
+    def _wait_events(self, polled: bool) -> List[_HubPort]:
+        """Wait for readable ports or commands, do not block if some ports should be polled"""
+        timeout = 0 if polled else None
+        if not self._selector:
+            if not polled:
+                self._wakeup_event.wait()
+            self._wakeup_event.clear()
+            return []
+        ready = []
+        for key, _ in self._selector.select(timeout):
+            if key.data is None:
+                assert self._wakeup_fds
+                os.read(self._wakeup_fds[0], 4096)
+            else:
+                ready.append(key.data)
+        return ready
+
+    def _run(self) -> None:
+        logger.debug(f'Start port reader hub thread {self.name}.')
+        try:
+            while self._handle_commands():
+                polled = [p for p in self._ports.values() if p.fd is None]
+                for hub_port in self._wait_events(bool(polled)):
+                    self._read(hub_port, hub_port.port.read_available)
+                for hub_port in polled:
+                    if id(hub_port.port) in self._ports:
+                        self._read(hub_port, functools.partial(hub_port.port.read_bytes, timeout=self.poll_timeout))
+        finally:
+            if self._selector:
+                self._selector.close()
+            if self._wakeup_fds:
+                os.close(self._wakeup_fds[0])
+                os.close(self._wakeup_fds[1])
+                self._wakeup_fds = None
+            logger.debug(f'Stop port reader hub thread {self.name}.')
+
+
+class PortReaderHub:
+    """Read many ports from one thread or a small pool of threads, rather than one thread for each port.
+
+    Ports with ``fileno()`` and ``read_available()`` are waited with selectors (POSIX only), other ports are
+    polled round-robin with ``read_bytes(timeout=poll_timeout)``. New ports are added to the least loaded thread.
+
+    Callbacks are called in the hub thread, they should not block, otherwise all ports of the thread are blocked.
+    The 'block' buffer overflow policy of PortSpawn should not be used with the hub.
+
+    Example:
+        hub = PortReaderHub(workers=2)
+        BasePort.READER_HUB = hub  # all ports started after this are read by the hub
+    """
+
+    DEFAULT_POLL_TIMEOUT = 0.001
+
+    def __init__(self, workers: int = 1, poll_timeout: float = DEFAULT_POLL_TIMEOUT, name: str = 'PortReaderHub'):
+        """Create a hub, threads are started when ports are registered
+
+        Args:
+            workers (int, optional): maximum reading threads. Defaults to 1.
+            poll_timeout (float, optional): read timeout of polled ports. Defaults to 1ms.
+            name (str, optional): thread name prefix. Defaults to 'PortReaderHub'.
+        """
+        assert workers > 0
+        self.max_workers = workers
+        self.poll_timeout = poll_timeout
+        self.name = name
+        self._workers: List[_HubWorker] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(w) for w in self._workers)
+
+    @staticmethod
+    def _event_fd(port: Any) -> Optional[int]:
+        if os.name != 'posix':
+            return None
+        if not callable(getattr(port, 'fileno', None)) or not callable(getattr(port, 'read_available', None)):
+            return None
+        fd = port.fileno()
+        return fd if isinstance(fd, int) else None
+
+    def register(self, port: Any, on_data: Callable[[bytes], None], on_error: Callable[[Exception], None]) -> None:
+        """Start reading the port in the hub
+
+        Args:
+            port (RawPort): the port to read.
+            on_data (Callable[[bytes], None]): called with the new data.
+            on_error (Callable[[Exception], None]): called if reading raises, the port is unregistered before.
+        """
+        hub_port = _HubPort(port, on_data, on_error, self._event_fd(port))
+        with self._lock:
+            if len(self._workers) < self.max_workers and all(len(w) for w in self._workers):
+                self._workers.append(_HubWorker(f'{self.name}_{len(self._workers)}', self.poll_timeout))
+            worker = min(self._workers, key=len)
+            worker.add(hub_port)
+
+    def unregister(self, port: Any) -> None:
+        """Stop reading the port, the callbacks are never called after this returns"""
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            # command may be still pending in the worker queue, remove from all workers
+            worker.remove(port)
+
+    def close(self) -> None:
+        """Stop all reading threads"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
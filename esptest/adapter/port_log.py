@@ -0,0 +1,349 @@
+import codecs
+import glob
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Union
+
+from ..common import generate_timestamp
+from ..logger import get_logger, get_port_logger
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+LOGGER = get_logger('port_log')
+
+
+@dataclass
+class LogRotation:
+    """Log file rotation options
+
+    The current log file is renamed to ``<log_file>.<YYYYmmdd-HHMMSS>`` when it is larger than max_bytes or opened
+    for longer than interval seconds, then compressed in a background thread.
+    """
+
+    # rotate if the file is larger than this size, 0 to disable
+    max_bytes: int = 0
+    # rotate if the file was opened for longer than this time in seconds, 0 to disable
+    interval: float = 0
+    # keep at most this number of rotated files, 0 to keep all
+    backup_count: int = 0
+    # 'gzip', 'zstd' (requires zstandard) or None
+    compression: Optional[str] = 'gzip'
+
+    COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+    def __post_init__(self) -> None:
+        if self.compression and self.compression not in self.COMPRESSIONS:
+            raise ValueError(f'Unsupported log compression {self.compression}, should be one of {self.COMPRESSIONS}')
+        if self.compression == 'zstd' and zstandard is None:
+            LOGGER.warning('zstandard is not installed, compress rotated logs with gzip instead.')
+            self.compression = 'gzip'
+
+
+def compress_file(src: str, compression: str, chunk_size: int = 1024 * 1024) -> str:
+    """Compress the file chunk by chunk and remove the source file
+
+    Returns:
+        str: compressed file path
+    """
+    dst = src + LogRotation.COMPRESSIONS[compression]
+    with open(src, 'rb') as fr:
+        if compression == 'zstd':
+            assert zstandard, 'zstandard is not installed'
+            with open(dst, 'wb') as fw, zstandard.ZstdCompressor().stream_writer(fw) as writer:
+                shutil.copyfileobj(fr, writer, chunk_size)
+        else:
+            with gzip.open(dst, 'wb') as fw:
+                shutil.copyfileobj(fr, fw, chunk_size)
+    os.remove(src)
+    return dst
+
+
+class PortLogWriter:
+    """Save port outputs to the log file in a dedicated thread.
+
+    The port reading thread only puts the data into a queue, all other work is done in the writer thread:
+        - cache the last incomplete line, to make the file more readable after adding timestamp
+        - generate timestamp for each batch of lines
+        - keep the log file open, flush it when there's no more pending data, or on size / time thresholds
+
+    If log_file is not given, the outputs are logged with debug level by ``data_logger``, a child of the logger
+    named by the port. The data is only decoded if the level is enabled, multi-byte characters split between
+    writes are decoded incrementally. No thread is started for it, the data is logged in the caller thread without
+    caching the incomplete line, the log records have their own timestamps. The writer thread is started once a
+    log file is set.
+
+    With ``threaded=False``, data is written in the caller thread (eg: asyncio event loop), the caller should call
+    ``write(b'')`` after line_timeout to write the incomplete line.
+
+    With ``rotation``, the log file is rotated by size or time in the writer thread, rotated files are compressed in
+    another background thread.
+    """
+
+    DEFAULT_LINE_TIMEOUT = 0.025
+    DEFAULT_FLUSH_SIZE = 64 * 1024
+    DEFAULT_FLUSH_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        log_file: Optional[str] = None,
+        name: str = '',
+        logger: logging.Logger = LOGGER,
+        line_timeout: float = DEFAULT_LINE_TIMEOUT,
+        flush_size: int = DEFAULT_FLUSH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        threaded: bool = True,
+        rotation: Optional[LogRotation] = None,
+    ) -> None:
+        """Create the log writer, start the writer thread if there's a log file
+
+        Args:
+            log_file (str, optional): log file path. Defaults to None.
+            name (str, optional): port name. Defaults to ''.
+            logger (logging.Logger, optional): logger used if log_file is not given.
+            line_timeout (float, optional): write the incomplete line if no new data for a long time.
+            flush_size (int, optional): flush the file if more unflushed bytes than this. Defaults to 64KB.
+            flush_interval (float, optional): flush the file at least once in this interval. Defaults to 0.1s.
+            threaded (bool, optional): write the log file in a dedicated thread. Defaults to True.
+            rotation (LogRotation, optional): rotate and compress the log file. Defaults to None.
+        """
+        # pylint: disable=too-many-arguments
+        self.name = name
+        self.logger = logger
+        self.data_logger = get_port_logger(name, logger)
+        self.line_timeout = line_timeout
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.rotation = rotation
+
+        self._log_file = log_file
+        self._file: Optional[BinaryIO] = None
+        self._file_path = ''
+        self._file_size = 0
+        self._file_open_time = time.time()
+        # rotated files to compress, None: stop the thread
+        self._compress_queue: queue.SimpleQueue[Optional[str]] = queue.SimpleQueue()
+        self._compress_thread: Optional[threading.Thread] = None
+        self._line_cache = b''
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._unflushed_size = 0
+        self._last_data_time = time.time()
+        self._last_flush_time = time.time()
+        # None: stop the thread, str: change log file
+        self._queue: queue.SimpleQueue[Union[bytes, str, None]] = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._threaded = threaded
+        # writing in the caller thread, while the log file could be changed in another thread
+        self._lock = threading.Lock()
+        if threaded and log_file:
+            self._start_thread(log_file)
+        else:
+            self._open_file(log_file or '')
+
+    def _start_thread(self, log_file: str) -> None:
+        self._queue.put(log_file)
+        self._thread = threading.Thread(target=self._run, name=f'LogWriter_{self.name}')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def log_file(self) -> Optional[str]:
+        return self._log_file
+
+    @log_file.setter
+    def log_file(self, new_log_file: Optional[str]) -> None:
+        """Change log file, the data already received are written to the old file."""
+        self._log_file = new_log_file
+        with self._lock:
+            if self._thread:
+                self._queue.put(new_log_file or '')
+                return
+            self._write_lines(b'', flush_line_cache=True)
+            self._close_file()
+            if self._threaded and new_log_file:
+                self._start_thread(new_log_file)
+            else:
+                self._open_file(new_log_file or '')
+
+    @property
+    def queue_depth(self) -> int:
+        """Data chunks waiting to be written by the writer thread"""
+        return self._queue.qsize()
+
+    def write(self, data: bytes) -> None:
+        """Called by the port reading thread, never blocks"""
+        if not self._thread:
+            with self._lock:
+                # check again, the thread could be started by setting the log file
+                if not self._thread:
+                    self._write_lines(data, flush_line_cache=not self._file)
+                    self._flush(idle=True)
+                    return
+        if data:
+            self._queue.put(data)
+
+    def close(self) -> None:
+        """Write all pending data, close the log file and stop the writer thread."""
+        if not self._thread:
+            with self._lock:
+                self._write_lines(b'', flush_line_cache=True)
+                self._close_file()
+        elif self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._compress_thread:
+            # wait for compressing the rotated files
+            self._compress_queue.put(None)
+            self._compress_thread.join()
+            self._compress_thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.line_timeout if self._line_cache else None)
+            except queue.Empty:
+                item = b''
+            batch: List[bytes] = []
+            batch_size = 0
+            # Take pending data and write them at once
+            while True:
+                if item is None or isinstance(item, str):
+                    self._write_lines(b''.join(batch), flush_line_cache=True)
+                    batch, batch_size = [], 0
+                    self._close_file()
+                    if item is None:
+                        return
+                    self._open_file(item)
+                elif item:
+                    batch.append(item)
+                    batch_size += len(item)
+                if batch_size >= self.flush_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write_lines(b''.join(batch))
+            # flush immediately if there's no pending data
+            self._flush(idle=self._queue.empty())
+
+    def _open_file(self, log_file: str) -> None:
+        if not log_file:
+            return
+        try:
+            self._file = open(log_file, 'ab')  # pylint: disable=consider-using-with
+        except OSError as e:
+            self.logger.error(f'Failed to open {self.name} log file {log_file}: {str(e)}')
+            return
+        self._file_path = log_file
+        self._file_size = self._file.tell()
+        self._file_open_time = time.time()
+
+    def _close_file(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._unflushed_size = 0
+
+    def _should_rotate(self) -> bool:
+        if not self.rotation or not self._file:
+            return False
+        if self.rotation.max_bytes and self._file_size >= self.rotation.max_bytes:
+            return True
+        return bool(self.rotation.interval) and time.time() - self._file_open_time >= self.rotation.interval
+
+    def _rotate(self) -> None:
+        """Rename current file with timestamp and open a new one, compress the old one in background"""
+        assert self.rotation
+        path = self._file_path
+        self._close_file()
+        rotated = f'{path}.{time.strftime("%Y%m%d-%H%M%S")}'
+        index = 1
+        while glob.glob(glob.escape(rotated) + '*'):
+            rotated = f'{path}.{time.strftime("%Y%m%d-%H%M%S")}.{index}'
+            index += 1
+        try:
+            os.rename(path, rotated)
+        except OSError as e:
+            self.logger.error(f'Failed to rotate {self.name} log file {path}: {str(e)}')
+        else:
+            if not self._compress_thread:
+                self._compress_thread = threading.Thread(target=self._run_compress, name=f'LogCompress_{self.name}')
+                self._compress_thread.daemon = True
+                self._compress_thread.start()
+            self._compress_queue.put(rotated)
+        self._open_file(path)
+
+    def _run_compress(self) -> None:
+        while True:
+            rotated = self._compress_queue.get()
+            if rotated is None:
+                return
+            assert self.rotation
+            if self.rotation.compression:
+                try:
+                    compress_file(rotated, self.rotation.compression)
+                except OSError as e:
+                    self.logger.error(f'Failed to compress {self.name} log file {rotated}: {str(e)}')
+            self._remove_old_backups()
+
+    def _remove_old_backups(self) -> None:
+        assert self.rotation
+        if not self.rotation.backup_count or not self._file_path:
+            return
+        backups = []
+        for path in glob.glob(glob.escape(self._file_path) + '.[0-9]*'):
+            try:
+                backups.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        for _, path in sorted(backups)[: -self.rotation.backup_count]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.warning(f'Failed to remove old log file {path}: {str(e)}')
+
+    def _flush(self, idle: bool = False) -> None:
+        if not self._file or not self._unflushed_size:
+            return
+        flush_timeout = time.time() - self._last_flush_time >= self.flush_interval
+        if idle or flush_timeout or self._unflushed_size >= self.flush_size:
+            self._file.flush()
+            self._unflushed_size = 0
+            self._last_flush_time = time.time()
+
+    def _write_lines(self, data: bytes, flush_line_cache: bool = False) -> None:
+        data_to_write = b''
+        if data:
+            self._last_data_time = time.time()
+            self._line_cache += data
+            _index = self._line_cache.rfind(b'\n') + 1
+            data_to_write = self._line_cache[:_index]
+            self._line_cache = self._line_cache[_index:]
+        if self._line_cache and (flush_line_cache or time.time() - self._last_data_time >= self.line_timeout):
+            # No new data for a long time, write the incomplete line
+            data_to_write += self._line_cache
+            self._line_cache = b''
+        if not data_to_write:
+            return
+        if self._file:
+            header = f'\n[{generate_timestamp()}]\n'.encode()
+            self._file.write(header)
+            self._file.write(data_to_write)
+            self._unflushed_size += len(data_to_write)
+            self._file_size += len(header) + len(data_to_write)
+            if self._should_rotate():
+                self._rotate()
+        elif self.data_logger.isEnabledFor(logging.DEBUG):
+            self.data_logger.debug('[%s]: %s', self.name, self._decoder.decode(data_to_write))
+        else:
+            # do not decode the rest of a character logged before the level changed
+            self._decoder.reset()
@@ -0,0 +1,265 @@
+import bisect
+import collections
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from ..logger import get_logger
+
+if TYPE_CHECKING:
+    from .base_port import PortSpawn
+
+LOGGER = get_logger('port_metrics')
+
+MetricsHook = Callable[[str, Dict[str, Any]], None]
+
+
+class LatencyHistogram:
+    """Histogram of durations in seconds with fixed bucket upper bounds"""
+
+    # 100us ~ 60s, the last bucket counts everything larger
+    DEFAULT_BOUNDS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS) -> None:
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.min = min(self.min, value) if self.count else value
+        self.max = max(self.max, value)
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f'<={b}' for b in self.bounds] + [f'>{self.bounds[-1]}']
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class PortMetrics:
+    """Live metrics of one port, updated by the reading thread and expect methods.
+
+    - rx: total bytes / reads, bytes per second in the recent ``rate_window`` seconds
+    - read loop: histogram of the time of one reading iteration (read + buffer / callback / log)
+    - expect: histograms of wait time for each pattern, split to matched, timeout and cancelled
+    - gauges: values read when taking a snapshot, eg: receive buffer size, log queue depth
+    """
+
+    DEFAULT_RATE_WINDOW = 1.0
+    # Label of expect patterns are truncated to this length
+    MAX_LABEL_LENGTH = 100
+    # Dynamic patterns (eg: sequence numbers, IP addresses) would create a histogram for each expect
+    MAX_LABELS = 64
+    OTHER_LABEL = 'other'
+
+    def __init__(
+        self,
+        gauges: Optional[Dict[str, Callable[[], Any]]] = None,
+        rate_window: float = DEFAULT_RATE_WINDOW,
+    ) -> None:
+        self.gauges: Dict[str, Callable[[], Any]] = gauges or {}
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self._rx_bytes = 0
+        self._rx_reads = 0
+        # (timestamp, bytes) in the recent rate window
+        self._rx_history: Deque[Tuple[float, int]] = collections.deque()
+        self._read_loop = LatencyHistogram()
+        self._last_read_loop = 0.0
+        self._expect_matched: Dict[str, LatencyHistogram] = collections.defaultdict(LatencyHistogram)
+        self._expect_timeout: Dict[str, LatencyHistogram] = collections.defaultdict(LatencyHistogram)
+        self._expect_cancelled: Dict[str, LatencyHistogram] = collections.defaultdict(LatencyHistogram)
+
+    def record_rx(self, size: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._rx_bytes += size
+            self._rx_reads += 1
+            self._rx_history.append((now, size))
+            self._prune_history(now)
+
+    def record_read_loop(self, duration: float) -> None:
+        with self._lock:
+            self._read_loop.observe(duration)
+            self._last_read_loop = duration
+
+    def record_expect(self, label: str, duration: float, matched: bool = True, cancelled: bool = False) -> None:
+        """Record the wait time of an expect, patterns after the first ``MAX_LABELS`` ones are counted as ``other``"""
+        label = label[: self.MAX_LABEL_LENGTH]
+        if matched:
+            histograms = self._expect_matched
+        elif cancelled:
+            histograms = self._expect_cancelled
+        else:
+            histograms = self._expect_timeout
+        with self._lock:
+            if label not in histograms and len(histograms) >= self.MAX_LABELS:
+                label = self.OTHER_LABEL
+            histograms[label].observe(duration)
+
+    def _prune_history(self, now: float) -> None:
+        while self._rx_history and now - self._rx_history[0][0] > self.rate_window:
+            self._rx_history.popleft()
+
+    @property
+    def rx_bytes_per_second(self) -> float:
+        with self._lock:
+            self._prune_history(time.time())
+            return sum(size for _, size in self._rx_history) / self.rate_window
+
+    def reset(self) -> None:
+        with self._lock:
+            self._start_time = time.time()
+            self._rx_bytes = 0
+            self._rx_reads = 0
+            self._rx_history.clear()
+            self._read_loop = LatencyHistogram()
+            self._last_read_loop = 0.0
+            self._expect_matched.clear()
+            self._expect_timeout.clear()
+            self._expect_cancelled.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns all metrics as a dict, could be dumped to json directly"""
+        rx_bytes_per_second = self.rx_bytes_per_second
+        with self._lock:
+            data: Dict[str, Any] = {
+                'uptime': time.time() - self._start_time,
+                'rx_bytes': self._rx_bytes,
+                'rx_reads': self._rx_reads,
+                'rx_bytes_per_second': rx_bytes_per_second,
+                'read_loop': dict(self._read_loop.to_dict(), last=self._last_read_loop),
+                'expect': {
+                    'matched': {k: v.to_dict() for k, v in self._expect_matched.items()},
+                    'timeout': {k: v.to_dict() for k, v in self._expect_timeout.items()},
+                    'cancelled': {k: v.to_dict() for k, v in self._expect_cancelled.items()},
+                },
+            }
+        for name, gauge in self.gauges.items():
+            try:
+                data[name] = gauge()
+            except Exception as e:  # pylint: disable=W0718
+                LOGGER.debug(f'Failed to read gauge {name}: {str(e)}')
+        return data
+
+
+class MetricsReporter:
+    """Call the hook with metrics snapshots of ports periodically in a thread.
+
+    The default hook logs the snapshot with the logger in info level.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        hook: Optional[MetricsHook] = None,
+        logger: logging.Logger = LOGGER,
+    ) -> None:
+        self.interval = interval
+        self.hook = hook or self._log_metrics
+        self.logger = logger
+        self._sources: List[Tuple[str, PortMetrics]] = []
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _log_metrics(self, name: str, metrics: Dict[str, Any]) -> None:
+        expect = metrics['expect']
+        self.logger.info(
+            f'[{name}] rx: {metrics["rx_bytes"]} bytes, {metrics["rx_bytes_per_second"]:.0f} B/s, '
+            f'read loop: {metrics["read_loop"]["mean"] * 1000:.3f}ms avg, {metrics["read_loop"]["max"] * 1000:.3f}ms '
+            f'max, expect: {len(expect["matched"])} matched / {len(expect["timeout"])} timeout patterns, '
+            f'buffer: {metrics.get("buffer_size", 0)} bytes, log queue: {metrics.get("log_queue_depth", 0)}'
+        )
+
+    def add(self, name: str, metrics: PortMetrics) -> None:
+        self._sources.append((name, metrics))
+
+    def report(self) -> None:
+        for name, metrics in list(self._sources):
+            try:
+                self.hook(name, metrics.snapshot())
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.warning(f'Metrics hook failed for {name}: {str(e)}')
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='MetricsReporter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+class PortMetricsMixin:
+    """Metrics of the pexpect process of BasePort"""
+
+    name: str
+    logger: logging.Logger
+    _pexpect_proc: Optional['PortSpawn']
+    _metrics_reporter: Optional[MetricsReporter] = None
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """Live metrics of the port: rx rate, read loop time, buffer size, log queue depth and expect wait time.
+
+        Returns:
+            Dict[str, Any]: metrics dict, empty if the pexpect process is not started
+        """
+        if not self._pexpect_proc:
+            return {}
+        return self._pexpect_proc.metrics.snapshot()
+
+    def start_metrics_report(self, interval: float = 10, hook: Optional[MetricsHook] = None) -> None:
+        """Report metrics snapshot periodically until the port is closed
+
+        Args:
+            interval (float, optional): report interval in seconds. Defaults to 10.
+            hook (Callable[[str, Dict], None], optional): called with port name and metrics snapshot,
+                log the metrics with the port logger by default.
+        """
+        if not self._pexpect_proc:
+            return
+        self.stop_metrics_report()
+        self._metrics_reporter = MetricsReporter(interval, hook, self.logger)
+        self._metrics_reporter.add(self.name, self._pexpect_proc.metrics)
+        self._metrics_reporter.start()
+
+    def stop_metrics_report(self) -> None:
+        if self._metrics_reporter:
+            self._metrics_reporter.stop()
+            self._metrics_reporter = None
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Bytes dropped by the receive buffer of current pexpect process"""
+        return self._pexpect_proc.dropped_bytes if self._pexpect_proc else 0
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Bytes spilled to file by the receive buffer of current pexpect process"""
+        return self._pexpect_proc.spilled_bytes if self._pexpect_proc else 0
@@ -0,0 +1,164 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Sequence, Tuple, Union
+
+from ..common import to_bytes
+from ..logger import get_logger
+from .matcher import MultiMatcher, to_bytes_pattern, to_str_match
+
+if TYPE_CHECKING:
+    from .base_port import PortSpawn
+
+logger = get_logger('port_watch')
+
+# (port name, watcher, match result), match result is the pattern for str / bytes patterns, re.Match for regex
+WatcherCallback = Callable[[str, 'Watcher', Any], None]
+
+
+@dataclass(eq=False)
+class Watcher:
+    """An always-on pattern watcher of the port output"""
+
+    pattern: Union[str, bytes, re.Pattern]
+    callback: Optional[WatcherCallback] = None
+    # fail the pending (or next) expect immediately when matched
+    fail_expect: bool = False
+    hits: int = field(default=0, init=False)
+
+
+class WatcherSet:
+    """Scan each received chunk once for all watchers.
+
+    All patterns are joined into one regex alternation (see ``MultiMatcher``), matches are reported in stream
+    order. The unmatched end of the data is kept for the matches across chunks: ``window`` bytes if there are
+    regex watchers, otherwise the longest str / bytes pattern.
+    """
+
+    DEFAULT_WINDOW = 1024
+
+    def __init__(self, watchers: Sequence[Watcher], window: int = DEFAULT_WINDOW) -> None:
+        assert watchers, 'at least one watcher is required'
+        self.watchers = list(watchers)
+        patterns = [
+            to_bytes(w.pattern) if isinstance(w.pattern, (str, bytes)) else to_bytes_pattern(w.pattern)
+            for w in self.watchers
+        ]
+        if all(isinstance(p, bytes) for p in patterns):
+            window = max(len(p) for p in patterns) - 1  # type: ignore
+        self.window = window
+        self._matcher = MultiMatcher(patterns, window)
+        # data after the last match, not longer than window
+        self._tail = b''
+
+    def feed(self, data: bytes) -> List[Tuple[Watcher, Any]]:
+        """Scan the new chunk
+
+        Returns:
+            List[Tuple[Watcher, Any]]: matched watchers and match results, the match result is the pattern for
+                str / bytes patterns, re.Match for regex patterns
+        """
+        results: List[Tuple[Watcher, Any]] = []
+        # never modify the searched data in place, re.Match objects refer to it
+        buffer = self._tail + data
+        while True:
+            self._matcher.reset()
+            result = self._matcher.search(buffer)
+            if not result:
+                break
+            watcher = self.watchers[result.pattern_index]
+            if isinstance(watcher.pattern, re.Pattern):
+                results.append((watcher, to_str_match(watcher.pattern, result.match)))
+            else:
+                results.append((watcher, watcher.pattern))
+            # search after the match, do not report the same data again, skip one byte for empty matches
+            buffer = buffer[result.end if result.end > result.start else result.end + 1 :]
+        self._tail = buffer[max(len(buffer) - self.window, 0) :] if self.window else b''
+        for watcher, _ in results:
+            watcher.hits += 1
+        return results
+
+
+class SpawnWatchMixin:
+    """Watchers of PortSpawn, each received chunk is scanned once for all watchers in the reading thread"""
+
+    name: str
+    logger: logging.Logger
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._watchers: Optional[WatcherSet] = None
+        self._watchers_lock = threading.Lock()
+        # the watcher matched with fail_expect, raised by the pending or next expect
+        self._watch_failure: Optional[Tuple[Watcher, Any]] = None
+
+    def add_watcher(self, watcher: Watcher) -> None:
+        with self._watchers_lock:
+            watchers = self._watchers.watchers if self._watchers else []
+            self._watchers = WatcherSet(watchers + [watcher])
+
+    def remove_watcher(self, watcher: Watcher) -> None:
+        with self._watchers_lock:
+            watchers = [w for w in self._watchers.watchers if w is not watcher] if self._watchers else []
+            self._watchers = WatcherSet(watchers) if watchers else None
+
+    def _feed_watchers(self, new_data: bytes) -> None:
+        watchers = self._watchers
+        if not watchers:
+            return
+        try:
+            matched = watchers.feed(new_data)
+        except Exception as e:  # pylint: disable=W0718
+            # the data still goes to expect
+            self.logger.exception(f'{self.name} watchers failed {type(e)}: {str(e)}')
+            return
+        for watcher, match in matched:
+            self._on_watcher_matched(watcher, match)
+
+    def _on_watcher_matched(self, watcher: Watcher, match: Any) -> None:
+        self.logger.warning(f'[{self.name}] watcher matched: {watcher.pattern!r}')
+        if watcher.fail_expect:
+            self._watch_failure = (watcher, match)
+        if watcher.callback:
+            try:
+                watcher.callback(self.name, watcher, match)
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.warning(f'[{self.name}] watcher callback failed: {str(e)}')
+
+
+class PortWatchMixin:
+    """add_watcher() / remove_watcher() of BasePort"""
+
+    _pexpect_proc: Optional['PortSpawn']
+
+    def add_watcher(
+        self,
+        pattern: Union[str, bytes, re.Pattern],
+        callback: Optional[WatcherCallback] = None,
+        fail_expect: bool = False,
+    ) -> Watcher:
+        """Watch the pattern in all received data, eg: 'Guru Meditation', 'abort()', 'rst:0x'.
+
+        Each received chunk is scanned once for all watchers in the reading thread, no matter how many expect() are
+        called. The callback is called in the reading thread and should return quickly.
+
+        Args:
+            pattern (Union[str, bytes, re.Pattern]): pattern to watch
+            callback (Callable[[str, Watcher, Any], None], optional): called with port name, the watcher and the
+                match result (the pattern for str / bytes, re.Match for regex). Defaults to None.
+            fail_expect (bool, optional): raise WatcherTriggered from the pending expect, or the next one if no
+                expect is pending, instead of waiting for the timeout. Defaults to False.
+
+        Returns:
+            Watcher: the watcher, ``hits`` counts the matches
+        """
+        if not self._pexpect_proc:
+            raise NotImplementedError()
+        watcher = Watcher(pattern, callback, fail_expect)
+        self._pexpect_proc.add_watcher(watcher)
+        return watcher
+
+    def remove_watcher(self, watcher: Watcher) -> None:
+        if self._pexpect_proc:
+            self._pexpect_proc.remove_watcher(watcher)
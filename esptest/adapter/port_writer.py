@@ -0,0 +1,139 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Deque, Optional, Tuple
+
+from ..logger import get_logger
+
+logger = get_logger('port_writer')
+
+
+@dataclass
+class WritePacing:
+    """Split written data into chunks, ESP console drops the data if its RX buffer is full.
+
+    - ``interval``: seconds to wait after each chunk
+    - ``echo_timeout``: wait for the echo of each chunk before writing the next one (echo-based flow control),
+      continue with a warning if the echo is not received in time. None to disable.
+    """
+
+    chunk_size: int = 64
+    interval: float = 0.005
+    echo_timeout: Optional[float] = None
+
+
+class PortWriter:
+    """Write data to the port in a dedicated thread, in order, chunk by chunk.
+
+    ``write()`` never blocks, the returned future is done after the last chunk is written, the result is the size
+    of written data. If writing fails, the future gets the exception and the writer continues with the next data.
+    """
+
+    # received bytes kept for matching the echo
+    ECHO_WINDOW = 4096
+
+    def __init__(
+        self, write_func: Callable[[bytes], None], pacing: Optional[WritePacing] = None, name: str = ''
+    ) -> None:
+        self.write_func = write_func
+        self.pacing = pacing
+        self.name = name
+        self.echo_timeouts = 0
+        self._queue: Deque[Tuple[bytes, 'Future[int]']] = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        # chunk waiting for the echo, and the data received after it was written
+        self._echo_pending: Optional[bytes] = None
+        self._echo_data = b''
+        self._echo_cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f'Writer_{name}')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Writes not finished yet"""
+        return len(self._queue)
+
+    def write(self, data: bytes) -> 'Future[int]':
+        future: 'Future[int]' = Future()
+        with self._cond:
+            if self._closed:
+                future.set_exception(RuntimeError(f'{self.name} writer is closed'))
+                return future
+            self._queue.append((data, future))
+            self._cond.notify()
+        return future
+
+    def feed_echo(self, data: bytes) -> None:
+        """Called with received data by the port reading thread"""
+        if self._echo_pending is None:
+            return
+        with self._echo_cond:
+            self._echo_data = (self._echo_data + data)[-self.ECHO_WINDOW :]
+            self._echo_cond.notify()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop after the pending writes are finished"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        with self._echo_cond:
+            self._echo_cond.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _wait_echo(self, chunk: bytes, timeout: float) -> None:
+        # console may echo '\n' as '\r\n', match the chunk content only
+        expected = chunk.strip(b'\r\n')
+        end_time = time.monotonic() + timeout
+        with self._echo_cond:
+            while expected not in self._echo_data and not self._closed:
+                time_left = end_time - time.monotonic()
+                if time_left <= 0:
+                    self.echo_timeouts += 1
+                    logger.warning(f'{self.name} echo of {chunk!r} not received in {timeout}s')
+                    break
+                self._echo_cond.wait(time_left)
+            self._echo_pending = None
+            self._echo_data = b''
+
+    def _write_chunks(self, data: bytes) -> None:
+        if not self.pacing:
+            self.write_func(data)
+            return
+        chunk_size = self.pacing.chunk_size
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset : offset + chunk_size]
+            echo_timeout = self.pacing.echo_timeout
+            if echo_timeout is not None and chunk.strip(b'\r\n'):
+                with self._echo_cond:
+                    self._echo_pending = chunk
+                    self._echo_data = b''
+                self.write_func(chunk)
+                self._wait_echo(chunk, echo_timeout)
+            else:
+                self.write_func(chunk)
+            if self.pacing.interval and offset + chunk_size < len(data):
+                time.sleep(self.pacing.interval)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                data, future = self._queue[0]
+            if future.set_running_or_notify_cancel():
+                try:
+                    self._write_chunks(data)
+                except Exception as e:  # pylint: disable=W0718
+                    logger.warning(f'{self.name} failed to write {len(data)} bytes: {str(e)}')
+                    future.set_exception(e)
+                else:
+                    future.set_result(len(data))
+            with self._cond:
+                self._queue.popleft()
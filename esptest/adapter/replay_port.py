@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from ..logger import get_logger
+from .port_capture import DIRECTION_READ, CaptureReader
+
+logger = get_logger('replay_port')
+
+# (seconds from the beginning, data)
+ReplaySegment = Tuple[float, bytes]
+
+# header written by PortLogWriter for each batch of lines
+_LOG_HEADER_RE = re.compile(rb'\n\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6})\]\n')
+# header written by BasePort when opening the log file
+_LOG_FILE_HEADER = b'--------- Saving '
+
+
+class ReplayReply(NamedTuple):
+    """Scripted reply, the segments are scheduled from the time the trigger is written to the port"""
+
+    trigger: Union[bytes, 're.Pattern[bytes]']
+    segments: Sequence[ReplaySegment]
+    # only reply to the first matched write
+    once: bool = False
+
+
+class ReplayPort:
+    """RawPort replays a saved session through read_bytes(), with the original or accelerated timing.
+
+    - ``speed=1``: original timing; ``speed=N``: N times faster; ``speed=0``: as fast as possible.
+    - The timeline starts from the first read, or from ``start()``.
+    - Data written by ``write_bytes()`` is saved in ``written``, and triggers the scripted replies.
+
+    Example:
+        port = ReplayPort.from_capture('dut.log.espcap', speed=10)
+        with BasePort(port, 'replay') as dut:
+            dut.expect('wifi:connected', timeout=5)
+    """
+
+    FASTEST = 0.0
+    DEFAULT_READ_TIMEOUT = 0.005
+
+    def __init__(
+        self,
+        segments: Sequence[ReplaySegment],
+        speed: float = 1.0,
+        replies: Sequence[ReplayReply] = (),
+        name: str = 'ReplayPort',
+    ) -> None:
+        """Create a replay port
+
+        Args:
+            segments (Sequence[Tuple[float, bytes]]): data and the time in seconds from the beginning.
+            speed (float, optional): replay speed, 0 means as fast as possible. Defaults to 1.0.
+            replies (Sequence[ReplayReply], optional): scripted replies for written data. Defaults to ().
+            name (str, optional): port name. Defaults to 'ReplayPort'.
+        """
+        assert speed >= 0
+        self.name = name
+        self.speed = speed
+        self.replies = list(replies)
+        self.written = b''
+        self._counter = itertools.count()
+        # (due time relative to start, sequence, data)
+        self._pending: List[Tuple[float, int, bytes]] = []
+        for offset, data in segments:
+            self._schedule(offset, data)
+        self._start_time: Optional[float] = None
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_capture(cls, capture_file: str, speed: float = 1.0, **kwargs) -> 'ReplayPort':  # type: ignore
+        """Replay the received chunks of a capture file written by CaptureWriter"""
+        with CaptureReader(capture_file) as reader:
+            records = list(reader.records(direction=DIRECTION_READ))
+        if not records:
+            return cls([], speed, **kwargs)
+        t0 = records[0].timestamp_ns
+        return cls([((r.timestamp_ns - t0) / 1e9, bytes(r.data)) for r in records], speed, **kwargs)
+
+    @classmethod
+    def from_log(cls, log_file: str, speed: float = 1.0, **kwargs) -> 'ReplayPort':  # type: ignore
+        """Replay a text log written by PortLogWriter, the timing comes from the timestamp headers"""
+        with open(log_file, 'rb') as f:
+            return cls(cls.parse_log(f.read()), speed, **kwargs)
+
+    @staticmethod
+    def parse_log(data: bytes) -> List[ReplaySegment]:
+        """Split the text log into timed segments by the timestamp headers"""
+        parts = _LOG_HEADER_RE.split(data)
+        segments = []
+        head = b''.join(line for line in parts[0].splitlines(True) if not line.startswith(_LOG_FILE_HEADER))
+        if head:
+            segments.append((0.0, head))
+        t0 = None
+        for timestamp, text in zip(parts[1::2], parts[2::2]):
+            dt = datetime.strptime(timestamp.decode(), '%Y-%m-%d %H:%M:%S.%f').timestamp()
+            if t0 is None:
+                t0 = dt
+            if text:
+                segments.append((max(dt - t0, 0), text))
+        return segments
+
+    @property
+    def read_timeout(self) -> float:
+        # For PortSpawn
+        return self.DEFAULT_READ_TIMEOUT
+
+    @property
+    def finished(self) -> bool:
+        """All segments and triggered replies have been read"""
+        with self._cond:
+            return not self._pending
+
+    def _schedule(self, offset: float, data: bytes) -> None:
+        if data:
+            heapq.heappush(self._pending, (offset, next(self._counter), data))
+
+    def _now(self) -> float:
+        """Time on the replay timeline"""
+        if self._start_time is None:
+            self._start_time = time.perf_counter()
+        elapsed = time.perf_counter() - self._start_time
+        return elapsed * self.speed if self.speed else float('inf')
+
+    def start(self) -> None:
+        """Start the timeline, otherwise it starts from the first read"""
+        with self._cond:
+            self._now()
+
+    def read_bytes(self, timeout: float = DEFAULT_READ_TIMEOUT) -> bytes:
+        """Return all data due now, or wait for the next segment until timeout"""
+        end_time = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = self._now()
+                chunks = []
+                while self._pending and self._pending[0][0] <= now:
+                    chunks.append(heapq.heappop(self._pending)[2])
+                if chunks:
+                    return b''.join(chunks)
+                time_left = end_time - time.perf_counter()
+                if time_left <= 0:
+                    return b''
+                if self._pending:
+                    time_left = min(time_left, (self._pending[0][0] - now) / self.speed)
+                self._cond.wait(time_left)
+
+    def write_bytes(self, data: bytes) -> None:
+        with self._cond:
+            self.written += data
+            now = self._now() if self.speed else 0.0
+            for reply in list(self.replies):
+                trigger = reply.trigger
+                if isinstance(trigger, bytes):
+                    matched = trigger in data
+                else:
+                    matched = bool(trigger.search(data))
+                if not matched:
+                    continue
+                logger.debug(f'{self.name} reply to {data!r}')
+                for offset, segment in reply.segments:
+                    self._schedule(now + offset, segment)
+                if reply.once:
+                    self.replies.remove(reply)
+            self._cond.notify_all()
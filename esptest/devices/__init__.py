@@ -1,2 +1,3 @@
+from .port_inventory import SerialPortInventory, get_inventory  # noqa: F401
 from .serial_dut import SerialDut  # noqa: F401
 from .serial_tools import get_all_serial_ports  # noqa: F401
@@ -17,7 +17,7 @@ from serial.tools.list_ports_common import ListPortInfo
 
 from ..common.decorators import deprecated
 from ..logger import get_logger
-from .serial_tools import get_all_serial_ports
+from .port_inventory import get_inventory
 
 logger = get_logger('devices')
 
@@ -90,17 +90,17 @@ class SerialAttDev(AttDevice):
         cls,
         device: Optional[str] = None,
     ) -> ListPortInfo:
-        port_info_list = get_all_serial_ports()
-        for p_info in port_info_list:
-            if device and device in (p_info.device, p_info.name, p_info.location):
-                return p_info
-        for p_info in port_info_list:
-            if any(
-                p_info.vid == _id['vid'] and p_info.pid == _id['pid']
-                for _typ, _id in ATT_ID_INFO.items()
-                if _typ in cls.SUPPORTED_TYPES
-            ):
+        inventory = get_inventory()
+        if device:
+            p_info = inventory.find(device)
+            if p_info and p_info.location:
                 return p_info
+        for _typ, _id in ATT_ID_INFO.items():
+            if _typ not in cls.SUPPORTED_TYPES:
+                continue
+            for p_info in inventory.by_vid_pid(_id['vid'], _id['pid']):
+                if p_info.location:
+                    return p_info
         raise AttenuatorError(f'Failed to get serial att port info with: device={device}')
 
     @contextmanager
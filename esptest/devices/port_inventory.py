@@ -0,0 +1,265 @@
+import glob
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import serial.tools.list_ports
+from serial.tools import list_ports_common
+from serial.tools.list_ports_common import ListPortInfo
+
+from ..logger import get_logger
+
+try:
+    import pyudev  # type: ignore
+except ImportError:
+    pyudev = None
+
+logger = get_logger('devices')
+
+# (added ports, removed ports)
+InventoryListener = Callable[[List[ListPortInfo], List[ListPortInfo]], None]
+
+
+class SerialPortInventory:
+    """Serial ports indexed by device, name, USB location, serial number and VID/PID.
+
+    The inventory is refreshed:
+        - from udev tty events if ``pyudev`` is installed (Linux), the ports are rescanned only after changes.
+        - otherwise when the last scan is older than ``ttl`` seconds.
+
+    On Linux, a rescan only reads the sysfs information of new or re-created device nodes, unchanged ports are
+    kept. On other platforms, all ports are listed by ``serial.tools.list_ports.comports()``.
+    """
+
+    DEFAULT_TTL = 5.0
+    # Same as pyserial list_ports_linux
+    SYSFS_PATTERNS: Sequence[str] = (
+        '/dev/ttyS*',
+        '/dev/ttyUSB*',
+        '/dev/ttyXRUSB*',
+        '/dev/ttyACM*',
+        '/dev/ttyAMA*',
+        '/dev/rfcomm*',
+        '/dev/ttyAP*',
+    )
+
+    def __init__(
+        self, ttl: float = DEFAULT_TTL, include_links: bool = False, use_udev: bool = True, incremental: bool = True
+    ) -> None:
+        """Create the inventory, ports are scanned on the first access
+
+        Args:
+            ttl (float, optional): rescan if the last scan is older than this, if udev is not used. Defaults to 5s.
+            include_links (bool, optional): include symlinks under /dev, eg: /dev/serial/by-id/*. Defaults to False.
+            use_udev (bool, optional): rescan only after udev tty events if pyudev is available. Defaults to True.
+            incremental (bool, optional): only read sysfs of new or changed devices on Linux. Defaults to True.
+        """
+        self.ttl = ttl
+        self.include_links = include_links
+        self.incremental = incremental and sys.platform.startswith('linux')
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._listeners: List[InventoryListener] = []
+        # device: (device node signature, port info)
+        self._ports: Dict[str, Tuple[Any, ListPortInfo]] = {}
+        self._by_name: Dict[str, ListPortInfo] = {}
+        self._by_location: Dict[str, ListPortInfo] = {}
+        self._by_serial_number: Dict[str, List[ListPortInfo]] = {}
+        self._by_vid_pid: Dict[Tuple[int, int], List[ListPortInfo]] = {}
+        self._scan_time: Optional[float] = None
+        self._observer: Any = None
+        if use_udev and pyudev is not None and sys.platform.startswith('linux'):
+            self._start_udev_observer()
+
+    def _start_udev_observer(self) -> None:
+        assert pyudev
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            self._observer = pyudev.MonitorObserver(monitor, callback=self._on_udev_event, name='PortInventoryUdev')
+            self._observer.start()
+        except Exception as e:  # pylint: disable=W0718
+            logger.warning(f'Failed to monitor udev tty events, rescan serial ports by ttl: {str(e)}')
+            self._observer = None
+
+    def _on_udev_event(self, device: Any) -> None:
+        logger.debug(f'udev {device.action} {device.device_node}')
+        self.invalidate()
+
+    @property
+    def use_udev(self) -> bool:
+        return self._observer is not None
+
+    def close(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def invalidate(self) -> None:
+        """Rescan on the next access"""
+        self._scan_time = None
+
+    def add_listener(self, listener: InventoryListener) -> None:
+        """Call ``listener(added, removed)`` after a rescan finds changes, a re-created device is in both lists"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: InventoryListener) -> None:
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def _is_stale(self) -> bool:
+        if self._scan_time is None:
+            return True
+        if self.use_udev:
+            return False
+        return time.monotonic() - self._scan_time >= self.ttl
+
+    @staticmethod
+    def _signature(device: str) -> Any:
+        """Device nodes are created again after replug, compare them by inode and change time"""
+        try:
+            stat = os.stat(device)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_ctime_ns, stat.st_rdev
+
+    def _scan_sysfs(self) -> Dict[str, Tuple[Any, ListPortInfo]]:
+        from serial.tools.list_ports_linux import SysFS  # pylint: disable=import-outside-toplevel
+
+        devices: List[str] = []
+        for pattern in self.SYSFS_PATTERNS:
+            devices.extend(glob.glob(pattern))
+        if self.include_links:
+            devices.extend(list_ports_common.list_links(devices))
+        ports = {}
+        for device in devices:
+            signature = self._signature(device)
+            old = self._ports.get(device)
+            if old and old[0] == signature:
+                ports[device] = old
+                continue
+            info = SysFS(device)
+            # hide non-present internal serial ports, same as pyserial
+            if info.subsystem != 'platform':
+                ports[device] = (signature, info)
+        return ports
+
+    def _scan(self) -> Dict[str, Tuple[Any, ListPortInfo]]:
+        if self.incremental:
+            return self._scan_sysfs()
+        ports = {}
+        for info in serial.tools.list_ports.comports(include_links=self.include_links):
+            if not info.device:
+                continue
+            signature = (self._signature(info.device), info.hwid)
+            old = self._ports.get(info.device)
+            # keep the same object of unchanged ports, the changes are compared by identity
+            ports[info.device] = old if old and old[0] == signature else (signature, info)
+        return ports
+
+    @staticmethod
+    def _info(ports: Dict[str, Tuple[Any, ListPortInfo]], device: str) -> Optional[ListPortInfo]:
+        item = ports.get(device)
+        return item[1] if item else None
+
+    def _build_index(self) -> None:
+        by_name: Dict[str, ListPortInfo] = {}
+        by_location: Dict[str, ListPortInfo] = {}
+        by_serial_number: Dict[str, List[ListPortInfo]] = {}
+        by_vid_pid: Dict[Tuple[int, int], List[ListPortInfo]] = {}
+        for _, info in self._ports.values():
+            if info.name:
+                by_name.setdefault(info.name, info)
+            if info.location:
+                by_location.setdefault(info.location, info)
+            if info.serial_number:
+                by_serial_number.setdefault(info.serial_number, []).append(info)
+            if info.vid is not None and info.pid is not None:
+                by_vid_pid.setdefault((info.vid, info.pid), []).append(info)
+        self._by_name = by_name
+        self._by_location = by_location
+        self._by_serial_number = by_serial_number
+        self._by_vid_pid = by_vid_pid
+
+    def refresh(self, force: bool = False) -> Tuple[List[ListPortInfo], List[ListPortInfo]]:
+        """Rescan the ports if stale or forced
+
+        Returns:
+            Tuple[List[ListPortInfo], List[ListPortInfo]]: added and removed ports
+        """
+        with self._lock:
+            if not force and not self._is_stale():
+                return [], []
+            # udev events after this are handled by the next refresh
+            self._scan_time = time.monotonic()
+            old_ports, new_ports = self._ports, self._scan()
+            added = [info for dev, (_, info) in new_ports.items() if self._info(old_ports, dev) is not info]
+            removed = [info for dev, (_, info) in old_ports.items() if self._info(new_ports, dev) is not info]
+            if not added and not removed:
+                return [], []
+            self._ports = new_ports
+            self._build_index()
+            self.generation += 1
+            listeners = list(self._listeners)
+        logger.debug(f'Serial ports added: {[p.device for p in added]}, removed: {[p.device for p in removed]}')
+        for listener in listeners:
+            try:
+                listener(added, removed)
+            except Exception as e:  # pylint: disable=W0718
+                logger.warning(f'Serial port inventory listener failed: {str(e)}')
+        return added, removed
+
+    @property
+    def ports(self) -> List[ListPortInfo]:
+        self.refresh()
+        return [info for _, info in self._ports.values()]
+
+    def get(self, device: str, refresh: bool = True) -> Optional[ListPortInfo]:
+        """Port of the device path, ``refresh=False`` looks it up in the last scan, eg: for a removed device"""
+        if refresh:
+            self.refresh()
+        return self._info(self._ports, device)
+
+    def by_name(self, name: str) -> Optional[ListPortInfo]:
+        self.refresh()
+        return self._by_name.get(name)
+
+    def by_location(self, location: str) -> Optional[ListPortInfo]:
+        self.refresh()
+        return self._by_location.get(location)
+
+    def by_serial_number(self, serial_number: str) -> List[ListPortInfo]:
+        self.refresh()
+        return list(self._by_serial_number.get(serial_number, []))
+
+    def by_vid_pid(self, vid: int, pid: int) -> List[ListPortInfo]:
+        self.refresh()
+        return list(self._by_vid_pid.get((vid, pid), []))
+
+    def find(self, port: str, refresh: bool = True) -> Optional[ListPortInfo]:
+        """Find the port by device, name, USB location or serial number (if only one port has it)"""
+        if refresh:
+            self.refresh()
+        item = self._ports.get(port)
+        if item:
+            return item[1]
+        info = self._by_name.get(port) or self._by_location.get(port)
+        if info:
+            return info
+        by_serial_number = self._by_serial_number.get(port, [])
+        return by_serial_number[0] if len(by_serial_number) == 1 else None
+
+
+_inventories: Dict[bool, SerialPortInventory] = {}
+_inventories_lock = threading.Lock()
+
+
+def get_inventory(include_links: bool = False) -> SerialPortInventory:
+    """The shared inventory of this process"""
+    with _inventories_lock:
+        if include_links not in _inventories:
+            _inventories[include_links] = SerialPortInventory(include_links=include_links)
+        return _inventories[include_links]
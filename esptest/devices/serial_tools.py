@@ -1,38 +1,36 @@
-from functools import lru_cache
 from typing import List
 
 import serial.tools.list_ports
 from serial.tools.list_ports_common import ListPortInfo
 
 from ..logger import get_logger
+from .port_inventory import get_inventory
 
 logger = get_logger('devices')
 
 
-@lru_cache()
 def get_all_serial_ports(user: str = 'default', include_links: bool = False) -> List[ListPortInfo]:
-    """list_ports could spend a very long time if there are many ports"""
+    """Get serial ports with USB location from the shared inventory, rescanned after changes or by ttl"""
     # pylint: disable=unused-argument
-    # disable unused argument user was only used by lru_cache
+    # disable unused argument user was only used by the lru_cache before
     # remove /dev/ttyS0  {location: None, pid: None, hwid: PNP0501, subsystem:pnp, serial_number: None}
-    return [p for p in serial.tools.list_ports.comports(include_links=include_links) if p.device and p.location]
+    return [p for p in get_inventory(include_links).ports if p.device and p.location]
 
 
 def compute_serial_port(port: str, strict: bool = False) -> str:
-    """Get the real serial port device from device, port name or usb location
+    """Get the real serial port device from device, port name, usb location or serial number
 
     Args:
-        port (str): device, port name or usb location
+        port (str): device, port name, usb location or serial number
         strict (bool, optional): raise Exception if not found locally.
 
     Returns:
         str: port device. return the given input port
     """
-    ports = get_all_serial_ports(include_links=True)
-    for p in ports:
-        if port in [p.name, p.device, p.location]:
-            assert isinstance(p.device, str)
-            return p.device
+    info = get_inventory(include_links=True).find(port)
+    if info:
+        assert isinstance(info.device, str)
+        return info.device
     if strict:
         raise serial.SerialException(f'Can not compute {port}')
     logger.warning(f'Can not compute port {port}, is it exist?')
@@ -101,9 +101,7 @@ class WifiCmd:
             assert dut
             dut.write(to_bytes('help\r\n'))
             time.sleep(2)
-            match = dut.expect(re.compile('.*', re.DOTALL), timeout=0)
-            assert match
-            help_text = to_str(match.group(0))
+            help_text = dut.flush_data()
 
         match_scan = re.search(r'\nscan\s+', help_text)
         match_sta_scan = re.search(r'\nsta_scan\s+', help_text)
@@ -174,21 +172,14 @@ class WifiCmd:
         """
         sta_dut.write_line(conn_cmd)
 
-        all_expect = re.compile(
-            '|'.join(
-                [
-                    f'(?:{p.pattern})'
-                    for p in [
-                        cls.WIFI_CONNECTED_PATTERN,
-                        cls.GOT_IP4_PATTERN,
-                        # Try to get more info from idf logs
-                        cls.IDF_WIFI_CONNECTED_PATTERN,
-                        cls.IDF_WIFI_CONNECTED_AP_INFO_PATTERN,
-                        cls.IDF_GOT_IP4_PATTERN,
-                    ]
-                ]
-            )
-        )
+        all_expect = [
+            cls.WIFI_CONNECTED_PATTERN,
+            cls.GOT_IP4_PATTERN,
+            # Try to get more info from idf logs
+            cls.IDF_WIFI_CONNECTED_PATTERN,
+            cls.IDF_WIFI_CONNECTED_AP_INFO_PATTERN,
+            cls.IDF_GOT_IP4_PATTERN,
+        ]
 
         t0 = time.perf_counter()
 
@@ -197,29 +188,26 @@ class WifiCmd:
         got_ip4 = False
         while time.perf_counter() - t0 < timeout:
             time_left = t0 + timeout - time.perf_counter()
-            match = sta_dut.expect(all_expect, timeout=time_left)
-            assert match
+            index, match = sta_dut.expect_any(all_expect, timeout=time_left)
+            assert isinstance(match, re.Match)
             data = to_str(match.group(0))
             logger.debug(f'Matched data: {data}')
             # Check which pattern was matched.
-            if cls.WIFI_CONNECTED_PATTERN.match(data):
+            pattern = all_expect[index]
+            if pattern is cls.WIFI_CONNECTED_PATTERN:
                 # No extra information now
                 wifi_connected = True
-            elif cls.GOT_IP4_PATTERN.match(data):
+            elif pattern is cls.GOT_IP4_PATTERN:
                 # parse ipv4 info
-                _match = cls.GOT_IP4_PATTERN.match(data)
-                assert _match
-                connected_info.ip4 = _match.group(1)
+                connected_info.ip4 = match.group(1)
                 got_ip4 = True
-            elif cls.IDF_GOT_IP4_PATTERN.match(data):
-                _match = cls.IDF_GOT_IP4_PATTERN.match(data)
-                assert _match
-                connected_info.ip4 = _match.group(1)
-                connected_info.ip4_mask = _match.group(2)
-                connected_info.ip4_gw = _match.group(3)
+            elif pattern is cls.IDF_GOT_IP4_PATTERN:
+                connected_info.ip4 = match.group(1)
+                connected_info.ip4_mask = match.group(2)
+                connected_info.ip4_gw = match.group(3)
                 got_ip4 = True
             # Parse extra connection info from IDF wifi log
-            elif cls.IDF_WIFI_CONNECTED_PATTERN.match(data):
+            elif pattern is cls.IDF_WIFI_CONNECTED_PATTERN:
                 _match = re.search(r'aid = (\d+)', data)
                 if _match:
                     connected_info.aid = int(_match.group(1))
@@ -231,14 +219,11 @@ class WifiCmd:
                 _match = re.search(r'bssid = ([\w:]+)[^\w:]', data)
                 if _match:
                     connected_info.bssid = _match.group(1)
-            elif cls.IDF_WIFI_CONNECTED_AP_INFO_PATTERN.match(data):
-                _match = cls.IDF_WIFI_CONNECTED_AP_INFO_PATTERN.match(data)
-                assert _match
-                connected_info.security = _match.group(1)
-                connected_info.phy = _match.group(2)
-                connected_info.rssi = int(_match.group(3))
             else:
-                logger.warning(f'Should not happen, expect returned: {data}')
+                assert pattern is cls.IDF_WIFI_CONNECTED_AP_INFO_PATTERN
+                connected_info.security = match.group(1)
+                connected_info.phy = match.group(2)
+                connected_info.rssi = int(match.group(3))
 
             # Already connected and got expected ip addresses.
             if wifi_connected and (not wait_ip or got_ip4):
@@ -1 +1 @@
-from .logger import get_logger  # noqa: F401
+from .logger import get_logger, get_port_logger  # noqa: F401
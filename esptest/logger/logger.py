@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 module_logger = logging.getLogger('esptest')
 
@@ -8,3 +9,13 @@ def get_logger(suffix: str = '') -> logging.Logger:
     if not suffix:
         return module_logger
     return module_logger.getChild(suffix)
+
+
+def get_port_logger(port_name: str, parent: Optional[logging.Logger] = None) -> logging.Logger:
+    """get the logger of the port data, eg: 'esptest.SerialDut.MyDut'.
+
+    Data of each port could be shown or hidden separately by setting the level of this logger.
+    """
+    parent = parent or module_logger
+    # dots in port name (eg: '/dev/tty.usbserial') would create more logger levels
+    return parent.getChild(port_name.replace('.', '_') or 'port')
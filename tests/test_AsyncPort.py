@@ -0,0 +1,139 @@
+import asyncio
+import os
+import pty
+import queue
+import re
+import tempfile
+import time
+
+import pytest
+import serial
+
+from esptest.adapter.async_port import AsyncBasePort
+from esptest.adapter.base_port import ExpectTimeout
+from esptest.adapter.dut import AsyncDutPort
+
+
+class QueuePort:
+    """RawPort without fileno, polled by read_bytes()"""
+
+    def __init__(self) -> None:
+        self.name = 'QueuePort'
+        self.rx_queue: queue.Queue = queue.Queue()
+        self.written = b''
+
+    def write_bytes(self, data: bytes) -> None:
+        self.written += data
+
+    def read_bytes(self, timeout: float = 0.001) -> bytes:
+        try:
+            return self.rx_queue.get(timeout=timeout)
+        except queue.Empty:
+            return b''
+
+
+def test_async_port_polling() -> None:
+    port = QueuePort()
+
+    async def _test() -> None:
+        async with AsyncBasePort(port) as async_port:
+            await async_port.write_line('help')
+            assert port.written == b'help\n'
+            port.rx_queue.put(b'line1\r\nSTART,val')
+            port.rx_queue.put(b'ue,END\r\nline3\r\n')
+            assert await async_port.readline(timeout=1) == 'line1'
+            match = await async_port.expect(re.compile(r'START,(\w+),END'), timeout=1)
+            assert match.group(1) == 'value'
+            index, _ = await async_port.expect_any(['not exist', b'line3'], timeout=1)
+            assert index == 1
+            with pytest.raises(ExpectTimeout):
+                await async_port.expect('not exist', timeout=0.1)
+
+    asyncio.run(_test())
+
+
+def test_async_dut_serial_readers() -> None:
+    ptys = [pty.openpty() for _ in range(4)]
+    serials = [serial.Serial(os.ttyname(slave), 115200, timeout=0.001) for _, slave in ptys]
+
+    async def _test_one(index: int, log_file: str) -> float:
+        async with AsyncDutPort(serials[index], f'dut{index}', log_file) as dut:
+            assert dut._reader_fd is not None  # pylint: disable=protected-access
+            await dut.write_line('restart')
+            assert os.read(ptys[index][0], 100) == b'restart\r\n'
+            t0 = time.perf_counter()
+            os.write(ptys[index][0], f'rst:0x1\r\nboot dut{index} done\r\n'.encode())
+            await dut.expect(f'boot dut{index} done\r\n', timeout=1)
+            cost = time.perf_counter() - t0
+            lines = []
+            os.write(ptys[index][0], b'line1\r\nline2\r\n')
+            async for line in dut:
+                lines.append(line)
+                if len(lines) == 2:
+                    break
+            assert lines == ['line1', 'line2']
+            return cost
+
+    async def _test(temp_dir: str) -> None:
+        tasks = [_test_one(i, os.path.join(temp_dir, f'dut{i}.log')) for i in range(len(ptys))]
+        costs = await asyncio.gather(*tasks)
+        assert max(costs) < 0.5
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            asyncio.run(_test(temp_dir))
+            with open(os.path.join(temp_dir, 'dut0.log'), 'rb') as f:
+                assert b'boot dut0 done\r\n' in f.read()
+    finally:
+        for ser in serials:
+            ser.close()
+        for master, slave in ptys:
+            os.close(master)
+            os.close(slave)
+
+
+def test_async_port_bounded_buffer() -> None:
+    class SmallBufferPort(AsyncBasePort):
+        MAX_BUFFER_SIZE = 16
+
+    port = QueuePort()
+
+    async def _test() -> None:
+        async with SmallBufferPort(port) as async_port:
+            port.rx_queue.put(b'0123456789')
+            port.rx_queue.put(b'abcdefghij')
+            await asyncio.sleep(0.1)
+            # the oldest data is dropped
+            assert async_port.dropped_bytes == 4
+            assert async_port.read_all_bytes() == b'456789abcdefghij'
+            await async_port.expect('789abc', timeout=1)
+            assert async_port.read_all_bytes(flush=True) == b'defghij'
+            assert not async_port.read_all_bytes()
+
+    asyncio.run(_test())
+
+
+def test_async_dut_serial_no_blocking_read() -> None:
+    master, slave = pty.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0.001)
+    # coalescing would block the event loop for this time for each read
+    ser.coalesce_time = 1  # type: ignore
+
+    async def _test(log_file: str) -> None:
+        async with AsyncDutPort(ser, 'dut', log_file) as dut:
+            t0 = time.perf_counter()
+            os.write(master, b'boot done\r\nesp32> ')
+            await dut.expect('esp32> ', timeout=2)
+            assert time.perf_counter() - t0 < 0.5
+            # the incomplete line is written after the line timeout
+            await asyncio.sleep(0.2)
+            with open(log_file, 'rb') as f:
+                assert f.read().endswith(b'esp32> ')
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            asyncio.run(_test(os.path.join(temp_dir, 'dut.log')))
+    finally:
+        ser.close()
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,129 @@
+import re
+import threading
+import time
+from typing import List, Tuple
+
+import pytest
+
+from esptest.adapter.dut import BootMilestone, BootProfile, BootReport, DutPort
+from esptest.adapter.port_history import LineHistory
+
+from .test_PortSpawn import QueuePort
+
+# (delay after the last chunk, chunk)
+BOOT_LOG: List[Tuple[float, bytes]] = [
+    (0.02, b'ESP-ROM:esp32c3-api1-20210207\r\nrst:0x1 (POWERON),boot:0xc (SPI_FAST_FLASH_BOOT)\r\n'),
+    (0.05, b'I (30) boot: ESP-IDF v5.1 2nd stage bootloader\r\nI (31) boot: compile time'),
+    (0.01, b' 10:00:00\r\n'),
+    (0.1, b'I (250) main_task: Calling app_main()\r\n'),
+    (0.05, b'\r\nesp32c3> '),
+]
+
+
+class BootDut(DutPort):
+    HISTORY_SIZE = LineHistory.DEFAULT_MAX_SIZE
+
+    def __init__(self, boot_log: List[Tuple[float, bytes]] = BOOT_LOG) -> None:
+        self.queue_port = QueuePort()
+        self.boot_log = boot_log
+        self.resets = 0
+        super().__init__(self.queue_port, 'BootDut')
+
+    def _boot(self) -> None:
+        for delay, chunk in self.boot_log:
+            time.sleep(delay)
+            self.queue_port.rx_queue.put(chunk)
+
+    def hard_reset(self) -> None:
+        self.resets += 1
+        threading.Thread(target=self._boot, daemon=True).start()
+
+
+def test_boot_profile_stages() -> None:
+    profile = BootProfile({'rom': 0.02, 'bootloader': None, 'app_main': 0.2, 'prompt': 0.25})
+    assert profile.total == 0.25
+    stages = profile.stages
+    assert list(stages) == ['reset->rom', 'rom->app_main', 'app_main->prompt']
+    assert abs(stages['rom->app_main'] - 0.18) < 1e-9
+    summary = BootReport([profile, BootProfile({'rom': 0.04, 'bootloader': 0.1})]).summary()
+    assert summary['rom']['count'] == 2
+    assert abs(summary['rom']['mean'] - 0.03) < 1e-9
+    assert summary['bootloader']['count'] == 1
+    assert summary['total']['max'] == 0.25
+
+
+def test_measure_boot() -> None:
+    with BootDut() as dut:
+        dut.write_line('before reset')
+        report = dut.measure_boot(runs=3, timeout=2)
+        assert dut.resets == 3
+        assert len(report.profiles) == 3
+        for profile in report.profiles:
+            milestones = profile.milestones
+            assert list(milestones) == ['rom', 'bootloader', 'app_main', 'prompt']
+            assert all(t is not None for t in milestones.values())
+            # in boot order, roughly the delays of the boot log
+            assert milestones['rom'] < milestones['bootloader'] < milestones['app_main'] < milestones['prompt']
+            assert profile.stages['bootloader->app_main'] >= 0.1
+            assert profile.total is not None and profile.total < 1
+        summary = report.summary()
+        assert summary['total']['count'] == 3
+        assert summary['total']['min'] <= summary['total']['median'] <= summary['total']['max']
+        # the expect buffer is not consumed
+        dut.expect_exact('2nd stage bootloader', timeout=1)
+
+
+def test_measure_boot_missing_milestone() -> None:
+    milestones = [
+        BootMilestone('bootloader', '2nd stage bootloader'),
+        BootMilestone('panic', 'Guru Meditation'),
+        BootMilestone('app_main', re.compile(r'Calling app_main\(\)')),
+    ]
+    with BootDut() as dut:
+        profile = dut.measure_boot(milestones, timeout=0.5).profiles[0]
+        assert profile.milestones['panic'] is None
+        # found in history after the timeout of the missing one
+        assert profile.milestones['app_main'] is not None
+        assert list(profile.stages) == ['reset->bootloader', 'bootloader->app_main']
+
+
+def test_measure_boot_prompt_time() -> None:
+    boot_log = [
+        (0.02, b'I (250) main_task: Calling app_main()\r'),
+        # the line ending of the last line arrives with the prompt
+        (0.2, b'\nesp32c3> '),
+    ]
+    with BootDut(boot_log) as dut:
+        profile = dut.measure_boot(timeout=2).profiles[0]
+        assert profile.milestones['rom'] is None
+        app_main, prompt = profile.milestones['app_main'], profile.milestones['prompt']
+        assert app_main is not None and prompt is not None
+        assert prompt - app_main >= 0.15
+
+
+def test_measure_boot_history_trimmed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(BootDut, 'HISTORY_SIZE', 512)
+    filler = b''.join(f'I ({i}) boot: loading segment {i:04d} ................\r\n'.encode() for i in range(20))
+    # the milestones are discarded from the history before the boot completes
+    boot_log = [(0, filler)] + BOOT_LOG[:2] + [(0.05, filler)] + BOOT_LOG[2:]
+    with BootDut(boot_log) as dut:
+        dut.write_line(filler)
+        milestones = dut.measure_boot(timeout=2).profiles[0].milestones
+        assert all(t is not None for t in milestones.values())
+        assert milestones['rom'] < milestones['bootloader'] < milestones['app_main'] < milestones['prompt']
+
+
+def test_measure_boot_without_history(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(BootDut, 'HISTORY_SIZE', 0)
+    boot_log = [
+        (0.02, b'I (30) boot: ESP-IDF v5.1 2nd st'),
+        # the milestone is split across the polls of the history
+        (0.1, b'age bootloader\r\n'),
+        (0.05, b'I (250) main_task: Calling app_main()\r\n'),
+    ]
+    with BootDut(boot_log) as dut:
+        assert dut.spawn and dut.spawn.history is None
+        milestones = dut.measure_boot(timeout=0.5).profiles[0].milestones
+        assert milestones['bootloader'] is not None and milestones['app_main'] is not None
+        assert milestones['bootloader'] < milestones['app_main']
+        assert dut.spawn.history is None
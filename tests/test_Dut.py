@@ -4,6 +4,7 @@ import os
 import pty
 import re
 import tempfile
+import threading
 import time
 import unittest
 
@@ -72,6 +73,48 @@ class TestSerialDut(unittest.TestCase):
         ser = SerialPort(self.serial_port, 115200, timeout=0.001)
         assert isinstance(ser, RawPort)
 
+    def test_serial_port_read_size(self) -> None:
+        ser = SerialPort(self.serial_port, 115200, timeout=0.001)
+        try:
+            os.write(self.master, b'x' * 3000)
+            time.sleep(0.05)
+            # read all bytes in waiting at once
+            assert len(ser.read_bytes()) == 3000
+            ser.max_read_size = 512
+            os.write(self.master, b'x' * 1000)
+            time.sleep(0.05)
+            assert len(ser.read_bytes()) == 512
+            assert len(ser.read_available()) == 488
+            assert ser.read_stats.reads == 3
+            assert ser.read_stats.read_bytes == 4000
+            assert ser.read_stats.max_chunk_size == 3000
+            assert ser.read_stats.capped_reads == 1
+            # merge small bursts into one chunk
+            ser.reset_read_stats()
+            ser.coalesce_time = 0.2
+            timer = threading.Timer(0.05, os.write, args=(self.master, b'bbb'))
+            timer.start()
+            os.write(self.master, b'aaa')
+            assert ser.read_bytes(timeout=0.1) == b'aaabbb'
+            assert ser.read_stats.coalesced_reads == 1
+        finally:
+            ser.close()
+
+    def test_serial_port_selector(self) -> None:
+        ser = SerialPort(self.serial_port, 115200, timeout=0.001)
+        try:
+            assert not ser.wait_readable(0.01)
+            selector = ser._selector  # pylint: disable=protected-access
+            os.write(self.master, b'x')
+            # registered once for the open port
+            assert ser.wait_readable(0.1)
+            assert ser._selector is selector  # pylint: disable=protected-access
+            assert ser.read_available() == b'x'
+        finally:
+            ser.close()
+        assert ser._selector is None  # pylint: disable=protected-access
+        assert selector.get_map() is None
+
     def test_set_serial_after_init(self) -> None:
         dut = SerialDut(None, name='MyDut')
         try:
@@ -103,6 +146,25 @@ class TestSerialDut(unittest.TestCase):
             # Must close master io at the end of the case, otherwise the next case will fail.
             self._close_file_io(fd_master)
 
+    def test_serial_dut_reopen(self) -> None:
+        ser = serial.Serial(self.serial_port, 115200, timeout=0.001)
+        dut = SerialDut(ser, 'MyDut')
+        fd_master = os.fdopen(self.master, 'rb')
+        try:
+            dut.close()
+            ser.close()
+            # the pty is not a USB port, it's opened by the same device path
+            dut.reopen()
+            assert dut.serial and dut.serial.port == self.serial_port
+            dut.write('aaa')
+            assert fd_master.read1(5) == b'aaa'
+        finally:
+            reopened = dut.serial
+            dut.close()
+            if reopened:
+                reopened.close()
+            self._close_file_io(fd_master)
+
     def test_serial_dut_with_statement(self) -> None:
         check_thread = None
         ser = serial.Serial(self.serial_port, 115200, timeout=0.001)
@@ -218,6 +280,30 @@ class TestSerialDut(unittest.TestCase):
             dut.close()
             self._close_file_io(fd_master)
 
+    def test_serial_dut_event_driven(self) -> None:
+        class EventSerialDut(SerialDut):
+            EVENT_DRIVEN_READ = True
+
+        ser = serial.Serial(self.serial_port, 115200, timeout=0.001)
+        dut = EventSerialDut(ser, 'MyDut')
+        fd_master = os.fdopen(self.master, 'wb')
+        try:
+            assert dut.spawn
+            assert dut.spawn.event_driven
+            check_thread = dut.spawn._read_thread  # pylint: disable=protected-access
+            fd_master.write(b'boot done\r\n')
+            fd_master.flush()
+            dut.expect('boot done', timeout=1)
+            fd_master.write(b'START,value,END')
+            fd_master.flush()
+            match = dut.expect(re.compile(r'START,(\w+),END'), timeout=1)
+            assert match.group(1) == 'value'
+        finally:
+            dut.close()
+            self._close_file_io(fd_master)
+        # the read thread blocked in selector is waked up when closing
+        assert not check_thread.is_alive()
+
     def test_serial_dut_log(self) -> None:
         ser_read_timeout = 0.005
         ser = serial.Serial(self.serial_port, 115200, timeout=ser_read_timeout)
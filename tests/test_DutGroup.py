@@ -0,0 +1,84 @@
+import re
+import threading
+import time
+from typing import List, Tuple
+
+import pytest
+
+from esptest.adapter.dut import DutGroup, DutGroupError, DutPort
+
+from .test_PortSpawn import QueuePort
+
+
+def _group(count: int) -> Tuple[DutGroup, List[QueuePort]]:
+    ports = [QueuePort() for _ in range(count)]
+    return DutGroup([DutPort(port, f'dut{i}') for i, port in enumerate(ports)]), ports
+
+
+def _reply_later(port: QueuePort, data: bytes, delay: float) -> None:
+    threading.Timer(delay, port.rx_queue.put, (data,)).start()
+
+
+def test_group_broadcast_and_expect_all() -> None:
+    group, ports = _group(4)
+    try:
+        group.write_line('get_ip')
+        assert all(port.written == b'get_ip\r\n' for port in ports)
+        for i, port in enumerate(ports):
+            _reply_later(port, f'IP: 192.168.1.{i}\r\n'.encode(), 0.2)
+        t0 = time.perf_counter()
+        results = group.expect(re.compile(r'IP: (\S+)'), timeout=2)
+        # in parallel rather than one by one
+        assert time.perf_counter() - t0 < 0.2 * len(ports)
+        assert results.succeeded == ['dut0', 'dut1', 'dut2', 'dut3']
+        assert results['dut2'].match.group(1) == '192.168.1.2'
+        assert group['dut1'] is group[1]
+    finally:
+        for dut in group:
+            dut.close()
+
+
+def test_group_expect_single_deadline() -> None:
+    group, ports = _group(3)
+    try:
+        _reply_later(ports[0], b'rea', 0.05)
+        _reply_later(ports[0], b'dy\r\n', 0.25)
+        _reply_later(ports[2], b'ready\r\n', 0.1)
+        t0 = time.perf_counter()
+        with pytest.raises(DutGroupError) as e:
+            group.expect('ready', timeout=0.5)
+        assert time.perf_counter() - t0 < 1
+        assert e.value.results.failed == ['dut1']
+        assert isinstance(e.value.results['dut1'].error, TimeoutError)
+        # per DUT patterns
+        ports[1].rx_queue.put(b'late\r\n')
+        results = group.expect([re.compile('.*'), 'late', re.compile('.*')], timeout=1, raise_on_error=False)
+        assert results.succeeded == ['dut0', 'dut1', 'dut2']
+    finally:
+        for dut in group:
+            dut.close()
+
+
+def test_group_expect_min_success() -> None:
+    group, ports = _group(4)
+    try:
+        for port in ports[:2]:
+            _reply_later(port, b'connected\r\n', 0.05)
+        t0 = time.perf_counter()
+        results = group.expect('connected', timeout=5, min_success=2)
+        # the slow DUTs are not waited until the deadline
+        assert time.perf_counter() - t0 < 1
+        assert results.succeeded == ['dut0', 'dut1']
+        assert all(r.cancelled and r.error is None for r in results[2:])
+        # one expect for each DUT, the cancelled ones are not recorded as timeout
+        expect_metrics = group[3].metrics_snapshot()['expect']
+        assert not expect_metrics['timeout']
+        assert sum(h['count'] for h in expect_metrics['cancelled'].values()) == 1
+        # unmatched data is kept for the next expect
+        ports[3].rx_queue.put(b'connec')
+        time.sleep(0.1)
+        ports[3].rx_queue.put(b'ted\r\n')
+        group[3].expect('connected', timeout=1)
+    finally:
+        for dut in group:
+            dut.close()
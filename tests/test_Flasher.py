@@ -0,0 +1,176 @@
+import json
+import os
+import pty
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Generator, List, Tuple
+
+import pytest
+import serial
+
+from esptest.adapter.dut import EspTool, FlashError, FlashManager
+from esptest.devices.serial_dut import SerialDut
+
+# Fails above max baud, records the arguments, sleeps to show the concurrency
+FAKE_ESPTOOL = """
+import json, sys, time
+args = sys.argv[1:]
+if {error!r}:
+    print({error!r})
+    sys.exit(2)
+if int(args[args.index('--baud') + 1]) > {max_baud}:
+    print('A fatal error occurred: Failed to connect')
+    sys.exit(2)
+with open({log!r}, 'a') as f:
+    f.write(json.dumps(args) + '\\n')
+if 'read_flash' in args:
+    with open(args[-1], 'wb') as f:
+        f.write(b'\\xff' * int(args[-2], 16))
+time.sleep({delay})
+"""
+
+
+class FlashDut(SerialDut):
+    @property
+    def partition_table(self) -> Dict[str, Any]:
+        return {'nvs': {'offset': 0x9000, 'size': 0x6000}}
+
+    @property
+    def target(self) -> str:
+        return 'esp32c3'
+
+
+def _fake_esptool(tmp_path: Path, max_baud: int = 921600, delay: float = 0, error: str = '') -> Tuple[EspTool, Path]:
+    log = tmp_path / 'esptool.log'
+    script = tmp_path / 'fake_esptool.py'
+    script.write_text(FAKE_ESPTOOL.format(max_baud=max_baud, log=str(log), delay=delay, error=error))
+    return EspTool([sys.executable, str(script)]), log
+
+
+def _esptool_calls(log: Path) -> List[List[str]]:
+    return [json.loads(line) for line in log.read_text().splitlines()]
+
+
+@pytest.fixture
+def build_dir(tmp_path: Path) -> str:
+    build = tmp_path / 'build'
+    (build / 'bootloader').mkdir(parents=True)
+    (build / 'bootloader' / 'bootloader.bin').write_bytes(b'boot')
+    (build / 'app.bin').write_bytes(b'app')
+    flasher_args = {
+        'write_flash_args': ['--flash_mode', 'dio', '--flash_size', '2MB'],
+        'flash_files': {'0x10000': 'app.bin', '0x0': 'bootloader/bootloader.bin'},
+        'extra_esptool_args': {'after': 'hard_reset', 'before': 'default_reset', 'stub': True, 'chip': 'esp32c3'},
+    }
+    (build / 'flasher_args.json').write_text(json.dumps(flasher_args))
+    return str(build)
+
+
+@pytest.fixture
+def duts() -> Generator[List[Tuple[FlashDut, int]], None, None]:
+    """DUTs on pty stand-ins, with the pty master fd"""
+    items = []
+    fds = []
+    for i in range(4):
+        master, slave = pty.openpty()
+        fds += [master, slave]
+        items.append((FlashDut(serial.Serial(os.ttyname(slave), 115200, timeout=0.005), f'dut{i}'), master))
+    yield items
+    for dut, _ in items:
+        dut.close()
+    for fd in fds:
+        os.close(fd)
+
+
+def test_dut_flash(tmp_path: Path, build_dir: str, duts: List[Tuple[FlashDut, int]]) -> None:
+    esptool, log = _fake_esptool(tmp_path)
+    dut, master = duts[0]
+    dut.ESPTOOL = esptool
+    dut.flash(build_dir)
+    calls = _esptool_calls(log)
+    device = dut.serial.port  # type: ignore
+    assert calls == [
+        ['--chip', 'esp32c3', '--port', device, '--baud', '921600', '--before', 'default_reset', '--after',
+         'hard_reset', 'write_flash', '-z', '--flash_mode', 'dio', '--flash_size', '2MB',
+         '0x0', os.path.join(build_dir, 'bootloader/bootloader.bin'), '0x10000', os.path.join(build_dir, 'app.bin')],
+    ]  # fmt: skip
+    # failed at 2M, the stable baud is used next time
+    assert esptool.stable_baud(device) == 921600
+    # reading continues after flashing
+    os.write(master, b'boot after flash\r\n')
+    dut.expect('boot after flash', timeout=1)
+
+    dut.flash_nvs(build_dir + '/app.bin')
+    dut.dump_flash('nvs', str(tmp_path / 'nvs.bin'))
+    calls = _esptool_calls(log)
+    assert calls[1][-4:] == ['write_flash', '-z', '0x9000', build_dir + '/app.bin']
+    assert calls[2][-4:] == ['read_flash', '0x9000', '0x6000', str(tmp_path / 'nvs.bin')]
+    assert (tmp_path / 'nvs.bin').read_bytes() == b'\xff' * 0x6000
+    with pytest.raises(FlashError):
+        dut.flash_partition(0x8000, build_dir)
+
+
+def test_flash_manager(tmp_path: Path, build_dir: str, duts: List[Tuple[FlashDut, int]]) -> None:
+    esptool, log = _fake_esptool(tmp_path, delay=0.5)
+    t0 = time.perf_counter()
+    results = FlashManager(max_workers=4, esptool=esptool).flash([dut for dut, _ in duts], build_dir)
+    # flashed concurrently
+    assert time.perf_counter() - t0 < 0.5 * len(duts)
+    assert [r.name for r in results] == ['dut0', 'dut1', 'dut2', 'dut3']
+    assert all(r.success and r.baud == 921600 for r in results)
+    assert len(_esptool_calls(log)) == len(duts)
+    for dut, master in duts:
+        os.write(master, f'{dut.name} ready\r\n'.encode())
+        dut.expect(f'{dut.name} ready', timeout=1)
+
+
+def test_flash_manager_failed(tmp_path: Path, build_dir: str, duts: List[Tuple[FlashDut, int]]) -> None:
+    esptool, _ = _fake_esptool(tmp_path, max_baud=0)
+    with pytest.raises(FlashError):
+        FlashManager(esptool=esptool).flash([duts[0][0]], build_dir)
+    results = FlashManager(esptool=esptool).flash([duts[0][0]], build_dir, raise_on_error=False)
+    assert not results[0].success
+    assert results[0].baud == 115200
+    assert 'Failed to connect' in results[0].output
+
+
+def test_flash_manager_failed_not_baud(tmp_path: Path, build_dir: str, duts: List[Tuple[FlashDut, int]]) -> None:
+    esptool, _ = _fake_esptool(tmp_path, error='A fatal error occurred: This chip is ESP32-S3, not ESP32-C3')
+    dut = duts[0][0]
+    results = FlashManager(esptool=esptool).flash([dut], build_dir, raise_on_error=False)
+    # not retried with lower baud rates, the stable baud is not changed
+    assert not results[0].success
+    assert results[0].baud == 2000000
+    assert esptool.stable_baud(dut.serial.port) == 2000000  # type: ignore
+
+
+def test_flash_manager_bare_serial_dut(tmp_path: Path, build_dir: str) -> None:
+    esptool, log = _fake_esptool(tmp_path)
+    merged = tmp_path / 'merged.bin'
+    merged.write_bytes(b'merged')
+    fds = []
+    bare_duts = []
+    for i in range(3):
+        master, slave = pty.openpty()
+        fds += [master, slave]
+        bare_duts.append(SerialDut(serial.Serial(os.ttyname(slave), 115200, timeout=0.005), f'bare{i}'))
+    try:
+        # SerialDut has no bin_path, the firmware is given for each DUT, bare2 has none
+        results = FlashManager(esptool=esptool).flash(
+            bare_duts, {'bare0': build_dir, 'bare1': str(merged)}, raise_on_error=False
+        )
+        assert [r.success for r in results] == [True, True, False]
+        assert 'no bin_path' in results[2].output
+        # flashed concurrently, in any order
+        calls = sorted(_esptool_calls(log), key=len)
+        assert len(calls) == 2
+        assert calls[0][-3:] == ['-z', '0x0', str(merged)]
+        assert calls[1][-2:] == ['0x10000', os.path.join(build_dir, 'app.bin')]
+        with pytest.raises(FlashError):
+            FlashManager(esptool=esptool).flash(bare_duts[2:], [str(tmp_path / 'not_exist')])
+    finally:
+        for dut in bare_duts:
+            dut.close()
+        for fd in fds:
+            os.close(fd)
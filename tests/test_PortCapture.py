@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from esptest.adapter.base_port import BasePort
+from esptest.adapter.port_capture import (
+    DIRECTION_READ,
+    DIRECTION_WRITE,
+    INDEX_SUFFIX,
+    CaptureReader,
+    CaptureWriter,
+)
+
+from .test_PortSpawn import QueuePort
+
+
+def test_capture_writer_reader() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        capture_file = os.path.join(temp_dir, 'dut.espcap')
+        writer = CaptureWriter(capture_file, 'MyDut')
+        chunks = [b'boot: rst:0x1\r\nboot', b': app_main\r\n', b'> ', b'partial']
+        t0 = time.monotonic_ns()
+        writer.write(chunks[0])
+        writer.write(b'restart\n', DIRECTION_WRITE)
+        for chunk in chunks[1:]:
+            time.sleep(0.01)
+            writer.write(chunk)
+        writer.close()
+        with CaptureReader(capture_file) as reader:
+            assert len(reader) == 5
+            records = list(reader)
+            assert [r.data for r in records if r.direction == DIRECTION_READ] == chunks
+            assert records[1].direction == DIRECTION_WRITE
+            assert all(t0 <= r.timestamp_ns for r in records)
+            assert abs(reader.to_wall_time(records[0].timestamp_ns) - time.time()) < 5
+            lines = list(reader.iter_lines())
+            assert [line for _, line in lines] == [b'boot: rst:0x1\r\n', b'boot: app_main\r\n', b'> partial']
+            # the line starts in the first record
+            assert lines[1][0] == records[0].timestamp_ns
+            # seek by time
+            index = reader.seek_time(records[3].timestamp_ns)
+            assert index == 3
+            assert [r.data for r in reader.records(start_ns=records[3].timestamp_ns)] == chunks[2:]
+            assert [line for _, line in reader.iter_lines(direction=DIRECTION_WRITE)] == [b'restart\n']
+        # without index file and with a partial record
+        os.remove(capture_file + INDEX_SUFFIX)
+        with open(capture_file, 'ab') as f:
+            f.write(b'\x00' * 5)
+        with CaptureReader(capture_file) as reader:
+            assert len(reader) == 5
+            assert reader.record(4).data == b'partial'
+
+
+def test_capture_writer_reopen() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        capture_file = os.path.join(temp_dir, 'dut.espcap')
+        writer = CaptureWriter(capture_file, 'MyDut')
+        writer.write(b'first session\r\n')
+        writer.close()
+        # a partial record, eg: crashed when writing
+        with open(capture_file, 'ab') as f:
+            f.write(b'\x00' * 5)
+        writer = CaptureWriter(capture_file, 'MyDut')
+        writer.write(b'second session\r\n')
+        writer.close()
+        for with_index in (True, False):
+            if not with_index:
+                os.remove(capture_file + INDEX_SUFFIX)
+            with CaptureReader(capture_file) as reader:
+                assert [r.data for r in reader] == [b'first session\r\n', b'second session\r\n']
+                assert reader.end_offset == os.path.getsize(capture_file)
+        # the index is rebuilt when appending
+        CaptureWriter(capture_file, 'MyDut').close()
+        with CaptureReader(capture_file) as reader:
+            assert len(reader) == 2
+
+
+def test_capture_reader_invalid_file() -> None:
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(b'not a capture file' * 3)
+    try:
+        with pytest.raises(ValueError):
+            CaptureReader(f.name)
+    finally:
+        os.remove(f.name)
+
+
+def test_base_port_capture() -> None:
+    class CapturePort(BasePort):
+        CAPTURE_DATA = True
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        port = QueuePort()
+        with CapturePort(port, 'MyPort', log_file=os.path.join(temp_dir, 'dut.log')) as base_port:
+            capture_file = base_port.capture_file
+            assert base_port.spawn and base_port.spawn.capture_file == capture_file
+            base_port.write_line('help')
+            port.rx_queue.put(b'help\r\nusage: ...\r\n')
+            base_port.expect_exact('usage', timeout=1)
+        with CaptureReader(capture_file) as reader:
+            assert [r.data for r in reader] == [b'help\n', b'help\r\nusage: ...\r\n']
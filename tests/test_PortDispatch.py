@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import List
+
+from esptest.adapter.base_port import BasePort
+from esptest.adapter.port_dispatch import DataDispatcher, Subscription
+
+from .test_PortSpawn import QueuePort
+
+
+def test_dispatcher_ordered_delivery() -> None:
+    dispatcher = DataDispatcher('MyPort')
+    received: List[bytes] = []
+    subscription = dispatcher.subscribe(lambda name, data: received.append(data))
+    for i in range(100):
+        dispatcher.dispatch(f'{i},'.encode())
+    dispatcher.close(drain=True)
+    assert b''.join(received) == b''.join(f'{i},'.encode() for i in range(100))
+    assert subscription.delivered_chunks == 100
+    assert not subscription.dropped_chunks
+    assert not subscription.active
+
+
+def test_dispatcher_slow_subscriber() -> None:
+    dispatcher = DataDispatcher('MyPort')
+    release = threading.Event()
+    fast: List[bytes] = []
+    slow: List[bytes] = []
+
+    def _slow_callback(name: str, data: bytes) -> None:
+        release.wait()
+        slow.append(data)
+
+    fast_sub = dispatcher.subscribe(lambda name, data: fast.append(data))
+    slow_sub = dispatcher.subscribe(_slow_callback, max_queue=4)
+    dispatcher.dispatch(bytes([0]))
+    # wait for the slow callback to take the first chunk
+    while slow_sub.lag:
+        time.sleep(0.001)
+    t0 = time.perf_counter()
+    for i in range(1, 10):
+        dispatcher.dispatch(bytes([i]))
+    # dispatching never blocks
+    assert time.perf_counter() - t0 < 0.1
+    time.sleep(0.05)
+    assert len(fast) == 10
+    # one chunk is being delivered, 4 are queued, others are dropped
+    assert slow_sub.lag == 4
+    assert slow_sub.max_lag == 4
+    assert slow_sub.dropped_chunks == 5
+    assert slow_sub.dropped_bytes == 5
+    release.set()
+    dispatcher.close(drain=True)
+    assert slow == [bytes([i]) for i in range(5)]
+    assert fast_sub.dropped_chunks == 0
+
+
+def test_close_with_slow_subscriber() -> None:
+    port = QueuePort()
+    release = threading.Event()
+    received: List[bytes] = []
+
+    def _slow_callback(name: str, data: bytes) -> None:
+        received.append(data)
+        release.wait(5)
+
+    base_port = BasePort(port, 'MyPort')
+    subscription = base_port.subscribe(_slow_callback)
+    for i in range(5):
+        port.rx_queue.put(f'line{i}\r\n'.encode())
+    base_port.expect_exact('line4', timeout=1)
+    t0 = time.perf_counter()
+    base_port.close()
+    # pending chunks are dropped, the blocked callback is not waited for longer than the timeout
+    assert time.perf_counter() - t0 < Subscription.DEFAULT_CLOSE_TIMEOUT + 1
+    assert received == [b'line0\r\n']
+    assert subscription.dropped_chunks == 4
+    assert not subscription.active
+    release.set()
+
+
+def test_port_subscribers() -> None:
+    port = QueuePort()
+    received: List[bytes] = []
+    legacy: List[bytes] = []
+    errors = threading.Event()
+
+    def _broken_callback(name: str, data: bytes) -> None:
+        errors.set()
+        raise ValueError('broken subscriber')
+
+    with BasePort(port, 'MyPort') as base_port:
+        assert base_port.spawn
+        subscription = base_port.subscribe(lambda name, data: received.append(data))
+        broken = base_port.subscribe(_broken_callback)
+        base_port.spawn.receive_callback = lambda name, data: legacy.append(data)
+        port.rx_queue.put(b'line1\r\n')
+        port.rx_queue.put(b'line2\r\n')
+        base_port.expect_exact('line2', timeout=1)
+        assert errors.wait(1)
+        base_port.unsubscribe(subscription)
+        port.rx_queue.put(b'line3\r\n')
+        base_port.expect_exact('line3', timeout=1)
+    assert b''.join(received) == b'line1\r\nline2\r\n'
+    assert b''.join(legacy) == b'line1\r\nline2\r\nline3\r\n'
+    assert broken.errors >= 1
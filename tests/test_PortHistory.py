@@ -0,0 +1,99 @@
+import re
+import threading
+import time
+
+import pytest
+
+from esptest.adapter.base_port import BasePort, ExpectTimeout
+from esptest.adapter.matcher import ExactMatcher
+from esptest.adapter.port_history import LineHistory
+
+from .test_PortSpawn import QueuePort
+
+
+class HistoryPort(BasePort):
+    HISTORY_SIZE = LineHistory.DEFAULT_MAX_SIZE
+
+
+def test_line_history_index() -> None:
+    history = LineHistory()
+    history.append(b'line1\r\nli', timestamp=1.0)
+    history.append(b'ne2\r\n', timestamp=2.0)
+    history.append(b'line3\r\nline4', timestamp=3.0)
+    assert history.end_offset == 26
+    assert history.lines() == [(1.0, b'line1\r\n'), (1.0, b'line2\r\n'), (3.0, b'line3\r\n'), (3.0, b'line4')]
+    # since timestamp: lines started at or after the time
+    assert history.lines(since=2.5) == [(3.0, b'line3\r\n'), (3.0, b'line4')]
+    assert history.read(since=2.5) == (14, b'line3\r\nline4')
+    # since offset: the first line may be partial
+    assert history.lines(since=16) == [(3.0, b'ne3\r\n'), (3.0, b'line4')]
+    assert history.time_of(8) == 1.0
+    mark = history.mark()
+    assert mark.offset == 26
+    assert history.read(since=mark) == (26, b'')
+    history.append(b'\r\n', timestamp=4.0)
+    assert history.lines(since=history.mark()) == []
+
+
+def test_line_history_trim() -> None:
+    history = LineHistory(max_size=40)
+    for i in range(10):
+        history.append(f'line{i}\r\n'.encode(), timestamp=float(i))
+    # oldest whole lines are discarded
+    assert history.size <= 40
+    assert history.start_offset == history.end_offset - history.size
+    lines = history.lines()
+    assert lines[-1] == (9.0, b'line9\r\n')
+    assert lines[0][1].startswith(b'line')
+    assert history.read(since=0)[0] == history.start_offset
+    # a very long line
+    history.append(b'x' * 100, timestamp=10.0)
+    assert history.size <= 40
+    assert history.lines() == [(10.0, b'x' * 30)]
+
+
+def test_base_port_history() -> None:
+    port = QueuePort()
+    with HistoryPort(port, 'MyPort') as base_port:
+        port.rx_queue.put(b'wifi:connected\r\nip: 192.168.1.2\r\n')
+        base_port.expect_exact('ip: 192.168.1.2', timeout=1)
+        # consumed data is still in the history
+        assert base_port.search_history('wifi:connected') == 'wifi:connected'
+        match = base_port.search_history(re.compile(r'ip: (\S+)'))
+        assert isinstance(match, re.Match)
+        assert match.group(1) == '192.168.1.2'
+        mark = base_port.mark()
+        # disabled by default
+        with BasePort(QueuePort(), 'NoHistory') as no_history:
+            assert no_history.history_lines() == []
+            with pytest.raises(NotImplementedError):
+                no_history.search_history('wifi:connected')
+        assert base_port.search_history('wifi:connected', since=mark) is None
+        port.rx_queue.put(b'wifi:disconnected\r\n')
+        base_port.expect_exact('disconnected', timeout=1)
+        # event already scrolled past after the mark
+        base_port.expect_since(mark, 'wifi:disconnected', timeout=0)
+        with pytest.raises(ExpectTimeout):
+            base_port.expect_since(mark, 'wifi:connected', timeout=0.1)
+        # wait for new data
+        threading.Timer(0.1, port.rx_queue.put, args=(b'reason: 201\r\n',)).start()
+        match = base_port.expect_since(mark, re.compile(rb'reason: (\d+)'), timeout=1)
+        assert match and match.group(1) == b'201'
+        lines = base_port.history_lines(since=mark)
+        assert [line for _, line in lines] == ['wifi:disconnected\r\n', 'reason: 201\r\n']
+        assert lines[0][0] <= lines[1][0] <= time.monotonic()
+
+
+def test_expect_history_trimmed_while_waiting() -> None:
+    class SmallHistoryPort(BasePort):
+        HISTORY_SIZE = 64
+
+    port = QueuePort()
+    with SmallHistoryPort(port, 'MyPort') as base_port:
+        assert base_port.spawn
+        mark = base_port.mark()
+        data = b''.join(f'line {i:03d}\r\n'.encode() for i in range(20)) + b'found\r\n'
+        threading.Timer(0.1, port.rx_queue.put, (data,)).start()
+        # the data after the mark is discarded before it's searched
+        result = base_port.spawn.expect_history(ExactMatcher('found'), since=mark, timeout=1)
+        assert (result.start, result.end) == (len(data) - 7, len(data) - 2)
@@ -0,0 +1,95 @@
+import os
+import pty
+import sys
+import time
+from typing import List, Tuple
+
+import pytest
+import serial.tools.list_ports
+from serial.tools.list_ports_common import ListPortInfo
+
+from esptest.devices.port_inventory import SerialPortInventory
+
+
+def _port_info(
+    device: str, location: str, serial_number: str = '', vid_pid: Tuple[int, int] = (0x303A, 0x1001)
+) -> ListPortInfo:
+    info = ListPortInfo(device, skip_link_detection=True)
+    info.location = location
+    info.serial_number = serial_number
+    info.vid, info.pid = vid_pid
+    info.hwid = f'USB VID:PID={info.vid:04X}:{info.pid:04X} SER={serial_number} LOCATION={location}'
+    return info
+
+
+@pytest.fixture
+def comports(monkeypatch: pytest.MonkeyPatch) -> List[ListPortInfo]:
+    """Fake ports returned by list_ports.comports(), new objects for each call like pyserial"""
+    ports: List[ListPortInfo] = []
+
+    def _comports(include_links: bool = False) -> List[ListPortInfo]:
+        return [_port_info(p.device, p.location, p.serial_number, (p.vid, p.pid)) for p in ports]
+
+    monkeypatch.setattr(serial.tools.list_ports, 'comports', _comports)
+    return ports
+
+
+def test_inventory_index(comports: List[ListPortInfo]) -> None:
+    comports.append(_port_info('/dev/ttyUSB0', '1-1.1', 'SN1'))
+    comports.append(_port_info('/dev/ttyUSB1', '1-1.2', 'SN2', (0x10C4, 0xEA60)))
+    comports.append(_port_info('/dev/ttyUSB2', '1-1.3', 'SN2'))
+    inventory = SerialPortInventory(ttl=60, use_udev=False, incremental=False)
+    assert [p.device for p in inventory.ports] == ['/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyUSB2']
+    assert inventory.get('/dev/ttyUSB1').location == '1-1.2'  # type: ignore
+    assert inventory.by_location('1-1.3').device == '/dev/ttyUSB2'  # type: ignore
+    assert inventory.find('ttyUSB0').device == '/dev/ttyUSB0'  # type: ignore
+    assert inventory.find('SN1').device == '/dev/ttyUSB0'  # type: ignore
+    # serial number is not unique
+    assert inventory.find('SN2') is None
+    assert len(inventory.by_serial_number('SN2')) == 2
+    assert [p.device for p in inventory.by_vid_pid(0x10C4, 0xEA60)] == ['/dev/ttyUSB1']
+    assert inventory.find('not-exist') is None
+
+
+def test_inventory_changes(comports: List[ListPortInfo]) -> None:
+    comports.append(_port_info('/dev/ttyUSB0', '1-1.1'))
+    inventory = SerialPortInventory(ttl=0.1, use_udev=False, incremental=False)
+    changes: List[Tuple[List[str], List[str]]] = []
+    inventory.add_listener(
+        lambda added, removed: changes.append(([p.device for p in added], [p.device for p in removed]))
+    )
+    assert inventory.by_location('1-1.1')
+    old_info = inventory.get('/dev/ttyUSB0')
+    # replugged, another board gets the same device path, not seen until ttl
+    comports[0] = _port_info('/dev/ttyUSB0', '1-1.4')
+    assert inventory.by_location('1-1.4') is None
+    time.sleep(0.1)
+    assert inventory.by_location('1-1.4').device == '/dev/ttyUSB0'  # type: ignore
+    assert inventory.by_location('1-1.1') is None
+    # unchanged ports are kept
+    inventory.refresh(force=True)
+    inventory.invalidate()
+    comports.append(_port_info('/dev/ttyUSB1', '1-1.5'))
+    assert inventory.get('/dev/ttyUSB1')
+    assert inventory.get('/dev/ttyUSB0') is not old_info
+    assert changes == [(['/dev/ttyUSB0'], []), (['/dev/ttyUSB0'], ['/dev/ttyUSB0']), (['/dev/ttyUSB1'], [])]
+    assert inventory.generation == 3
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='sysfs is only available on Linux')
+def test_inventory_incremental_sysfs() -> None:
+    master, slave = pty.openpty()
+    device = os.ttyname(slave)
+    inventory = SerialPortInventory(use_udev=False)
+    inventory.SYSFS_PATTERNS = [device]
+    try:
+        info = inventory.get(device)
+        assert info
+        inventory.refresh(force=True)
+        # device node not changed, sysfs is not read again
+        assert inventory.get(device) is info
+    finally:
+        os.close(master)
+        os.close(slave)
+    inventory.refresh(force=True)
+    assert inventory.get(device) is None
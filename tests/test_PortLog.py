@@ -0,0 +1,123 @@
+import glob
+import gzip
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from esptest.adapter.port_log import LogRotation, PortLogWriter
+
+
+def _read_file(log_file: str) -> bytes:
+    with open(log_file, 'rb') as f:
+        return f.read()
+
+
+def test_port_log_writer() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'dut.log')
+        writer = PortLogWriter(log_file, 'MyDut', line_timeout=0.05)
+        try:
+            writer.write(b'line1\r\nline2')
+            writer.write(b' end\r\npartial')
+            time.sleep(0.02)
+            data = _read_file(log_file)
+            assert b'line1\r\nline2 end\r\n' in data
+            assert data.count(b'\n[') == 1
+            assert b'partial' not in data
+            # incomplete line is written if no new data for line_timeout
+            time.sleep(0.1)
+            assert b'partial' in _read_file(log_file)
+            # change log file, pending data is written to the old file
+            new_log_file = os.path.join(temp_dir, 'dut_new.log')
+            writer.write(b'old file')
+            writer.log_file = new_log_file
+            writer.write(b'new file\n')
+        finally:
+            writer.close()
+        assert b'old file' in _read_file(log_file)
+        assert _read_file(new_log_file).endswith(b'new file\n')
+
+
+def test_port_log_rotation() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'dut.log')
+        rotation = LogRotation(max_bytes=1000, backup_count=2, compression='gzip')
+        writer = PortLogWriter(log_file, 'MyDut', rotation=rotation)
+        try:
+            for i in range(5):
+                writer.write(f'{i}'.encode() * 1000 + b'\n')
+                # wait for the writer thread, let each batch rotate separately
+                time.sleep(0.05)
+        finally:
+            writer.close()
+        backups = sorted(glob.glob(log_file + '.*'))
+        assert len(backups) == 2
+        assert all(f.endswith('.gz') for f in backups)
+        contents = [gzip.decompress(_read_file(f)) for f in backups]
+        assert sorted(c.strip()[-1:] for c in contents) == [b'3', b'4']
+        # current log file is reopened after rotating
+        assert os.path.getsize(log_file) == 0
+
+
+def test_port_log_rotation_by_time() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'dut.log')
+        writer = PortLogWriter(log_file, 'MyDut', threaded=False, rotation=LogRotation(interval=0.1, compression=None))
+        try:
+            writer.write(b'first\n')
+            time.sleep(0.15)
+            writer.write(b'second\n')
+            writer.write(b'third\n')
+        finally:
+            writer.close()
+        backups = glob.glob(log_file + '.*')
+        assert len(backups) == 1
+        assert b'second\n' in _read_file(backups[0])
+        assert _read_file(log_file).endswith(b'third\n')
+
+
+def test_port_log_data_logger(caplog: pytest.LogCaptureFixture) -> None:
+    writer = PortLogWriter(None, 'My.Dut', threaded=False, line_timeout=0)
+    other = PortLogWriter(None, 'OtherDut', threaded=False, line_timeout=0)
+    assert writer.data_logger.name == 'esptest.port_log.My_Dut'
+    # verbosity of each port
+    writer.data_logger.setLevel(logging.DEBUG)
+    other.data_logger.setLevel(logging.INFO)
+    try:
+        with caplog.at_level(logging.DEBUG):
+            # multi-byte character split between writes
+            data = '温度\n'.encode()
+            writer.write(data[:4])
+            writer.write(data[4:])
+            other.write(b'not logged\n')
+        assert [r.getMessage() for r in caplog.records] == ['[My.Dut]: 温', '[My.Dut]: 度\n']
+    finally:
+        writer.data_logger.setLevel(logging.NOTSET)
+        other.data_logger.setLevel(logging.NOTSET)
+        writer.close()
+        other.close()
+
+
+def test_port_log_writer_thread_on_demand(caplog: pytest.LogCaptureFixture) -> None:
+    writer = PortLogWriter(None, 'LazyDut', line_timeout=1)
+    writer.data_logger.setLevel(logging.DEBUG)
+    try:
+        # no writer thread without a log file, the incomplete line is not delayed
+        assert not any(t.name == 'LogWriter_LazyDut' for t in threading.enumerate())
+        with caplog.at_level(logging.DEBUG):
+            writer.write(b'esp32> ')
+        assert [r.getMessage() for r in caplog.records] == ['[LazyDut]: esp32> ']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_file = os.path.join(temp_dir, 'dut.log')
+            writer.log_file = log_file
+            assert any(t.name == 'LogWriter_LazyDut' for t in threading.enumerate())
+            writer.write(b'to file\n')
+            writer.close()
+            assert _read_file(log_file).endswith(b'to file\n')
+    finally:
+        writer.data_logger.setLevel(logging.NOTSET)
+        writer.close()
@@ -0,0 +1,77 @@
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from esptest.adapter.base_port import BasePort, ExpectTimeout
+from esptest.adapter.port_metrics import LatencyHistogram, PortMetrics
+
+from .test_PortSpawn import QueuePort
+
+
+def test_latency_histogram() -> None:
+    hist = LatencyHistogram(bounds=(0.01, 0.1, 1))
+    for value in (0.001, 0.05, 0.05, 0.5, 2):
+        hist.observe(value)
+    data = hist.to_dict()
+    assert data['count'] == 5
+    assert data['min'] == 0.001
+    assert data['max'] == 2
+    assert data['buckets'] == {'<=0.01': 1, '<=0.1': 2, '<=1': 1, '>1': 1}
+    assert hist.mean == pytest.approx(0.5202)
+
+
+def test_port_metrics_rate() -> None:
+    metrics = PortMetrics(gauges={'answer': lambda: 42, 'broken': lambda: 1 / 0}, rate_window=0.5)
+    metrics.record_rx(1000)
+    metrics.record_rx(500)
+    snapshot = metrics.snapshot()
+    assert snapshot['rx_bytes'] == 1500
+    assert snapshot['rx_reads'] == 2
+    assert snapshot['rx_bytes_per_second'] == 3000
+    assert snapshot['answer'] == 42
+    assert 'broken' not in snapshot
+    threading.Event().wait(0.6)
+    assert metrics.rx_bytes_per_second == 0
+
+
+def test_port_metrics_expect_labels_bounded() -> None:
+    metrics = PortMetrics()
+    for i in range(300):
+        metrics.record_expect(f'MARK{i}', 0.01)
+    metrics.record_expect('MARK0', 0.02)
+    metrics.record_expect('MARK1000', 1, matched=False)
+    matched = metrics.snapshot()['expect']['matched']
+    assert len(matched) == PortMetrics.MAX_LABELS + 1
+    assert matched['MARK0']['count'] == 2
+    assert matched[PortMetrics.OTHER_LABEL]['count'] == 300 - PortMetrics.MAX_LABELS
+    assert list(metrics.snapshot()['expect']['timeout']) == ['MARK1000']
+
+
+def test_base_port_metrics() -> None:
+    port = QueuePort()
+    reports: List[Tuple[str, Dict[str, Any]]] = []
+    with BasePort(port, 'MyPort') as base_port:
+        base_port.start_metrics_report(interval=0.05, hook=lambda name, data: reports.append((name, data)))
+        port.rx_queue.put(b'boot done\r\n')
+        port.rx_queue.put(b'ip: 192.168.1.2\r\n')
+        base_port.expect_exact('boot done', timeout=1)
+        base_port.expect(re.compile(r'ip: (\S+)'), timeout=1)
+        with pytest.raises(ExpectTimeout):
+            base_port.expect_exact('not exist', timeout=0.1)
+        snapshot = base_port.metrics_snapshot()
+        assert snapshot['rx_bytes'] == 28
+        assert snapshot['read_loop']['count'] == 2
+        assert snapshot['buffer_size'] == 0
+        assert snapshot['log_queue_depth'] >= 0
+        assert snapshot['expect']['matched']["ExactMatcher(b'boot done')"]['count'] == 1
+        assert len(snapshot['expect']['matched']) == 2
+        assert snapshot['expect']['timeout']["ExactMatcher(b'not exist')"]['min'] >= 0.1
+        threading.Event().wait(0.1)
+    assert reports
+    assert reports[0][0] == 'MyPort'
+    # reporter is stopped when closing the port
+    count = len(reports)
+    threading.Event().wait(0.1)
+    assert len(reports) == count
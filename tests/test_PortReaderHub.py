@@ -0,0 +1,115 @@
+import os
+import pty
+import threading
+
+import serial
+
+from esptest.adapter.base_port import BasePort
+from esptest.adapter.dut.serial_dut import SerialPort
+from esptest.adapter.port_hub import PortReaderHub, _HubWorker
+
+from .test_PortSpawn import QueuePort
+
+
+class BrokenPort(QueuePort):
+    def read_bytes(self, timeout: float = 0.001) -> bytes:
+        raise serial.SerialException('device disconnected')
+
+
+class HubPort(BasePort):
+    READER_HUB = PortReaderHub(workers=2)
+
+
+def test_hub_polled_ports() -> None:
+    ports = [QueuePort() for _ in range(8)]
+    base_ports = [HubPort(port, f'Port{i}') for i, port in enumerate(ports)]
+    try:
+        assert all(p.spawn and not p.spawn._read_thread for p in base_ports)  # pylint: disable=protected-access
+        assert len(HubPort.READER_HUB._workers) == 2  # type: ignore  # pylint: disable=protected-access
+        threads_before = threading.active_count()
+        for i, port in enumerate(ports):
+            port.rx_queue.put(f'port {i} ready\r\n'.encode())
+        for i, base_port in enumerate(base_ports):
+            base_port.expect_exact(f'port {i} ready', timeout=1)
+        assert threading.active_count() == threads_before
+    finally:
+        for base_port in base_ports:
+            base_port.close()
+    assert not len(HubPort.READER_HUB)  # type: ignore
+
+
+def test_hub_read_error() -> None:
+    hub = PortReaderHub()
+    errors = []
+    try:
+        port = BrokenPort()
+        hub.register(port, lambda data: None, errors.append)
+        hub.unregister(QueuePort())
+        # port is removed from the hub after the error
+        for _ in range(100):
+            if errors:
+                break
+            threading.Event().wait(0.01)
+        assert isinstance(errors[0], serial.SerialException)
+        assert not len(hub)
+    finally:
+        hub.close()
+
+
+def test_hub_event_ports() -> None:
+    hub = PortReaderHub()
+    fds = [pty.openpty() for _ in range(3)]
+    sers = [SerialPort(os.ttyname(slave), 115200, timeout=0.001) for _, slave in fds]
+    received = {i: b'' for i in range(len(sers))}
+    done = threading.Event()
+
+    def _on_data(index: int, data: bytes) -> None:
+        received[index] += data
+        if all(v.endswith(b'\n') for v in received.values()):
+            done.set()
+
+    try:
+        for i, ser in enumerate(sers):
+            hub.register(ser, lambda data, i=i: _on_data(i, data), lambda e: None)  # type: ignore
+        for i, (master, _) in enumerate(fds):
+            os.write(master, f'data from {i}\n'.encode())
+        assert done.wait(1)
+        assert received == {i: f'data from {i}\n'.encode() for i in range(len(sers))}
+        for ser in sers:
+            hub.unregister(ser)
+        assert not len(hub)
+    finally:
+        hub.close()
+        for ser in sers:
+            ser.close()
+        for master, _ in fds:
+            os.close(master)
+
+
+def test_hub_callback_error() -> None:
+    hub = PortReaderHub()
+    ports = [QueuePort(), QueuePort()]
+    received = []
+
+    def _broken(data: bytes) -> None:
+        raise ValueError('broken pipeline')
+
+    try:
+        hub.register(ports[0], _broken, lambda e: None)
+        hub.register(ports[1], received.append, lambda e: None)
+        ports[0].rx_queue.put(b'data')
+        ports[1].rx_queue.put(b'other port')
+        # the worker keeps reading the other ports
+        for _ in range(100):
+            if received:
+                break
+            threading.Event().wait(0.01)
+        assert received == [b'other port']
+        hub.unregister(ports[0])
+        assert len(hub) == 1
+    finally:
+        hub.close()
+    # the worker is stopped, removing does not block
+    hub_worker = _HubWorker('stopped', 0.001)
+    hub_worker.stop()
+    hub_worker.remove(ports[1])
@@ -0,0 +1,214 @@
+import queue
+import re
+import time
+
+import pexpect
+import pytest
+
+from esptest.adapter.base_port import BasePort, PortSpawn
+from esptest.adapter.matcher import ExactMatcher, MultiMatcher, RegexMatcher
+
+
+class QueuePort:
+    """RawPort returns data put into the queue chunk by chunk"""
+
+    def __init__(self) -> None:
+        self.name = 'QueuePort'
+        self.rx_queue: queue.Queue = queue.Queue()
+        self.written = b''
+
+    def write_bytes(self, data: bytes) -> None:
+        self.written += data
+
+    def read_bytes(self, timeout: float = 0.001) -> bytes:
+        try:
+            return self.rx_queue.get(timeout=timeout)
+        except queue.Empty:
+            return b''
+
+
+def test_exact_matcher_across_chunks() -> None:
+    matcher = ExactMatcher('abcd')
+    buffer = bytearray(b'xxab')
+    assert not matcher.search(buffer)
+    buffer += b'c'
+    assert not matcher.search(buffer)
+    buffer += b'dyy'
+    result = matcher.search(buffer)
+    assert result
+    assert (result.start, result.end) == (2, 6)
+
+
+def test_regex_matcher_window() -> None:
+    matcher = RegexMatcher(re.compile(rb'START,(\w+),END'), window=16)
+    buffer = bytearray(b'START,val')
+    assert not matcher.search(buffer)
+    buffer += b'ue,END'
+    result = matcher.search(buffer)
+    assert result
+    assert result.match.group(1) == b'value'  # type: ignore
+    # match longer than the window across chunks can not be found
+    matcher.reset()
+    buffer = bytearray(b'START,' + b'x' * 32)
+    assert not matcher.search(buffer)
+    buffer += b',END'
+    assert not matcher.search(buffer)
+
+
+def test_multi_matcher() -> None:
+    patterns = [b'Guru Meditation', re.compile(rb'rst:(0x\w+)'), 'abort()', re.compile(rb'(?i)brownout')]
+    matcher = MultiMatcher(patterns)
+    buffer = bytearray(b'ets Jun  8 2016 00:22:57\r\nrst:0x')
+    assert not matcher.search(buffer)
+    buffer += b'1 (POWERON_RESET)\r\nabort() was called'
+    result = matcher.search(buffer)
+    assert result
+    assert result.pattern_index == 1
+    assert result.match.group(1) == b'0x1'  # type: ignore
+    # the leftmost match wins
+    matcher.reset()
+    buffer = bytearray(b'abort() BROWNOUT Guru Meditation')
+    result = matcher.search(buffer)
+    assert result
+    assert (result.pattern_index, result.start, result.end) == (2, 0, 7)
+    matcher.reset()
+    result = matcher.search(buffer[8:])
+    assert result
+    assert result.pattern_index == 3
+
+
+def test_multi_matcher_overlapping() -> None:
+    patterns = ['world', re.compile(rb'hello (\w+)'), 'hello']
+    matcher = MultiMatcher(patterns)
+    # the regex starts first, though the literal ends at the same position
+    result = matcher.search(bytearray(b'>> hello world'))
+    assert result
+    assert (result.pattern_index, result.start, result.end) == (1, 3, 14)
+    assert result.match.group(1) == b'world'  # type: ignore
+    # the pattern listed first wins at the same position
+    matcher = MultiMatcher([b'hel', re.compile(rb'h\w+'), 'h'])
+    result = matcher.search(bytearray(b'> hello'))
+    assert result
+    assert (result.pattern_index, result.start, result.end) == (0, 2, 5)
+    # literals with regex special characters, across chunks
+    matcher = MultiMatcher(['abort()', re.compile(rb'panic:\s+\d+')])
+    buffer = bytearray(b'xx abo')
+    assert not matcher.search(buffer)
+    buffer += b'rt() panic: 1'
+    result = matcher.search(buffer)
+    assert result
+    assert (result.pattern_index, result.start, result.match) == (0, 3, b'abort()')
+
+
+def test_multi_matcher_verbose() -> None:
+    matcher = MultiMatcher([b'zzz', re.compile(rb'a b', re.X)])
+    # spaces are ignored in a verbose pattern
+    assert not matcher.search(bytearray(b'xx a b yy'))
+    result = matcher.search(bytearray(b'xx a b yy ab'))
+    assert result
+    assert (result.pattern_index, result.start, result.end) == (1, 10, 12)
+    # a trailing comment does not hide the patterns after it
+    matcher = MultiMatcher([re.compile(rb'heap \d+  # free heap', re.X), b'zzz'])
+    result = matcher.search(bytearray(b'xx zzz heap100'))
+    assert result
+    assert (result.pattern_index, result.start) == (1, 3)
+
+
+def test_multi_matcher_mixed_flags() -> None:
+    patterns = [
+        re.compile(rb'ERROR: (\w+)', re.I),
+        re.compile(rb'^done$', re.M),
+        re.compile(rb'begin.end', re.S),
+        re.compile(rb'x y', re.X | re.I),
+        # not scoped, searched one by one
+        re.compile(rb'debug', re.DEBUG),
+    ]
+    matcher = MultiMatcher(patterns[:4])
+    results = []
+    buffer = bytearray(b'error: oops\nnot done\ndone\nbegin\nend XY debug')
+    result = matcher.search(buffer)
+    while result:
+        results.append((result.pattern_index, bytes(buffer[result.start : result.end])))
+        buffer = buffer[result.end :]
+        matcher.reset()
+        result = matcher.search(buffer)
+    assert results == [(0, b'error: oops'), (1, b'done'), (2, b'begin\nend'), (3, b'XY')]
+    matcher = MultiMatcher(patterns)
+    result = matcher.search(bytearray(b'debug XY'))
+    assert result
+    assert (result.pattern_index, result.start) == (4, 0)
+
+
+def test_multi_matcher_group_conflicts() -> None:
+    # same group names could not be joined into one regex
+    patterns = [re.compile(rb'a=(?P<v>\d+)'), re.compile(rb'b=(?P<v>\d+)')]
+    matcher = MultiMatcher(patterns)
+    result = matcher.search(bytearray(b'xx b=2 a=1'))
+    assert result
+    assert result.pattern_index == 1
+    assert result.match.group('v') == b'2'  # type: ignore
+
+
+def test_base_port_expect_any() -> None:
+    port = QueuePort()
+    with BasePort(port, 'MyPort') as base_port:
+        port.rx_queue.put(b'wifi:state: auth -> assoc\r\n')
+        port.rx_queue.put(b'sta ip: 192.168.1.2, mask: 255.255.255.0, gw: 192.168.1.1\r\n')
+        patterns = ['WIFI_EVENT_STA_DISCONNECTED', re.compile(r'sta ip: ([\.\d]+)'), b'assoc']
+        index, match = base_port.expect_any(patterns, timeout=1)
+        assert index == 2
+        assert match == b'assoc'
+        index, match = base_port.expect_any(patterns, timeout=1)
+        assert index == 1
+        assert isinstance(match, re.Match)
+        assert match.group(1) == '192.168.1.2'
+
+
+def test_port_spawn_expect_stream() -> None:
+    port = QueuePort()
+    spawn = PortSpawn(port, timeout=1)
+    try:
+        for chunk in [b'boot: ', b'app_main st', b'arted\r\n', b'> ']:
+            port.rx_queue.put(chunk)
+        result = spawn.expect_stream(RegexMatcher(re.compile(rb'app_main (\w+)')), timeout=1)
+        assert result.match.group(1) == b'started'  # type: ignore
+        assert spawn.before == b'boot: '
+        assert spawn.after == b'app_main started'
+        spawn.expect_stream(ExactMatcher(b'> '), timeout=1)
+        assert spawn.before == b'\r\n'
+        # left data could be used by pexpect expect methods
+        port.rx_queue.put(b'left data')
+        with pytest.raises(pexpect.TIMEOUT):
+            spawn.expect_stream(ExactMatcher(b'not exist'), timeout=0.1)
+        spawn.expect_exact(pexpect.TIMEOUT, timeout=0)
+        assert spawn.buffer == b'left data'
+    finally:
+        spawn.stop()
+
+
+def test_port_spawn_expect_timeout() -> None:
+    port = QueuePort()
+    spawn = PortSpawn(port, timeout=1)
+    try:
+        t0 = time.perf_counter()
+        with pytest.raises(pexpect.TIMEOUT):
+            spawn.expect_stream(ExactMatcher(b'aaa'), timeout=0.2)
+        assert 0.2 <= time.perf_counter() - t0 < 0.5
+    finally:
+        spawn.stop()
+
+
+def test_base_port_read_all_bytes() -> None:
+    port = QueuePort()
+    with BasePort(port, 'MyPort') as base_port:
+        port.rx_queue.put(b'abc\r\nleft ')
+        base_port.expect('abc', timeout=1)
+        port.rx_queue.put(b'new data')
+        time.sleep(0.05)
+        # unmatched data left by expect comes first
+        assert base_port.read_all_bytes() == b'\r\nleft new data'
+        assert base_port.data_cache == '\r\nleft new data'
+        assert base_port.flush_data() == '\r\nleft new data'
+        assert base_port.read_all_bytes(flush=True) == b''
+        port.rx_queue.put(b'abc')
+        base_port.expect('abc', timeout=1)
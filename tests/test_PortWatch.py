@@ -0,0 +1,77 @@
+import re
+import threading
+import time
+from typing import Any, List
+
+import pytest
+
+from esptest.adapter.base_port import BasePort, ExpectTimeout, WatcherTriggered
+from esptest.adapter.port_watch import Watcher, WatcherSet
+
+from .test_PortSpawn import QueuePort
+
+
+def test_watcher_set_across_chunks() -> None:
+    panic = Watcher('Guru Meditation')
+    reset = Watcher(re.compile(rb'rst:(0x[0-9a-f]+)'))
+    watchers = WatcherSet([panic, reset])
+    assert not watchers.feed(b'boot... Guru Med')
+    results = watchers.feed(b'itation Error\r\nrst:0x')
+    assert [(w, m) for w, m in results] == [(panic, 'Guru Meditation')]
+    results = watchers.feed(b'c (SW_CPU_RESET)\r\nGuru Meditation\r\nrst:0x1 (POWERON)\r\n')
+    # in stream order
+    assert [w for w, _ in results] == [reset, panic, reset]
+    assert results[0][1].group(1) == b'0xc'
+    assert results[2][1].group(1) == b'0x1'
+    assert (panic.hits, reset.hits) == (2, 2)
+
+
+def test_port_watcher_fails_expect() -> None:
+    raw_port = QueuePort()
+    matches: List[Any] = []
+    with BasePort(raw_port, 'MyPort') as port:
+        watcher = port.add_watcher('abort()', lambda name, w, m: matches.append((name, m)), fail_expect=True)
+        info = port.add_watcher(re.compile('heap: (\\d+)'), lambda name, w, m: matches.append((name, m.group(1))))
+        raw_port.rx_queue.put(b'heap: 1024\r\n')
+        port.expect('1024', timeout=1)
+        threading.Timer(0.1, raw_port.rx_queue.put, (b'abort() was called\r\n',)).start()
+        t0 = time.perf_counter()
+        with pytest.raises(WatcherTriggered) as e:
+            port.expect('never matched', timeout=30)
+        assert time.perf_counter() - t0 < 5
+        assert e.value.watcher is watcher
+        assert matches == [('MyPort', '1024'), ('MyPort', 'abort()')]
+        # failure is consumed, the data is kept for the next expect
+        port.expect('was called', timeout=1)
+        port.remove_watcher(watcher)
+        raw_port.rx_queue.put(b'abort()\r\n')
+        with pytest.raises(ExpectTimeout) as e2:
+            port.expect('never matched', timeout=0.5)
+        assert not isinstance(e2.value, WatcherTriggered)
+        assert watcher.hits == 1
+        assert info.hits == 1
+
+
+def test_port_watcher_pattern_also_expected() -> None:
+    raw_port = QueuePort()
+    with BasePort(raw_port, 'MyPort') as port:
+        port.add_watcher('Rebooting...', fail_expect=True)
+        raw_port.rx_queue.put(b'Rebooting...\r\n')
+        # the expected pattern wins if it's matched by the same data
+        port.expect('Rebooting', timeout=1)
+
+
+def test_port_watcher_error_keeps_reading(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _broken_feed(self: WatcherSet, data: bytes) -> List[Any]:
+        raise ValueError('broken watcher')
+
+    raw_port = QueuePort()
+    with BasePort(raw_port, 'MyPort') as port:
+        port.add_watcher(re.compile(rb'heap \d+', re.X))
+        monkeypatch.setattr(WatcherSet, 'feed', _broken_feed)
+        raw_port.rx_queue.put(b'heap 100\r\n')
+        # the data still reaches expect, the read thread keeps running
+        port.expect('heap 100', timeout=1)
+        raw_port.rx_queue.put(b'next line\r\n')
+        port.expect('next line', timeout=1)
+        assert any(t.name == 'Spawn_MyPort' for t in threading.enumerate())
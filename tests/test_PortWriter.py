@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import List
+
+from esptest.adapter.base_port import BasePort
+from esptest.adapter.port_writer import PortWriter, WritePacing
+
+from .test_PortSpawn import QueuePort
+
+
+def test_port_writer_chunks() -> None:
+    chunks: List[bytes] = []
+    writer = PortWriter(chunks.append, WritePacing(chunk_size=4, interval=0.01), 'MyPort')
+    try:
+        t0 = time.perf_counter()
+        future1 = writer.write(b'0123456789')
+        future2 = writer.write(b'ab')
+        # never blocks the caller
+        assert time.perf_counter() - t0 < 0.01
+        assert future2.result(timeout=1) == 2
+        assert future1.result() == 10
+        assert chunks == [b'0123', b'4567', b'89', b'ab']
+        # 2 intervals between the chunks of the first write
+        assert time.perf_counter() - t0 >= 0.02
+    finally:
+        writer.close()
+    assert writer.write(b'closed').exception()
+
+
+def test_port_writer_error() -> None:
+    def _write(data: bytes) -> None:
+        if data == b'bad':
+            raise OSError('port closed')
+
+    writer = PortWriter(_write, name='MyPort')
+    try:
+        assert isinstance(writer.write(b'bad').exception(timeout=1), OSError)
+        assert writer.write(b'good').result(timeout=1) == 4
+    finally:
+        writer.close()
+
+
+class EchoPort(QueuePort):
+    """Echo written data after a delay, like ESP console"""
+
+    def write_bytes(self, data: bytes) -> None:
+        super().write_bytes(data)
+        threading.Timer(0.05, self.rx_queue.put, (data.replace(b'\n', b'\r\n'),)).start()
+
+
+def test_base_port_echo_flow_control() -> None:
+    raw_port = EchoPort()
+
+    class _Port(BasePort):
+        WRITE_PACING = WritePacing(chunk_size=8, interval=0, echo_timeout=1)
+
+    with _Port(raw_port, 'MyPort') as port:
+        t0 = time.perf_counter()
+        future = port.write_line_async('{"ssid": "test", "password": "12345678"}')
+        assert not future.done()
+        assert future.result(timeout=5) == 41
+        # next chunk is written after the echo of the previous one
+        assert time.perf_counter() - t0 >= 0.05 * 5
+        assert raw_port.written == b'{"ssid": "test", "password": "12345678"}\n'
+        port.expect('"12345678"}\r\n', timeout=1)
+        assert port.spawn and not port.spawn.metrics.snapshot()['write_pending']
+        # synchronous write goes through the same writer
+        port.write_line('ok')
+        assert raw_port.written.endswith(b'ok\n')
+
+
+def test_base_port_write_async_order() -> None:
+    raw_port = QueuePort()
+    with BasePort(raw_port, 'MyPort') as port:
+        futures = [port.write_async(f'{i},') for i in range(50)]
+        port.write('end')
+        assert all(f.done() for f in futures)
+        assert raw_port.written == b''.join(f'{i},'.encode() for i in range(50)) + b'end'
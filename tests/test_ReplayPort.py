@@ -0,0 +1,72 @@
+import os
+import re
+import tempfile
+import time
+
+from esptest.adapter.base_port import RawPort
+from esptest.adapter.port_capture import DIRECTION_WRITE, CaptureWriter
+from esptest.adapter.replay_port import ReplayPort, ReplayReply
+
+from .test_PortHistory import HistoryPort
+
+
+def test_replay_port_timing() -> None:
+    segments = [(0.0, b'boot\r\n'), (0.2, b'app_main\r\n'), (0.4, b'ready\r\n')]
+    port = ReplayPort(segments, speed=2)
+    assert isinstance(port, RawPort)
+    t0 = time.perf_counter()
+    port.start()
+    assert port.read_bytes(timeout=0.01) == b'boot\r\n'
+    assert port.read_bytes(timeout=0.01) == b''
+    assert port.read_bytes(timeout=1) == b'app_main\r\n'
+    assert port.read_bytes(timeout=1) == b'ready\r\n'
+    # 0.4s of the original session at 2x speed
+    assert 0.18 < time.perf_counter() - t0 < 0.35
+    assert port.finished
+    # as fast as possible
+    port = ReplayPort(segments, speed=ReplayPort.FASTEST)
+    assert port.read_bytes(timeout=0.01) == b'boot\r\napp_main\r\nready\r\n'
+
+
+def test_replay_port_replies() -> None:
+    replies = [
+        ReplayReply(b'restart', [(0, b'rst:0xc\r\n'), (0.05, b'boot done\r\n')], once=True),
+        ReplayReply(re.compile(rb'sta_connect (\w+)'), [(0.01, b'wifi:connected\r\n')]),
+    ]
+    port = ReplayPort([(0, b'> ')], speed=1, replies=replies)
+    with HistoryPort(port, 'replay') as dut:
+        dut.expect_exact('> ', timeout=1)
+        dut.write_line('restart')
+        dut.expect_exact('boot done', timeout=1)
+        dut.write_line('sta_connect myap')
+        dut.expect_exact('wifi:connected', timeout=1)
+        dut.write_line('restart')
+        assert dut.search_history('rst:0xc') == 'rst:0xc'
+        time.sleep(0.1)
+        # the restart reply is only triggered once
+        assert dut.data_cache == '\r\n'
+    assert port.written == b'restart\nsta_connect myap\nrestart\n'
+
+
+def test_replay_port_from_files() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'dut.log')
+        with open(log_file, 'wb') as f:
+            f.write(b'--------- Saving dut logs to this file --------\n')
+            f.write(b'\n[2024-01-01 10:00:00.000000]\nboot\r\n')
+            f.write(b'\n[2024-01-01 10:00:01.500000]\nready\r\n')
+        assert ReplayPort.parse_log(open(log_file, 'rb').read()) == [(0, b'boot\r\n'), (1.5, b'ready\r\n')]
+        port = ReplayPort.from_log(log_file, speed=ReplayPort.FASTEST)
+        assert port.read_bytes() == b'boot\r\nready\r\n'
+
+        capture_file = os.path.join(temp_dir, 'dut.espcap')
+        writer = CaptureWriter(capture_file)
+        writer.write(b'boot\r\n')
+        writer.write(b'cmd\n', DIRECTION_WRITE)
+        time.sleep(0.05)
+        writer.write(b'ready\r\n')
+        writer.close()
+        port = ReplayPort.from_capture(capture_file, speed=1)
+        assert port.read_bytes(timeout=0.01) == b'boot\r\n'
+        assert port.read_bytes(timeout=0.01) == b''
+        assert port.read_bytes(timeout=1) == b'ready\r\n'
@@ -0,0 +1,112 @@
+import threading
+import time
+
+from esptest.adapter.port_buffer import RingBuffer
+
+
+def test_ring_buffer_read_write() -> None:
+    buf = RingBuffer(max_size=16, init_size=4)
+    assert len(buf) == 0
+    assert buf.read() == b''
+    buf.write(b'abc')
+    buf.write(b'defgh')
+    # grows on demand
+    assert buf.capacity == 8
+    assert buf.peek() == b'abcdefgh'
+    assert buf.read(3) == b'abc'
+    # wrap around the end of the buffer
+    buf.write(b'ijk')
+    assert buf.capacity == 8
+    assert len(buf) == 8
+    assert buf.peek(6) == b'defghi'
+    assert buf.read() == b'defghijk'
+    assert len(buf) == 0
+
+
+def test_ring_buffer_drop_oldest() -> None:
+    buf = RingBuffer(max_size=8, init_size=4)
+    assert buf.write(b'0123456') == 0
+    assert buf.write(b'789') == 2
+    assert buf.dropped_bytes == 2
+    assert buf.read() == b'23456789'
+    # single write larger than the max size
+    buf.write(b'ab')
+    assert buf.write(b'0123456789') == 4
+    assert buf.dropped_bytes == 6
+    assert buf.read() == b'23456789'
+
+
+def test_ring_buffer_wait() -> None:
+    buf = RingBuffer()
+    t0 = time.perf_counter()
+    assert not buf.wait(0.05)
+    assert time.perf_counter() - t0 >= 0.05
+    timer = threading.Timer(0.05, buf.write, args=(b'data',))
+    timer.start()
+    assert buf.wait(1)
+    assert buf.read() == b'data'
+    buf.write(b'data')
+    buf.clear()
+    assert not buf.wait(0)
+    # woken up without data
+    threading.Timer(0.05, buf.wakeup).start()
+    t0 = time.perf_counter()
+    assert not buf.wait(5)
+    assert time.perf_counter() - t0 < 1
+
+
+def test_ring_buffer_block() -> None:
+    buf = RingBuffer(max_size=8, init_size=4, overflow_policy=RingBuffer.BLOCK)
+    buf.write(b'01234567')
+    writer = threading.Thread(target=buf.write, args=(b'89abc',))
+    writer.start()
+    time.sleep(0.05)
+    # writer is blocked until the data is consumed
+    assert writer.is_alive()
+    assert buf.read(4) == b'0123'
+    assert buf.read(4) == b'4567'
+    writer.join(1)
+    assert not writer.is_alive()
+    assert buf.read() == b'89abc'
+    assert buf.dropped_bytes == 0
+    # closing the buffer wakes up the blocked writer
+    buf.write(b'01234567')
+    writer = threading.Thread(target=buf.write, args=(b'89',))
+    writer.start()
+    time.sleep(0.05)
+    buf.close()
+    writer.join(1)
+    assert not writer.is_alive()
+    assert buf.dropped_bytes == 2
+
+
+def test_ring_buffer_spill() -> None:
+    buf = RingBuffer(max_size=8, init_size=4, overflow_policy=RingBuffer.SPILL)
+    buf.write(b'0123456')
+    assert buf.write(b'789abcdefghij') == 0
+    assert buf.spilled_bytes == 12
+    assert buf.dropped_bytes == 0
+    assert len(buf) == 20
+    assert buf.peek() == b'0123456789abcdefghij'
+    # spilled data is read first
+    assert buf.read(5) == b'01234'
+    assert buf.read() == b'56789ab'
+    assert buf.read() == b'cdefghij'
+    assert len(buf) == 0
+    buf.write(b'0123456789')
+    assert buf.read() == b'01'
+    buf.close()
+
+
+def test_ring_buffer_drain() -> None:
+    buf = RingBuffer(max_size=8, init_size=4, overflow_policy=RingBuffer.SPILL)
+    assert buf.drain() == b''
+    buf.write(b'0123')
+    assert buf.read(2) == b'01'
+    # wrap around and spill, all data is returned by one drain
+    buf.write(b'456789abcd')
+    assert buf.drain() == b'23456789abcd'
+    assert len(buf) == 0
+    buf.write(b'xyz')
+    assert buf.drain() == b'xyz'
+    buf.close()
@@ -0,0 +1,144 @@
+import os
+import pty
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+import serial
+import serial.tools.list_ports
+from serial.tools.list_ports_common import ListPortInfo
+
+from esptest.devices import SerialPortInventory
+from esptest.devices.serial_dut import SerialDut
+
+
+def _open_pty() -> Tuple[int, int, str]:
+    master, slave = pty.openpty()
+    return master, slave, os.ttyname(slave)
+
+
+def _port_info(device: str, location: str) -> ListPortInfo:
+    info = ListPortInfo(device, skip_link_detection=True)
+    info.location = location
+    info.serial_number = 'ABC123'
+    return info
+
+
+@pytest.fixture
+def usb_ports(monkeypatch: pytest.MonkeyPatch) -> List[ListPortInfo]:
+    """Fake USB ports returned by list_ports.comports(), listed by the port inventory of the DUTs"""
+    ports: List[ListPortInfo] = []
+    monkeypatch.setattr(serial.tools.list_ports, 'comports', lambda *args, **kwargs: ports)
+    inventory = SerialPortInventory(ttl=60, use_udev=False, incremental=False)
+    monkeypatch.setattr(SerialDut, 'PORT_INVENTORY', inventory)
+    return ports
+
+
+def _scan_ports() -> None:
+    """Scan the inventory like other users of the shared inventory, before the device is re-enumerated"""
+    assert SerialDut.PORT_INVENTORY
+    SerialDut.PORT_INVENTORY.refresh(force=True)
+
+
+def test_serial_dut_reconnect(usb_ports: List[ListPortInfo], monkeypatch: pytest.MonkeyPatch) -> None:
+    master1, slave1, device1 = _open_pty()
+    master2, slave2, device2 = _open_pty()
+    usb_ports.append(_port_info(device1, '1-1.2'))
+    _scan_ports()
+    assert SerialDut.PORT_INVENTORY
+    # stale, would be rescanned by any lookup
+    SerialDut.PORT_INVENTORY.invalidate()
+    scans: List[int] = []
+    monkeypatch.setattr(serial.tools.list_ports, 'comports', lambda *args, **kwargs: scans.append(1) or usb_ports)
+    dut = SerialDut(serial.Serial(device1, 115200, timeout=0.005), 'MyDut')
+    try:
+        # looked up when reconnecting, starting the DUT does not scan the ports
+        assert dut.usb_location is None
+        assert not scans
+        os.write(master1, b'before reset\r\n')
+        time.sleep(0.05)
+        # re-enumerated with another device path
+        usb_ports[0] = _port_info(device2, '1-1.2')
+        spawn = dut.spawn
+        latency = dut.reconnect(timeout=1)
+        assert dut.spawn is spawn
+        assert dut.serial and dut.serial.port == device2
+        assert latency < 1
+        assert dut.usb_location == '1-1.2'
+        os.write(master2, b'after reset\r\n')
+        # data received before reconnecting is kept
+        dut.expect('before reset', timeout=1)
+        dut.expect('after reset', timeout=1)
+        dut.write('ping')
+        assert os.read(master2, 4) == b'ping'
+        assert dut.metrics_snapshot()['reconnect_latency']['count'] == 1
+    finally:
+        dut.close()
+        for fd in (master1, slave1, master2, slave2):
+            os.close(fd)
+
+
+def test_serial_dut_reconnect_by_link(tmp_path: Path, usb_ports: List[ListPortInfo]) -> None:
+    master1, slave1, device1 = _open_pty()
+    master2, slave2, device2 = _open_pty()
+    usb_ports.append(_port_info(device1, '1-1.5'))
+    link = tmp_path / 'usb-Espressif_ABC123-if00'
+    link.symlink_to(device1)
+    _scan_ports()
+    dut = SerialDut(serial.Serial(str(link), 115200, timeout=0.005), 'MyDut')
+    try:
+        usb_ports[0] = _port_info(device2, '1-1.5')
+        dut.reconnect(timeout=1)
+        assert dut.usb_location == '1-1.5'
+        assert dut.serial and dut.serial.port == device2
+    finally:
+        dut.close()
+        for fd in (master1, slave1, master2, slave2):
+            os.close(fd)
+
+
+def test_serial_dut_reconnect_timeout(usb_ports: List[ListPortInfo]) -> None:
+    master, slave, device = _open_pty()
+    usb_ports.append(_port_info(device, '1-1.3'))
+    _scan_ports()
+    dut = SerialDut(serial.Serial(device, 115200, timeout=0.005), 'MyDut')
+    try:
+        usb_ports[0] = _port_info('/dev/not-exist-port', '1-1.3')
+        t0 = time.perf_counter()
+        with pytest.raises(serial.SerialException):
+            dut.reconnect(timeout=0.3)
+        assert 0.2 < time.perf_counter() - t0 < 1
+    finally:
+        dut.close()
+        os.close(master)
+        os.close(slave)
+
+
+def test_serial_dut_auto_reconnect(usb_ports: List[ListPortInfo]) -> None:
+    master1, slave1, device1 = _open_pty()
+    master2, slave2, device2 = _open_pty()
+    usb_ports.append(_port_info(device1, '1-1.4'))
+
+    class _Dut(SerialDut):
+        AUTO_RECONNECT = True
+
+    dut = _Dut(serial.Serial(device1, 115200, timeout=0.005), 'MyDut')
+    try:
+        # looked up on start, the device path is gone after a read error
+        assert dut.usb_location == '1-1.4'
+        usb_ports[0] = _port_info(device2, '1-1.4')
+        # hang up the old port, reading fails
+        os.close(master1)
+        os.close(slave1)
+        for _ in range(500):
+            if dut.serial and dut.serial.port == device2:
+                break
+            time.sleep(0.01)
+        os.write(master2, b'reconnected\r\n')
+        dut.expect('reconnected', timeout=5)
+        assert dut.reconnect_latency.count == 1
+    finally:
+        dut.close()
+        os.close(master2)
+        os.close(slave2)